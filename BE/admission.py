@@ -0,0 +1,128 @@
+# admission.py
+"""
+Admission control for /chat and /chat/batch.
+
+- llm_gate: at most LLM_MAX_INFLIGHT LLM calls in flight per worker process. Waiting
+  calls are served by priority (alert patient > chat > batch), then arrival order.
+  llm_config.retrying() takes a slot around every attempt, so backoff sleeps do
+  not hold one.
+- shed(): a new chat turn gets 429 + Retry-After once ADMISSION_MAX_QUEUE LLM calls
+  are already waiting. Alert-positive patients are never shed.
+- turn(): turns of the same thread_id run one at a time, in arrival order (a
+  double-submit waits for the first turn instead of racing on the checkpoint).
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import Any, Dict, List, Optional
+
+import metrics
+import settings
+
+PRIORITY_ALERT, PRIORITY_CHAT, PRIORITY_BATCH = 0, 1, 2
+
+# priority ของ turn ที่กำลังรัน (task ที่ graph สร้างต่อจะได้ค่านี้ไปด้วย)
+priority = contextvars.ContextVar("llm_priority", default=PRIORITY_CHAT)
+
+def is_alert(ctx: Dict[str, Any]) -> bool:
+    return str((ctx or {}).get("is_alert", "Negative")).strip().lower() == "positive"
+
+def priority_of(ctx: Dict[str, Any], default: int = PRIORITY_CHAT) -> int:
+    return PRIORITY_ALERT if is_alert(ctx) else default
+
+# --- LLM Gate ---
+class PriorityGate:
+    """semaphore ที่ปล่อยคิวตาม (priority, ลำดับที่มา), limit <= 0 = ไม่จำกัด"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: List[list] = []  # heap ของ [priority, seq, future]
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, prio: int) -> None:
+        if self.limit <= 0 or (self.in_flight < self.limit and not self.waiting):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [prio, next(self._seq), future])
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # ได้ slot แล้วแต่ถูก cancel ก่อนใช้ -> ส่งต่อให้คิวถัดไป
+            raise
+        metrics.observe("llm_gate_wait_seconds", time.perf_counter() - start, priority=prio)
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # ส่ง slot ต่อ (in_flight เท่าเดิม)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, prio: Optional[int] = None):
+        await self.acquire(priority.get() if prio is None else prio)
+        try:
+            yield
+        finally:
+            self.release()
+
+llm_gate = PriorityGate(settings.LLM_MAX_INFLIGHT)
+
+# --- Load Shedding ---
+def retry_after() -> int:
+    """เวลาโดยประมาณจนคิว LLM ว่างพอ (คิว / slot * latency เฉลี่ยต่อ call)"""
+    calls = metrics.total("llm_calls")
+    mean = metrics.total("llm_seconds") / calls if calls else 1.0
+    seconds = llm_gate.waiting / max(llm_gate.limit, 1) * mean
+    return int(min(max(seconds, 1), settings.ADMISSION_MAX_RETRY_AFTER))
+
+def shed(ctx: Dict[str, Any]) -> Optional[int]:
+    """Retry-After (วินาที) ถ้าต้องปฏิเสธ turn นี้, None = รับ"""
+    if is_alert(ctx) or settings.ADMISSION_MAX_QUEUE <= 0:
+        return None
+    if llm_gate.waiting < settings.ADMISSION_MAX_QUEUE:
+        return None
+    metrics.inc("admission_rejected", reason="llm_queue")
+    return retry_after()
+
+# --- Per-thread Serialization ---
+_thread_locks: Dict[str, list] = {}  # thread_id -> [lock, จำนวน turn ที่ถือ/รออยู่]
+
+@asynccontextmanager
+async def turn(thread_id: str, ctx: Dict[str, Any], default: int = PRIORITY_CHAT):
+    entry = _thread_locks.setdefault(thread_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    token = priority.set(priority_of(ctx, default))
+    try:
+        if entry[0].locked():
+            metrics.inc("admission_thread_waits")
+        async with entry[0]:
+            yield
+    finally:
+        with suppress(ValueError):
+            # generator ของ StreamingResponse อาจถูกปิดจาก context อื่น
+            priority.reset(token)
+        entry[1] -= 1
+        if entry[1] == 0:
+            _thread_locks.pop(thread_id, None)
+
+def stats() -> Dict[str, Any]:
+    return {
+        "llm_in_flight": llm_gate.in_flight,
+        "llm_waiting": llm_gate.waiting,
+        "llm_limit": llm_gate.limit,
+        "active_threads": len(_thread_locks),
+        "rejected": metrics.total("admission_rejected"),
+    }
@@ -1,16 +1,25 @@
 # agent.py
-from typing import TypedDict, Annotated, List, Dict, Any
+from functools import lru_cache
+from typing import TypedDict, Annotated, List, Dict, Any, Optional, Tuple
 import operator
 from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode, tools_condition
 
-from llm_config import llm
+from llm_config import get_llm, retrying
+from history import window_for
+from diseases import DISEASES, canonical_disease
+from knowledge import current as current_knowledge
+import metrics
+import settings
 from tools import med_tools, exercise_tools, diet_tools, transport_tools, appointment_tools
 
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
     user_context: Dict[str, Any]
+    summary: str            # rolling summary ของ turn เก่า (ดู history.py)
+    summarized_upto: int    # messages[:summarized_upto] ถูกสรุปไว้ใน summary แล้ว
 
 def create_system_prompt(template: str, context: Dict[str, Any]) -> str:
     """Helper เพื่อจัดการ Default Value และ Format String"""
@@ -24,14 +33,18 @@ def create_system_prompt(template: str, context: Dict[str, Any]) -> str:
         is_infectious=context.get("is_infectious", "Negative")
     )
 
-def build_agent(llm, tools, system_template):
-    llm_with_tools = llm.bind_tools(tools)
+def build_agent(llm, tools, instructions):
+    llm_with_tools = retrying(llm.bind_tools(tools))
+    # ส่วนคงที่ (tools + บทบาท/กฎ) เหมือนกันทุกคนไข้ จึงสร้างครั้งเดียวและอยู่ต้น prompt ให้ provider cache prefix ได้
+    static_prompt = SystemMessage(content=instructions)
     
-    def chatbot(state: AgentState):
-        ctx = state.get("user_context", {})
-        prompt = create_system_prompt(system_template, ctx)
-        messages = [SystemMessage(content=prompt)] + state["messages"]
-        response = llm_with_tools.invoke(messages)
+    async def chatbot(state: AgentState, config: RunnableConfig):
+        # session (sessions.py) render prompt ของคนไข้ไว้แล้ว ไม่ต้อง format ใหม่ทุกครั้งที่เรียก agent
+        patient_prompt = config.get("configurable", {}).get("patient_prompt")
+        if patient_prompt is None:
+            patient_prompt = SystemMessage(content=create_system_prompt(patient_template, state.get("user_context", {})))
+        messages = [static_prompt, patient_prompt] + window_for(state, "agent")
+        response = await llm_with_tools.ainvoke(messages, config)
         return {"messages": [response]}
 
     workflow = StateGraph(AgentState)
@@ -45,34 +58,33 @@ def build_agent(llm, tools, system_template):
         workflow.add_edge("agent", END)
 
     workflow.add_edge(START, "agent")
-    return workflow.compile()
+    return workflow.compile(checkpointer=False)
 
 # --- Base Template ---
+# ส่วนคงที่ ห้ามใส่ข้อมูลคนไข้ (ข้อมูลคนไข้อยู่ใน patient_template ซึ่งต่อท้ายเป็น system message แยก)
 base_template = """
-คุณคือผู้เชี่ยวชาญดูแลคนไข้ชื่อ: {user_name} (โรค: {disease} อาการกำเริบ: {is_alert})
+คุณคือผู้เชี่ยวชาญดูแลคนไข้ ข้อมูลของคนไข้ที่คุณดูแลอยู่ในหัวข้อ "ข้อมูลคนไข้" ถัดไป
+
+กฎ:
+1. Empathy: นุ่มนวล ห่วงใย
+2. Follow-up: จบด้วยคำถามกลับเสมอ
+"""
+
+# --- Patient Template ---
+patient_template = """
+ข้อมูลคนไข้:
+ชื่อ: {user_name} (โรค: {disease} อาการกำเริบ: {is_alert})
 มีนัดหมายกับแพทย์ในวันที่: {current_schedule}
 
 ความเสี่ยงของโรคแทรกซ้อน:
 1. โรคเกี่ยวกับหัวใจ: {is_cardio}
 2. โรคเกี่ยวกับระบบหายใจ: {is_gi_liver}
 3. การติดเชื้อ: {is_infectious}
-
-กฎ:
-1. Empathy: นุ่มนวล ห่วงใย
-2. Follow-up: จบด้วยคำถามกลับเสมอ
 """
 
-# --- Build Agents ---
-med_agent = build_agent(llm, med_tools, base_template + "\nหน้าที่: ยา/อาการป่วย")
-exercise_agent = build_agent(llm, exercise_tools, base_template + "\nหน้าที่: กายภาพ/พักผ่อน")
-diet_agent = build_agent(llm, diet_tools, base_template + "\nหน้าที่: อาหารการกิน")
-transport_agent = build_agent(llm, transport_tools, base_template + "\nหน้าที่: การเดินทาง")
-general_agent = build_agent(llm, [], base_template + "\nหน้าที่: พูดคุยทั่วไป")
-
-appointment_agent = build_agent(
-    llm, 
-    appointment_tools, 
-    base_template + """
+# --- Agent Specs ---
+# agent type -> (tools ทุกโรค, คำสั่งคงที่), compile จริงตอนถูกเรียกครั้งแรกผ่าน get_agent()
+appointment_instructions = base_template + """
     \nหน้าที่: จัดการเลื่อนนัดหมาย (Reschedule)
     
     \n***STRICT RULES***
@@ -82,13 +94,59 @@ appointment_agent = build_agent(
        - **ต้อง** ตอบกลับไปถามผู้ใช้ว่า "สะดวกเป็นวันไหนครับ?" หรือ "ต้องการเลื่อนไปเป็นวันที่เท่าไหร่ครับ?" เท่านั้น
     3. เมื่อได้วันที่ครบถ้วนแล้ว จึงค่อยเรียก Tool
     """
-)
-
-agent_runnables = {
-    "MedicationAgent": med_agent,
-    "ExerciseAgent": exercise_agent,
-    "DietAgent": diet_agent,
-    "TransportAgent": transport_agent,
-    "AppointmentAgent": appointment_agent,
-    "GeneralChatAgent": general_agent,
-}
\ No newline at end of file
+
+agent_specs = {
+    "MedicationAgent": (med_tools, base_template + "\nหน้าที่: ยา/อาการป่วย"),
+    "ExerciseAgent": (exercise_tools, base_template + "\nหน้าที่: กายภาพ/พักผ่อน"),
+    "DietAgent": (diet_tools, base_template + "\nหน้าที่: อาหารการกิน"),
+    "TransportAgent": (transport_tools, base_template + "\nหน้าที่: การเดินทาง"),
+    "AppointmentAgent": (appointment_tools, appointment_instructions),
+    "GeneralChatAgent": ([], base_template + "\nหน้าที่: พูดคุยทั่วไป"),
+}
+
+# --- Agent Registry ---
+def tool_disease(t) -> Optional[str]:
+    """โรคที่ tool ผูกอยู่ (ตามชื่อ get_<disease>_...), tool กลางเช่นเลื่อนนัดคืน None"""
+    for key in DISEASES:
+        if t.name.startswith(f"get_{key}_"):
+            return key
+    return None
+
+def scoped_tools(tools: List, disease_key: Optional[str]) -> List:
+    """เฉพาะ tools ของโรคคนไข้ + tool กลาง, โรคที่ไม่รู้จักได้ชุดเต็ม"""
+    if disease_key is None:
+        return list(tools)
+    return [t for t in tools if tool_disease(t) in (None, disease_key)]
+
+def knowledge_block(tools: List) -> str:
+    """ผลของ disease tools (ข้อมูลคงที่) สำหรับใส่ใน prompt แทนการให้ LLM เรียก tool เอง"""
+    sections = [t.invoke({"query": ""}).strip() for t in tools]
+    return "\n\nข้อมูลอ้างอิง (ตอบจากข้อมูลนี้ได้เลย ไม่ต้องเรียก tool):\n" + "\n\n".join(sections)
+
+def variant_key(agent_type: str, disease: Optional[str], prefetch: Optional[bool] = None) -> Tuple[str, Optional[str], bool, int]:
+    tools, _ = agent_specs[agent_type]
+    prefetch = settings.KNOWLEDGE_PREFETCH if prefetch is None else prefetch
+    # agent ที่ไม่มี tool เฉพาะโรค (เช่น Appointment, GeneralChat) ใช้ variant เดียวร่วมกันทุกโรค
+    if not any(tool_disease(t) for t in tools):
+        return agent_type, None, False, 0
+    disease_key = canonical_disease(disease)
+    # โรคที่ไม่รู้จักใช้ tool-calling กับชุด tools เต็มเสมอ
+    prefetch = prefetch and disease_key is not None
+    # variant แบบ prefetch ฝังข้อมูลไว้ใน prompt จึงต้อง compile ใหม่เมื่อ knowledge ถูกแก้ไข
+    return agent_type, disease_key, prefetch, current_knowledge().version if prefetch else 0
+
+@lru_cache(maxsize=settings.AGENT_CACHE_SIZE)
+def _compiled_variant(agent_type: str, disease_key: Optional[str], prefetch: bool, knowledge_version: int):
+    tools, instructions = agent_specs[agent_type]
+    tools = scoped_tools(tools, disease_key)
+    if prefetch:
+        # Prefetch: รู้โรคแล้ว ใส่ข้อมูลไว้ในส่วนคงที่ของ prompt เลย -> ตอบได้ใน LLM call เดียว (tool กลางยังอยู่)
+        instructions += knowledge_block([t for t in tools if tool_disease(t)])
+        tools = [t for t in tools if not tool_disease(t)]
+    metrics.inc("agent_variants_compiled", agent=agent_type, disease=disease_key or "generic",
+                mode="prefetch" if prefetch else "tools")
+    return build_agent(get_llm(agent_type), tools, instructions)
+
+def get_agent(agent_type: str, disease: Optional[str] = None, prefetch: Optional[bool] = None):
+    """compiled agent สำหรับ (agent type, โรค) จาก LRU cache, prefetch=None ใช้ค่าจาก settings"""
+    return _compiled_variant(*variant_key(agent_type, disease, prefetch))
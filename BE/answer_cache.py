@@ -0,0 +1,196 @@
+# answer_cache.py
+"""
+Answer cache for repeated, self-contained patient questions.
+
+The key is the normalized question plus the context fields that change the answer:
+disease and the is_cardio / is_gi_liver / is_infectious risk flags. `user_name` and
+`current_schedule` are never part of the key; whole mentions of them are swapped
+for placeholders before storing and filled back in per patient on a hit (no LLM
+call). Default values such as "คนไข้" are generic words and stay as they are.
+
+- Memory tier: LRU with TTL (per worker process).
+- Disk tier (optional, ANSWER_CACHE_DB): SQLite shared by workers and restarts;
+  disk hits are promoted to memory.
+
+Bypassed for alert-positive contexts. Only the first question of a thread is
+looked up or stored: a follow-up depends on the conversation before it. Turns
+answered by AppointmentAgent (patient specific side effects) are never stored, so
+every cached answer stands on its own.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from diseases import canonical_disease
+import metrics
+import settings
+
+KEY_VERSION = "v2"  # เปลี่ยนเมื่อ prompt/ความรู้เปลี่ยนจนคำตอบเดิมใช้ไม่ได้
+RISK_FLAGS = ("is_cardio", "is_gi_liver", "is_infectious")
+BYPASS_AGENTS = {"AppointmentAgent"}
+
+NAME_TOKEN = "<<user_name>>"
+SCHEDULE_TOKEN = "<<current_schedule>>"
+# ค่า default/คำทั่วไป (FE และ create_system_prompt) ไม่ใช่ข้อมูลเฉพาะคน ห้ามแทนด้วย placeholder
+GENERIC_NAMES = {"คนไข้", "ผู้ป่วย", "ผู้ใช้", "คุณ", "patient", "user"}
+GENERIC_SCHEDULES = {"ยังไม่ได้นัดหมาย", "ไม่มีนัด", "-"}
+
+# --- Normalization ---
+_POLITE = re.compile(r"(ครับผม|ครับ|คับ|ค่ะ|คะ|ค่า|จ้ะ|จ้า|นะ)+$")
+# ช่องว่าง เครื่องหมายวรรคตอน และ emoji (ห้ามใช้ \W เพราะจะลบสระ/วรรณยุกต์ไทยที่เป็น combining mark)
+_NON_WORD = re.compile(r"[\s!-/:-@\[-`{-~\u0e2f\u0e4f\u0e5a\u0e5b\u2000-\u206f\U0001f000-\U0001faff]+")
+_VARIANTS = [(re.compile(r"มั้ย|มั๊ย|ไม๊"), "ไหม"), (re.compile(r"(หรือ)?(เปล่า|ป่าว)"), "หรือเปล่า")]
+
+def normalize_query(text: str) -> str:
+    """ตัดช่องว่าง/เครื่องหมาย/คำลงท้าย และรวมคำสะกดต่างแบบให้เป็นแบบเดียว"""
+    text = _NON_WORD.sub("", text.lower())
+    for pattern, replacement in _VARIANTS:
+        text = pattern.sub(replacement, text)
+    return _POLITE.sub("", text)
+
+def _flag(value: Any) -> str:
+    return str(value if value is not None else "Negative").strip().lower()
+
+def cache_key(query: str, ctx: Dict[str, Any]) -> Optional[str]:
+    """None = ห้ามใช้ cache กับ turn นี้"""
+    if not settings.ANSWER_CACHE:
+        return None
+    if _flag(ctx.get("is_alert")) == "positive":
+        metrics.inc("answer_cache_bypass", reason="alert")
+        return None
+    question = normalize_query(query)
+    if not question:
+        return None
+    disease = ctx.get("disease")
+    parts = [KEY_VERSION, question, canonical_disease(disease) or str(disease or "").strip().lower()]
+    parts += [_flag(ctx.get(flag)) for flag in RISK_FLAGS]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+# --- Personalization ---
+_LETTER = r"[\u0e01-\u0e4e\w]"
+
+def _mention(value: Any, generic: set) -> Optional[re.Pattern]:
+    """
+    pattern ของ `value` เมื่อถูกกล่าวถึงทั้งคำ: ต่อจาก "คุณ" หรือไม่มีตัวอักษรติดทั้งสองข้าง
+    (ภาษาไทยไม่เว้นวรรค แทนแบบ substring จะไปโดนคำอื่น เช่นชื่อ "สม" ใน "สมควร")
+    None = ค่าว่าง/สั้นเกิน หรือเป็นคำทั่วไป
+    """
+    value = str(value or "").strip()
+    if len(value) < 2 or value.lower() in generic:
+        return None
+    escaped = re.escape(value)
+    return re.compile(rf"(?<=คุณ){escaped}|(?<!{_LETTER}){escaped}(?!{_LETTER})")
+
+def depersonalize(answers: List[str], ctx: Dict[str, Any]) -> List[str]:
+    name = _mention(ctx.get("user_name"), GENERIC_NAMES)
+    schedule = _mention(ctx.get("current_schedule"), GENERIC_SCHEDULES)
+    out = []
+    for text in answers:
+        if name:
+            text = name.sub(NAME_TOKEN, text)
+        if schedule:
+            text = schedule.sub(SCHEDULE_TOKEN, text)
+        out.append(text)
+    return out
+
+def personalize(answers: List[str], ctx: Dict[str, Any]) -> List[str]:
+    name = str(ctx.get("user_name") or "คนไข้")
+    schedule = str(ctx.get("current_schedule") or "ยังไม่ได้นัดหมาย")
+    return [text.replace(NAME_TOKEN, name).replace(SCHEDULE_TOKEN, schedule) for text in answers]
+
+def cacheable(answered: List[str]) -> bool:
+    if not answered:
+        return False
+    if BYPASS_AGENTS.intersection(answered):
+        metrics.inc("answer_cache_bypass", reason="agent")
+        return False
+    return True
+
+# --- Storage ---
+class AnswerCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, answers)
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answers TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db_lock = threading.Lock()
+
+    def _remember(self, key: str, expires_at: float, answers: List[str]) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, answers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                metrics.inc("answer_cache_hits", tier="memory")
+                return entry[1]
+            if entry:
+                del self._entries[key]
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT answers, expires_at FROM answers WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            if row:
+                answers = json.loads(row[0])
+                self._remember(key, row[1], answers)
+                metrics.inc("answer_cache_hits", tier="disk")
+                return answers
+        metrics.inc("answer_cache_misses")
+        return None
+
+    def put(self, key: str, answers: List[str]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, answers)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, answers, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(answers, ensure_ascii=False), expires_at),
+                )
+                self._db.execute("DELETE FROM answers WHERE expires_at <= ?", (time.time(),))
+        metrics.inc("answer_cache_stores")
+
+    async def aget(self, key: str) -> Optional[List[str]]:
+        if self._db is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, answers: List[str]) -> None:
+        if self._db is None:
+            return self.put(key, answers)
+        await asyncio.to_thread(self.put, key, answers)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM answers")
+
+cache = AnswerCache(settings.ANSWER_CACHE_SIZE, settings.ANSWER_CACHE_TTL_SECONDS, settings.ANSWER_CACHE_DB)
+
+def hit_rate() -> float:
+    hits = metrics.total("answer_cache_hits")
+    lookups = hits + metrics.total("answer_cache_misses")
+    return hits / lookups if lookups else 0.0
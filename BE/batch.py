@@ -0,0 +1,182 @@
+# batch.py
+"""
+Batch first replies for scheduled follow-ups (POST /chat/batch and this CLI).
+
+    python batch.py outreach.jsonl --out replies.ndjson --concurrency 32
+    python batch.py outreach.jsonl --out replies.ndjson --url http://127.0.0.1:8000
+
+Input: one ChatRequest-shaped JSON object per line (query, user_context, thread_id).
+Output: one NDJSON result per item, in completion order:
+    {"index", "thread_id", "status", "answers", "ms"}   status = ok | cached | shared | resumed | error
+
+- At most `concurrency` graph runs at a time; their LLM calls queue behind
+  interactive chat turns in admission.llm_gate (alert patients still go first).
+- Items with the same answer-cache key (same question, disease and risk flags, new
+  thread) run the graph once; the others wait for that answer and are personalized
+  ("shared"), or take it straight from the answer cache ("cached").
+- Resume: thread_ids that already have a result in --out are skipped, and on the
+  server a thread whose last question is this query and already has a reply returns
+  the stored reply ("resumed") without running the graph again.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from answer_cache import cache as answer_cache, cache_key, cacheable, depersonalize, personalize
+from tracing import TurnTrace
+from usage import tracker as usage_tracker
+import admission
+import settings
+
+def ai_replies(messages: List[Any]) -> List[str]:
+    return [
+        m.content for m in messages
+        if isinstance(m, AIMessage) and m.content and not m.tool_calls
+    ]
+
+def stored_reply(messages: List[Any], query: str) -> Optional[List[str]]:
+    """คำตอบเดิมถ้า turn ล่าสุดของ thread คือคำถามนี้และตอบไปแล้ว (รันซ้ำหลังถูกขัดจังหวะ)"""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            if messages[i].content != query:
+                return None
+            return ai_replies(messages[i + 1:]) or None
+    return None
+
+class BatchRunner:
+    def __init__(self, graph, concurrency: int = None, resume: bool = True):
+        self.graph = graph
+        self.concurrency = max(1, concurrency or settings.BATCH_CONCURRENCY)
+        self.resume = resume
+        self._inflight: Dict[str, asyncio.Future] = {}  # cache key -> คำตอบ (depersonalized) ของ item แรก
+
+    def config(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {"configurable": {"thread_id": item["thread_id"]}, "callbacks": [usage_tracker, TurnTrace(item["thread_id"])]}
+
+    async def answer(self, item: Dict[str, Any]) -> tuple:
+        config = self.config(item)
+        query, ctx = item["query"], item.get("user_context") or {}
+        messages = (await self.graph.aget_state(config)).values.get("messages") or []
+        if self.resume and messages:
+            stored = stored_reply(messages, query)
+            if stored:
+                return "resumed", stored
+
+        key = cache_key(query, ctx) if not messages else None
+        inputs = {"messages": [HumanMessage(content=query)], "user_context": ctx}
+        if key:
+            cached = await answer_cache.aget(key)
+            status = "cached"
+            if not cached and key in self._inflight:
+                cached, status = await asyncio.shield(self._inflight[key]), "shared"
+                if not cached:
+                    key = None  # item แรกพังหรือคำตอบเฉพาะคน (เช่น นัดหมาย) -> รัน graph เอง
+            if cached:
+                answers = personalize(cached, ctx)
+                await self.graph.aupdate_state(
+                    config, {**inputs, "messages": inputs["messages"] + [AIMessage(content=a) for a in answers]},
+                    as_node="summarize",
+                )
+                return status, answers
+        if key:
+            leader = self._inflight[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            result = await self.graph.ainvoke(inputs, config=config)
+        except BaseException:
+            if key:
+                leader.set_result(None)  # คนที่รออยู่รัน graph เอง
+                self._inflight.pop(key, None)
+            raise
+        answers = ai_replies(result["messages"][len(messages) + 1:])
+        if key:
+            shared = depersonalize(answers, ctx) if answers and cacheable(result.get("answered") or []) else None
+            if shared:
+                await answer_cache.aput(key, shared)
+            leader.set_result(shared)
+            self._inflight.pop(key, None)
+        return "ok", answers
+
+    async def run_item(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            # LLM call ของ batch รอหลัง chat ปกติ (ยกเว้นคนไข้ alert)
+            async with admission.turn(item["thread_id"], item.get("user_context") or {}, admission.PRIORITY_BATCH):
+                status, answers = await self.answer(item)
+            out = {"status": status, "answers": answers}
+        except Exception as exc:
+            out = {"status": "error", "answers": [], "error": f"{type(exc).__name__}: {exc}"}
+        return {"index": index, "thread_id": item["thread_id"], **out, "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    async def run(self, items: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """ผลของแต่ละ item ตามลำดับที่เสร็จ (worker ละ item, สูงสุด concurrency ตัว)"""
+        queue: asyncio.Queue = asyncio.Queue()
+        pending = iter(enumerate(items))
+
+        async def worker():
+            for index, item in pending:
+                await queue.put(await self.run_item(index, item))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(items)))]
+        try:
+            for _ in range(len(items)):
+                yield await queue.get()
+        finally:
+            # client ตัดการเชื่อมต่อ -> หยุดงานที่เหลือ
+            for task in workers:
+                task.cancel()
+
+# --- CLI ---
+def done_threads(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return {row["thread_id"] for row in rows if row.get("status") != "error"}
+
+async def remote_results(url: str, items: List[Dict], concurrency: int) -> AsyncIterator[Dict]:
+    import httpx
+    payload = {"items": items, "concurrency": concurrency}
+    async with httpx.AsyncClient(timeout=None) as client:
+        async with client.stream("POST", f"{url}/chat/batch", json=payload) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Batch first replies (NDJSON in, NDJSON out)")
+    parser.add_argument("items", help="JSONL file of ChatRequest-shaped items")
+    parser.add_argument("--out", required=True, help="NDJSON results (appended; finished thread_ids are skipped)")
+    parser.add_argument("--url", help="server URL; runs the graph in this process when omitted")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY)
+    args = parser.parse_args()
+
+    with open(args.items, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    finished = done_threads(args.out)
+    todo = [item for item in items if item["thread_id"] not in finished]
+    print(f"items={len(items)}  already done={len(items) - len(todo)}  to run={len(todo)}")
+
+    if args.url:
+        results = remote_results(args.url, todo, args.concurrency)
+    else:
+        from graph import app as graph_app
+        results = BatchRunner(graph_app, args.concurrency).run(todo)
+
+    start, statuses = time.perf_counter(), {}
+    with open(args.out, "a", encoding="utf-8") as out:
+        async for row in results:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            statuses[row["status"]] = statuses.get(row["status"], 0) + 1
+    wall = time.perf_counter() - start
+    print(f"done in {wall:.1f}s  {statuses}  ({len(todo) / wall if wall else 0:.1f} items/s)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
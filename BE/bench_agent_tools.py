@@ -0,0 +1,82 @@
+# bench_agent_tools.py
+"""
+Prompt size and latency of the generic agents (every disease's tools bound) vs the
+disease-scoped variants from agent.get_agent.
+
+    python bench_agent_tools.py              # static prompt tokens only, no LLM calls
+    python bench_agent_tools.py --live 3     # plus real agent calls per variant
+
+Static tokens are the agent instructions plus the JSON tool schemas sent with every
+request. With --live each (agent, disease) pair answers QUESTIONS[agent] N times
+per variant; input tokens come from the provider's usage metadata.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agent import agent_specs, get_agent, scoped_tools
+from diseases import canonical_disease
+from tokens import count_text
+
+DISEASES = ["เบาหวาน", "ความดันสูง", "ไขมันในเลือดสูง"]
+
+QUESTIONS = {
+    "MedicationAgent": "ยาตัวนี้ต้องกินก่อนหรือหลังอาหารครับ",
+    "ExerciseAgent": "ออกกำลังกายตอนเช้าได้ไหมครับ",
+    "DietAgent": "กินทุเรียนได้ไหมครับ",
+    "TransportAgent": "จะนั่งเครื่องบินไปเชียงใหม่ต้องเตรียมตัวยังไง",
+}
+
+def static_tokens(tools, instructions: str) -> int:
+    schemas = json.dumps([convert_to_openai_tool(t) for t in tools], ensure_ascii=False)
+    return count_text(instructions) + count_text(schemas)
+
+async def run_agent(agent, disease: str, question: str) -> dict:
+    state = {"messages": [HumanMessage(content=question)], "user_context": {"disease": disease}}
+    start = time.perf_counter()
+    result = await agent.ainvoke(state)
+    latency = time.perf_counter() - start
+    usage = [m.usage_metadata for m in result["messages"] if getattr(m, "usage_metadata", None)]
+    return {"latency": latency, "input_tokens": sum(u["input_tokens"] for u in usage)}
+
+async def live(agent_type: str, disease: str, repeat: int) -> dict:
+    out = {}
+    # เทียบเฉพาะผลของการตัด tools จึงปิด prefetch ทั้งสองฝั่ง
+    variants = {"generic": get_agent(agent_type, prefetch=False), "scoped": get_agent(agent_type, disease, prefetch=False)}
+    for label, agent in variants.items():
+        runs = [await run_agent(agent, disease, QUESTIONS[agent_type]) for _ in range(repeat)]
+        out[label] = {
+            "latency": statistics.mean(r["latency"] for r in runs),
+            "input_tokens": statistics.mean(r["input_tokens"] for r in runs),
+        }
+    return out
+
+async def main():
+    parser = argparse.ArgumentParser(description="Generic vs disease-scoped agent tools benchmark")
+    parser.add_argument("--live", type=int, default=0, help="real agent calls per variant (0 = static only)")
+    args = parser.parse_args()
+
+    for agent_type in QUESTIONS:
+        tools, instructions = agent_specs[agent_type]
+        generic = static_tokens(tools, instructions)
+        for disease in DISEASES:
+            scoped = static_tokens(scoped_tools(tools, canonical_disease(disease)), instructions)
+            line = (
+                f"{agent_type:<16} {disease:<16} static tokens generic={generic:<5} scoped={scoped:<5} "
+                f"(-{(generic - scoped) / generic:.0%})"
+            )
+            if args.live:
+                res = await live(agent_type, disease, args.live)
+                line += (
+                    f"  input tokens {res['generic']['input_tokens']:.0f}->{res['scoped']['input_tokens']:.0f}"
+                    f"  latency {res['generic']['latency']:.2f}s->{res['scoped']['latency']:.2f}s"
+                )
+            print(line)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+# bench_checkpointer.py
+"""
+Memory growth of MemorySaver vs SqliteSaver over many conversation threads.
+
+    python bench_checkpointer.py --threads 10000 --turns 2
+
+No LLM is involved: each turn runs a one-node graph that appends a canned Thai
+reply, so the numbers isolate checkpoint storage. Each backend runs in its own
+subprocess so their memory does not mix. Memory is process RSS growth by default,
+or Python heap growth with --tracemalloc.
+"""
+import argparse
+import asyncio
+import json
+import operator
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Annotated, Any, Dict, List, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.graph import StateGraph, START, END
+
+from checkpointer import MemorySaver, SqliteSaver, footprint
+
+
+class BenchState(TypedDict):
+    # โครงเดียวกับ agent.AgentState แต่ไม่ต้อง import LLM
+    messages: Annotated[List[BaseMessage], operator.add]
+    user_context: Dict[str, Any]
+
+
+REPLY = "ทานยาหลังอาหารทันทีนะครับ และอย่าลืมเช็กน้ำตาลก่อนออกกำลังกาย " * 5
+
+
+def reply_node(state: BenchState):
+    return {"messages": [AIMessage(content=REPLY)]}
+
+
+def memory_bytes(use_tracemalloc: bool) -> int:
+    """Python heap (tracemalloc) หรือ RSS ปัจจุบันของ process"""
+    if use_tracemalloc:
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def build_app(saver):
+    workflow = StateGraph(BenchState)
+    workflow.add_node("reply", reply_node)
+    workflow.add_edge(START, "reply")
+    workflow.add_edge("reply", END)
+    return workflow.compile(checkpointer=saver)
+
+
+async def run(backend: str, threads: int, turns: int, keep_last: int, use_tracemalloc: bool) -> dict:
+    tmpdir = tempfile.mkdtemp()
+    if backend == "sqlite":
+        saver = SqliteSaver(os.path.join(tmpdir, "bench.sqlite"), keep_last=keep_last)
+    else:
+        saver = MemorySaver()
+    app = build_app(saver)
+
+    if use_tracemalloc:
+        tracemalloc.start()
+    baseline = memory_bytes(use_tracemalloc)
+    start = time.perf_counter()
+    samples = []
+    for i in range(threads):
+        config = {"configurable": {"thread_id": f"patient-{i}"}}
+        for turn in range(turns):
+            inputs = {"messages": [HumanMessage(content=f"คำถามที่ {turn}")], "user_context": {"disease": "เบาหวาน"}}
+            await app.ainvoke(inputs, config=config)
+        if (i + 1) % max(threads // 10, 1) == 0:
+            samples.append((i + 1, memory_bytes(use_tracemalloc) - baseline))
+    elapsed = time.perf_counter() - start
+    growth = memory_bytes(use_tracemalloc) - baseline
+    if use_tracemalloc:
+        tracemalloc.stop()
+
+    return {
+        "backend": backend,
+        "seconds": elapsed,
+        "turns_per_sec": threads * turns / elapsed,
+        "memory_growth_bytes": growth,
+        "samples": samples,
+        "footprint": footprint(saver),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpointer memory growth benchmark")
+    parser.add_argument("--threads", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--keep-last", type=int, default=10)
+    parser.add_argument("--backend", choices=["memory", "sqlite", "both"], default="both")
+    parser.add_argument("--tracemalloc", action="store_true", help="measure Python heap instead of RSS (slower)")
+    args = parser.parse_args()
+
+    if args.backend != "both":
+        res = asyncio.run(run(args.backend, args.threads, args.turns, args.keep_last, args.tracemalloc))
+        print(json.dumps(res))
+        return
+
+    for backend in ("memory", "sqlite"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--backend", backend, "--threads", str(args.threads),
+             "--turns", str(args.turns), "--keep-last", str(args.keep_last)]
+            + (["--tracemalloc"] if args.tracemalloc else []),
+            capture_output=True, text=True, check=True,
+        )
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        fp = res["footprint"]
+        print(
+            f"{backend:<7} threads={args.threads} turns/s={res['turns_per_sec']:.0f}  "
+            f"memory growth={res['memory_growth_bytes'] / 2**20:.1f}MiB  "
+            f"checkpoints={fp['checkpoints']}  payload={fp['payload_bytes'] / 2**20:.1f}MiB  "
+            f"disk={fp['disk_bytes'] / 2**20:.1f}MiB"
+        )
+        print("        growth by threads: " + ", ".join(f"{n}:{b / 2**20:.1f}MiB" for n, b in res["samples"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench_concurrency.py
+"""
+Concurrency benchmark for the /chat endpoint.
+
+Start one uvicorn worker first (e.g. `uvicorn main:app --workers 1`), then run:
+
+    python bench_concurrency.py --url http://127.0.0.1:8000 --levels 1 2 4 8 16
+
+Each simulated patient gets its own thread_id and sends one message. With async
+nodes the turns/s should scale with the concurrency level until the LLM provider
+(or rate limits) becomes the bottleneck.
+
+Pass --tokens to use the token-streaming mode; the "ttft" column is the time
+until the first SSE data frame reaches the client.
+
+The answer cache (answer_cache.py, on by default on the server) is kept out of
+the numbers: every session's question gets a unique "(#n)" tag, so every turn
+runs the graph. Pass --cache to send the plain question and measure with cache hits.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+DEFAULT_CONTEXT = {
+    "user_name": "คนไข้ทดสอบ",
+    "disease": "เบาหวาน",
+    "current_schedule": "2025-01-20",
+    "is_alert": "Negative",
+    "is_cardio": "Negative",
+    "is_gi_liver": "Negative",
+    "is_infectious": "Negative",
+}
+
+
+async def run_session(client: httpx.AsyncClient, url: str, query: str, tokens: bool, cache: bool) -> tuple:
+    payload = {
+        # tag ไม่ซ้ำกันทุก session ให้ answer cache ไม่มีทางตอบแทน graph
+        "query": query if cache else f"{query} (#{uuid.uuid4().int % 10**12})",
+        "user_context": DEFAULT_CONTEXT,
+        "thread_id": f"bench-{uuid.uuid4()}",
+        "stream_tokens": tokens,
+    }
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", f"{url}/chat", json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if ttft is None and line.startswith("data: "):
+                ttft = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return (ttft if ttft is not None else total), total
+
+
+async def run_level(url: str, level: int, query: str, tokens: bool, cache: bool) -> dict:
+    limits = httpx.Limits(max_connections=level, max_keepalive_connections=level)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_session(client, url, query, tokens, cache) for _ in range(level)))
+        wall = time.perf_counter() - start
+    ttfts = [r[0] for r in results]
+    latencies = [r[1] for r in results]
+    return {
+        "level": level,
+        "wall": wall,
+        "throughput": level / wall,
+        "mean_ttft": statistics.mean(ttfts),
+        "mean_latency": statistics.mean(latencies),
+        "max_latency": max(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure /chat throughput vs concurrent sessions")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--query", default="ยาเบาหวานกินก่อนหรือหลังอาหารครับ")
+    parser.add_argument("--tokens", action="store_true", help="use token-level streaming")
+    parser.add_argument("--cache", action="store_true", help="let the server's answer cache answer repeated questions")
+    args = parser.parse_args()
+
+    results = []
+    for level in args.levels:
+        res = await run_level(args.url, level, args.query, args.tokens, args.cache)
+        results.append(res)
+        print(
+            f"sessions={res['level']:>3}  wall={res['wall']:.2f}s  turns/s={res['throughput']:.2f}  "
+            f"ttft={res['mean_ttft']:.2f}s  mean={res['mean_latency']:.2f}s  max={res['max_latency']:.2f}s"
+        )
+
+    base = results[0]["throughput"]
+    print("\n--- Scaling vs first level ---")
+    for res in results:
+        print(f"sessions={res['level']:>3}  speedup={res['throughput'] / base:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+# bench_fanout.py
+"""
+Compare the sequential supervisor loop with parallel fan-out on multi-intent questions.
+
+    python bench_fanout.py --repeat 3
+
+Both graphs are built in-process (graph.build_graph) and run the same questions on
+fresh threads. For each mode it reports wall-clock latency per turn, LLM calls per
+turn (counted with a callback handler) and how many agent answers the patient got.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from graph import build_graph
+
+QUESTIONS = [
+    "ขอเลื่อนนัดเป็นวันจันทร์หน้า แล้วกินทุเรียนได้ไหมครับ",
+    "ยาเบาหวานต้องกินก่อนหรือหลังอาหาร แล้วออกกำลังกายตอนเช้าได้ไหม",
+    "จะนั่งเครื่องบินไปเชียงใหม่ ต้องเตรียมยายังไง กินอะไรบนเครื่องได้บ้าง และต้องเลื่อนนัดไหม",
+]
+
+CONTEXT = {
+    "user_name": "คนไข้ทดสอบ",
+    "disease": "เบาหวาน",
+    "current_schedule": "2025-01-20",
+}
+
+
+class LLMCallCounter(AsyncCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+
+
+async def run_turn(app, question: str) -> dict:
+    counter = LLMCallCounter()
+    config = {"configurable": {"thread_id": f"bench-{uuid.uuid4()}"}, "callbacks": [counter]}
+    inputs = {"messages": [HumanMessage(content=question)], "user_context": CONTEXT}
+    start = time.perf_counter()
+    result = await app.ainvoke(inputs, config=config)
+    latency = time.perf_counter() - start
+    answers = [m for m in result["messages"][1:] if m.type == "ai" and m.content and not m.tool_calls]
+    return {"latency": latency, "calls": counter.calls, "answers": len(answers)}
+
+
+async def run_mode(fanout: bool, repeat: int) -> dict:
+    app = build_graph(fanout=fanout)
+    runs = [await run_turn(app, q) for _ in range(repeat) for q in QUESTIONS]
+    return {
+        "mode": "fan-out" if fanout else "sequential",
+        "latency": statistics.mean(r["latency"] for r in runs),
+        "calls": statistics.mean(r["calls"] for r in runs),
+        "answers": statistics.mean(r["answers"] for r in runs),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Sequential vs fan-out routing benchmark")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    for fanout in (False, True):
+        res = await run_mode(fanout, args.repeat)
+        print(
+            f"{res['mode']:<11} latency/turn={res['latency']:.2f}s  "
+            f"LLM calls/turn={res['calls']:.1f}  answers/turn={res['answers']:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+# bench_knowledge.py
+"""
+Knowledge store retrieval latency and tokens returned per tool call.
+
+    python bench_knowledge.py --repeat 200
+
+For each query the section-level retriever (knowledge.retrieve) is compared with
+returning the whole (disease, domain) block, which is what the old hard-coded tools
+did. Also reports how long a full index build takes.
+"""
+import argparse
+import statistics
+import time
+
+import knowledge
+import settings
+from tokens import count_text
+
+QUERIES = [
+    ("diabetes", "medication", "อินซูลินต้องเก็บยังไงตอนเดินทาง"),
+    ("diabetes", "diet", "กินทุเรียนได้ไหม"),
+    ("diabetes", "exercise", "น้ำตาลต่ำออกกำลังกายได้ไหม"),
+    ("bp", "medication", "กินยาความดันแล้วไอแห้งๆ"),
+    ("bp", "diet", "กินเค็มได้แค่ไหน"),
+    ("bp", "transport", "นั่งเครื่องบินนานๆ ต้องระวังอะไร"),
+    ("hyperlipidemia", "medication", "statin ปวดกล้ามเนื้อ"),
+    ("hyperlipidemia", "diet", "กินกะทิได้ไหม ครีมเทียมล่ะ"),
+    ("hyperlipidemia", "exercise", "ควรออกกำลังกายกี่วันต่อสัปดาห์"),
+]
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge retrieval benchmark")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    build = timed(lambda: knowledge.load(settings.KNOWLEDGE_DIR), max(args.repeat // 20, 1))
+    index = knowledge.current()
+    print(f"index: {len(index.sections)} sections, build {build * 1000:.1f}ms, "
+          f"segmenter={'pythainlp' if knowledge.word_tokenize else 'bigram'}")
+
+    full_tokens, section_tokens = [], []
+    for disease, domain, query in QUERIES:
+        latency = timed(lambda: knowledge.retrieve(disease, domain, query), args.repeat)
+        full = count_text(knowledge.retrieve(disease, domain))
+        sections = count_text(knowledge.retrieve(disease, domain, query))
+        full_tokens.append(full)
+        section_tokens.append(sections)
+        print(f"{disease:<15} {domain:<11} {latency * 1e6:7.0f}us  tokens {full:>4} -> {sections:<4} {query}")
+
+    print(
+        f"mean tokens/call: whole block={statistics.mean(full_tokens):.0f}  "
+        f"sections={statistics.mean(section_tokens):.0f} "
+        f"(-{1 - sum(section_tokens) / sum(full_tokens):.0%})"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# bench_prefetch.py
+"""
+Tool-calling agents vs knowledge prefetch, per answered question.
+
+    python bench_prefetch.py --repeat 3
+
+Each specialist agent answers its question for every supported disease, once with
+the tool loop (LLM decides to call the disease tool, then answers) and once with the
+disease knowledge prefetched into the prompt (single LLM call). Reports LLM calls,
+latency and input tokens per answer for both modes.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from agent import get_agent
+
+DISEASES = ["เบาหวาน", "ความดันสูง", "ไขมันในเลือดสูง"]
+
+QUESTIONS = {
+    "MedicationAgent": "ยาตัวนี้ต้องกินก่อนหรือหลังอาหารครับ",
+    "ExerciseAgent": "ออกกำลังกายตอนเช้าได้ไหมครับ",
+    "DietAgent": "กินทุเรียนได้ไหมครับ",
+    "TransportAgent": "จะนั่งเครื่องบินไปเชียงใหม่ต้องเตรียมตัวยังไง",
+}
+
+class LLMCallCounter(AsyncCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+
+async def answer(agent, disease: str, question: str) -> dict:
+    counter = LLMCallCounter()
+    state = {"messages": [HumanMessage(content=question)], "user_context": {"disease": disease}}
+    start = time.perf_counter()
+    result = await agent.ainvoke(state, config={"callbacks": [counter]})
+    latency = time.perf_counter() - start
+    usage = [m.usage_metadata for m in result["messages"] if getattr(m, "usage_metadata", None)]
+    return {"latency": latency, "calls": counter.calls, "input_tokens": sum(u["input_tokens"] for u in usage)}
+
+async def run_mode(prefetch: bool, repeat: int) -> dict:
+    runs = [
+        await answer(get_agent(agent_type, disease, prefetch=prefetch), disease, question)
+        for _ in range(repeat)
+        for agent_type, question in QUESTIONS.items()
+        for disease in DISEASES
+    ]
+    return {
+        "mode": "prefetch" if prefetch else "tools",
+        "calls": statistics.mean(r["calls"] for r in runs),
+        "latency": statistics.mean(r["latency"] for r in runs),
+        "input_tokens": statistics.mean(r["input_tokens"] for r in runs),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Tool-calling vs knowledge prefetch benchmark")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    results = [await run_mode(prefetch, args.repeat) for prefetch in (False, True)]
+    for res in results:
+        print(
+            f"{res['mode']:<8} LLM calls/answer={res['calls']:.2f}  "
+            f"latency/answer={res['latency']:.2f}s  input tokens/answer={res['input_tokens']:.0f}"
+        )
+    tools, prefetch = results
+    print(
+        f"prefetch saves {tools['calls'] - prefetch['calls']:.2f} LLM calls and "
+        f"{tools['latency'] - prefetch['latency']:.2f}s per answer"
+    )
+
+if __name__ == "__main__":
+    asyncio.run(main())
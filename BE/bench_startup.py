@@ -0,0 +1,147 @@
+# bench_startup.py
+"""
+Cold start: import time per module, and time from process start to the first reply.
+
+    python bench_startup.py --runs 3
+    python bench_startup.py --runs 3 --provider openai     # needs OPENAI_API_KEY
+
+Every measurement runs in a fresh interpreter, so nothing is cached in memory:
+- imports: cumulative import time of the heavy dependencies and of each backend
+  module, in the same order main.py pulls them in.
+- serve: starts `uvicorn main:app` in a subprocess the way a woken-up instance
+  does, then measures
+    up      spawn -> /healthz answers (port open, lifespan started)
+    ready   spawn -> /readyz 200 (warmup done; "-" when not waited for)
+    first   first /chat request -> first SSE byte, and -> last byte
+  The modes are "lazy" (WARMUP=0, the request pays for building chains and
+  agents), "warm" (WARMUP=1, request sent as soon as the port is open) and
+  "warm+ready" (WARMUP=1, request sent after /readyz).
+Uses the fake LLM by default (FAKE_LLM_LATENCY=0) so only startup work is measured.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_ORDER = ["fastapi", "langgraph.graph", "langchain_core.runnables", "agent", "supervise", "graph", "main"]
+
+IMPORT_PROBE = """
+import importlib, json, time
+out = {}
+start = time.perf_counter()
+for name in %r:
+    importlib.import_module(name)
+    out[name] = time.perf_counter() - start
+print(json.dumps(out))
+"""
+
+MODES = {
+    "lazy": ({"WARMUP": "0"}, False),
+    "warm": ({"WARMUP": "1"}, False),
+    "warm+ready": ({"WARMUP": "1"}, True),
+}
+
+PAYLOAD = {
+    "query": "ยาเบาหวานกินก่อนหรือหลังอาหาร",
+    "user_context": {"user_name": "สมชาย", "disease": "เบาหวาน", "is_alert": "Negative"},
+    "thread_id": "bench-startup",
+}
+
+
+def child_env(provider: str, extra: dict = None) -> dict:
+    env = {**os.environ, "LLM_PROVIDER": provider, "PYTHONPATH": HERE, **(extra or {})}
+    env.setdefault("FAKE_LLM_LATENCY", "0")
+    return env
+
+
+def measure_imports(provider: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE % IMPORT_ORDER],
+        capture_output=True, text=True, check=True, cwd=HERE, env=child_env(provider),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(client: httpx.Client, path: str, proc: subprocess.Popen, timeout: float = 120) -> float:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if client.get(path).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{path} not ready after {timeout}s")
+
+
+def measure_serve(provider: str, mode: str) -> dict:
+    extra, wait_ready = MODES[mode]
+    port = free_port()
+    spawn = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=child_env(provider, extra), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            up = wait_for(client, "/healthz", proc) - spawn
+            ready = wait_for(client, "/readyz", proc) - spawn if wait_ready else None
+            start = time.perf_counter()
+            first_byte = None
+            with client.stream("POST", "/chat", json=PAYLOAD) as r:
+                r.raise_for_status()
+                for _ in r.iter_raw():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - start
+            total = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"up": up, "ready": ready, "first_byte": first_byte or total, "total": total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--provider", default="fake", choices=["fake", "openai"])
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated: " + ", ".join(MODES))
+    args = parser.parse_args()
+
+    imports = [measure_imports(args.provider) for _ in range(args.runs)]
+    print(f"imports (cumulative, median of {args.runs})")
+    previous = 0.0
+    for name in IMPORT_ORDER:
+        value = statistics.median(run[name] for run in imports)
+        print(f"  {name:<26} {value:6.2f}s  (+{value - previous:.2f}s)")
+        previous = value
+
+    print(f"\nserve (spawn -> ..., median of {args.runs})")
+    for mode in args.modes.split(","):
+        runs = [measure_serve(args.provider, mode) for _ in range(args.runs)]
+        ready = [r["ready"] for r in runs if r["ready"] is not None]
+        print(
+            f"  {mode:<11} up={statistics.median(r['up'] for r in runs):.2f}s  "
+            f"ready={f'{statistics.median(ready):.2f}s' if ready else '-':<6} "
+            f"first byte={statistics.median(r['first_byte'] for r in runs):.3f}s  "
+            f"first reply={statistics.median(r['total'] for r in runs):.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# cassette.py
+"""
+Record and replay LLM HTTP traffic, for offline end-to-end performance runs.
+
+    LLM_CASSETTE=evals/cassettes/regression.jsonl LLM_CASSETTE_MODE=record uvicorn main:app
+    LLM_CASSETTE=evals/cassettes/regression.jsonl LLM_CASSETTE_MODE=replay uvicorn main:app
+    python regress.py record / python regress.py        (does both for evals/conversations.jsonl)
+
+When LLM_CASSETTE is set, llm_config.http_clients() builds the shared httpx
+clients on top of CassetteTransport. Every call made by the topic, supervisor
+and summary chains and by the agents goes through it. ChatOpenAI still parses
+real API responses: json_schema output, tool calls and SSE token streams.
+
+- record: the request is forwarded to the API (OpenAI, or stub_openai.py via
+  LLM_BASE_URL). Each completed exchange is appended as one JSON line: the
+  request key, a short description of the request, the status, the
+  content-type, and the body as [seconds since request start, text] chunks.
+  Compression is turned off, so bodies are stored as text.
+- replay: no network. A request gets the recorded response with the same key,
+  made of method, path and canonical JSON body. Identical requests get their
+  recordings in order; once those run out, the last one is repeated.
+  - With LLM_CASSETTE_TIMING, the recorded time to first byte and the gaps
+    between chunks are slept. Otherwise responses are instant, so a run
+    measures only the app's own overhead.
+  - A request with no recording is answered 404 and counted in
+    cassette_misses.
+"""
+import asyncio
+import codecs
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+import metrics
+import settings
+
+# --- Keys ---
+def request_key(request: httpx.Request) -> str:
+    body = request.content
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        canonical = body.decode("utf-8", "replace")
+    return hashlib.sha256(f"{request.method} {request.url.path}\n{canonical}".encode()).hexdigest()[:32]
+
+def describe(request: httpx.Request) -> Dict:
+    """สรุปสั้นๆ ของ request ไว้ดูใน cassette (ไม่เก็บ prompt ทั้งก้อน)"""
+    try:
+        body = json.loads(request.content)
+    except ValueError:
+        return {}
+    messages = body.get("messages") or []
+    last = messages[-1].get("content") if messages else ""
+    return {
+        "model": body.get("model"),
+        "messages": len(messages),
+        "last": str(last)[:120],
+        "stream": bool(body.get("stream")),
+        "tools": [t.get("function", {}).get("name") for t in body.get("tools") or []],
+        "schema": ((body.get("response_format") or {}).get("json_schema") or {}).get("name"),
+    }
+
+# --- Storage ---
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._exchanges: Dict[str, List[Dict]] = defaultdict(list)
+        self._served: Dict[str, int] = defaultdict(int)
+        self.slept = 0.0  # เวลาที่ replay หน่วงตาม timing ที่บันทึกไว้ (หักออกเวลาวัด overhead)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        exchange = json.loads(line)
+                        self._exchanges[exchange["key"]].append(exchange)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._exchanges.values())
+
+    def record(self, exchange: Dict) -> None:
+        with self._lock:
+            self._exchanges[exchange["key"]].append(exchange)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(exchange, ensure_ascii=False) + "\n")
+        metrics.inc("cassette_recorded")
+
+    def next(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            recorded = self._exchanges.get(key)
+            if not recorded:
+                return None
+            index = min(self._served[key], len(recorded) - 1)
+            self._served[key] += 1
+            return recorded[index]
+
+    def rewind(self) -> None:
+        with self._lock:
+            self._served.clear()
+
+# --- Streams ---
+class _Recording:
+    """เก็บ chunk ของ response พร้อมเวลา แล้วบันทึกเมื่ออ่านครบ (response ที่ถูกทิ้งกลางทางไม่บันทึก)"""
+
+    def __init__(self, start: float, save: Callable[[List], None]):
+        self.start = start
+        self.save = save
+        self.chunks: List[list] = []
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.complete = False
+
+    def add(self, chunk: bytes) -> None:
+        text = self.decoder.decode(chunk)
+        if text:
+            self.chunks.append([round(time.perf_counter() - self.start, 4), text])
+
+    def close(self) -> None:
+        if self.complete:
+            self.save(self.chunks)
+            self.complete = False
+
+class _RecordingStream(httpx.AsyncByteStream, httpx.SyncByteStream):
+    def __init__(self, inner, recording: _Recording):
+        self.inner = inner
+        self.recording = recording
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            self.recording.add(chunk)
+            yield chunk
+        self.recording.complete = True
+
+    def __iter__(self):
+        for chunk in self.inner:
+            self.recording.add(chunk)
+            yield chunk
+        self.recording.complete = True
+
+    async def aclose(self):
+        await self.inner.aclose()
+        self.recording.close()
+
+    def close(self):
+        self.inner.close()
+        self.recording.close()
+
+class _ReplayStream(httpx.AsyncByteStream, httpx.SyncByteStream):
+    def __init__(self, chunks: List[list], cassette: Cassette, timing: bool):
+        self.chunks = chunks
+        self.cassette = cassette
+        self.timing = timing
+
+    def _gaps(self):
+        elapsed = 0.0
+        for at, text in self.chunks:
+            gap = max(0.0, at - elapsed) if self.timing else 0.0
+            elapsed = max(elapsed, at)
+            self.cassette.slept += gap
+            yield gap, text.encode("utf-8")
+
+    async def __aiter__(self):
+        for gap, chunk in self._gaps():
+            if gap:
+                await asyncio.sleep(gap)
+            yield chunk
+
+    def __iter__(self):
+        for gap, chunk in self._gaps():
+            if gap:
+                time.sleep(gap)
+            yield chunk
+
+# --- Transport ---
+class CassetteTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, mode: str, timing: bool = False, limits: httpx.Limits = None, is_async: bool = True):
+        self.cassette = cassette
+        self.mode = mode
+        self.timing = timing
+        self.inner = None
+        if mode == "record":
+            limits = limits or httpx.Limits()
+            self.inner = httpx.AsyncHTTPTransport(limits=limits) if is_async else httpx.HTTPTransport(limits=limits)
+
+    def _replay(self, key: str) -> httpx.Response:
+        exchange = self.cassette.next(key)
+        if exchange is None:
+            metrics.inc("cassette_misses")
+            error = {"error": {"message": f"no recorded response for request {key}", "type": "cassette_miss"}}
+            return httpx.Response(404, json=error)
+        metrics.inc("cassette_hits")
+        return httpx.Response(
+            exchange["status"],
+            headers={"content-type": exchange["content_type"]},
+            stream=_ReplayStream(exchange["chunks"], self.cassette, self.timing),
+        )
+
+    def _recording(self, request: httpx.Request, key: str) -> Callable[[httpx.Response], httpx.Response]:
+        """ตั้ง request ให้บันทึกได้ คืนฟังก์ชันที่ห่อ response ให้บันทึกตัวเองเมื่ออ่านครบ"""
+        request.headers["accept-encoding"] = "identity"
+        info = describe(request)
+        start = time.perf_counter()
+
+        def wrap(response: httpx.Response) -> httpx.Response:
+            def save(chunks):
+                self.cassette.record({
+                    "key": key,
+                    "method": request.method,
+                    "path": request.url.path,
+                    "request": info,
+                    "status": response.status_code,
+                    "content_type": response.headers.get("content-type", "application/json"),
+                    "chunks": chunks,
+                })
+            stream = _RecordingStream(response.stream, _Recording(start, save))
+            return httpx.Response(response.status_code, headers=response.headers, stream=stream, extensions=response.extensions)
+
+        return wrap
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        if self.mode == "replay":
+            return self._replay(key)
+        wrap = self._recording(request, key)
+        return wrap(await self.inner.handle_async_request(request))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        if self.mode == "replay":
+            return self._replay(key)
+        wrap = self._recording(request, key)
+        return wrap(self.inner.handle_request(request))
+
+    async def aclose(self) -> None:
+        if self.inner is not None:
+            await self.inner.aclose()
+
+    def close(self) -> None:
+        if self.inner is not None:
+            self.inner.close()
+
+# --- Settings ---
+_active: Optional[Cassette] = None
+
+def active() -> Optional[Cassette]:
+    """cassette ตาม LLM_CASSETTE (None = ปิด)"""
+    global _active
+    if settings.LLM_CASSETTE and (_active is None or _active.path != settings.LLM_CASSETTE):
+        _active = Cassette(settings.LLM_CASSETTE)
+    return _active if settings.LLM_CASSETTE else None
+
+def replaying() -> bool:
+    return active() is not None and settings.LLM_CASSETTE_MODE == "replay"
+
+def transports(limits: httpx.Limits) -> Tuple[Optional[CassetteTransport], Optional[CassetteTransport]]:
+    """(sync, async) transport สำหรับ http_clients(), (None, None) ถ้าไม่ได้ใช้ cassette"""
+    cassette = active()
+    if cassette is None:
+        return None, None
+    mode, timing = settings.LLM_CASSETTE_MODE, settings.LLM_CASSETTE_TIMING
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unknown LLM_CASSETTE_MODE: {mode!r} (expected 'record' or 'replay')")
+    return (
+        CassetteTransport(cassette, mode, timing, limits, is_async=False),
+        CassetteTransport(cassette, mode, timing, limits, is_async=True),
+    )
@@ -0,0 +1,415 @@
+# checkpointer.py
+"""
+Checkpointer backends for the conversation graph.
+
+- "memory": langgraph MemorySaver (ทุกอย่างอยู่ใน RAM ของ process, หายเมื่อ restart)
+- "sqlite": SqliteSaver ด้านล่าง - ไฟล์ SQLite (WAL) ใช้ร่วมกันได้หลาย worker process,
+  ลบ thread ที่ไม่ active เกิน TTL และเก็บ checkpoint ล่าสุดไม่เกิน N ตัวต่อ thread
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id   TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id     TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_id     TEXT,
+    type          TEXT NOT NULL,
+    checkpoint    BLOB NOT NULL,
+    meta_type     TEXT NOT NULL,
+    metadata      BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id     TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id       TEXT NOT NULL,
+    idx           INTEGER NOT NULL,
+    channel       TEXT NOT NULL,
+    type          TEXT NOT NULL,
+    value         BLOB NOT NULL,
+    task_path     TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access);
+"""
+
+
+class SqliteSaver(BaseCheckpointSaver):
+    """
+    Checkpointer บนไฟล์ SQLite (WAL) แต่ละ process เปิด connection ของตัวเอง
+    จึงใช้ร่วมกันได้ระหว่าง `uvicorn --workers N`
+
+    Args:
+        path: ไฟล์ฐานข้อมูล
+        ttl_seconds: ลบ thread ที่ไม่มี checkpoint ใหม่นานเกินค่านี้ (0 = ไม่ลบ)
+        keep_last: จำนวน checkpoint ล่าสุดที่เก็บต่อ thread/namespace (0 = เก็บทั้งหมด)
+        evict_interval: ตรวจ TTL อย่างมากทุกกี่วินาที (ทำระหว่าง put)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl_seconds: float = 0,
+        keep_last: int = 0,
+        evict_interval: float = 60.0,
+        serde=None,
+    ) -> None:
+        super().__init__(serde=serde)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.keep_last = keep_last
+        self.evict_interval = evict_interval
+        self._last_evict = 0.0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(SCHEMA)
+
+    # --- Helpers ---
+    def _touch(self, cur: sqlite3.Cursor, thread_id: str) -> None:
+        cur.execute(
+            "INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+            (thread_id, time.time()),
+        )
+
+    def _row_to_tuple(self, cur: sqlite3.Cursor, row: Tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, meta_type, metadata = row
+        writes = cur.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((meta_type, metadata)),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((wtype, value)))
+                for task_id, channel, wtype, value in writes
+            ],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+        )
+
+    def _prune(self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str) -> None:
+        """เก็บเฉพาะ checkpoint ล่าสุด keep_last ตัว (id ของ langgraph เรียงตามเวลา)"""
+        if self.keep_last <= 0:
+            return
+        row = cur.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_last - 1),
+        ).fetchone()
+        if not row:
+            return
+        for table in ("writes", "checkpoints"):
+            cur.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, row[0]),
+            )
+
+    # --- Sync API ---
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, meta_type, metadata"
+        with self._lock:
+            cur = self.conn.cursor()
+            if checkpoint_id := get_checkpoint_id(config):
+                row = cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._row_to_tuple(cur, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, meta_type, metadata FROM checkpoints"
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            cur = self.conn.cursor()
+            rows = cur.execute(query, params).fetchall()
+            results = []
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                tup = self._row_to_tuple(cur, row)
+                if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(tup)
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        meta_type, meta_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id, checkpoint_ns, checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_, blob, meta_type, meta_blob,
+                    ),
+                )
+                self._touch(cur, thread_id)
+                self._prune(cur, thread_id, checkpoint_ns)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        self._maybe_evict()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        special, regular = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            row = (
+                thread_id, checkpoint_ns, checkpoint_id, task_id,
+                WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path,
+            )
+            (special if channel in WRITES_IDX_MAP else regular).append(row)
+        # write พิเศษ (error/interrupt) เขียนทับได้, write ปกติเขียนครั้งเดียว
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+            self.conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            for table in ("writes", "checkpoints", "threads"):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            cur.execute("COMMIT")
+
+    # --- Eviction / Footprint ---
+    def _maybe_evict(self) -> None:
+        now = time.monotonic()
+        if self.ttl_seconds > 0 and now - self._last_evict >= self.evict_interval:
+            self._last_evict = now
+            self.evict_idle()
+
+    def evict_idle(self, ttl_seconds: Optional[float] = None) -> int:
+        """ลบ thread ที่ไม่ถูกใช้งานนานกว่า TTL คืนจำนวน thread ที่ลบ"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        cutoff = time.time() - ttl
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            stale = "SELECT thread_id FROM threads WHERE last_access < ?"
+            cur.execute(f"DELETE FROM writes WHERE thread_id IN ({stale})", (cutoff,))
+            cur.execute(f"DELETE FROM checkpoints WHERE thread_id IN ({stale})", (cutoff,))
+            evicted = cur.execute("DELETE FROM threads WHERE last_access < ?", (cutoff,)).rowcount
+            cur.execute("COMMIT")
+        return evicted
+
+    def footprint(self) -> Dict[str, Any]:
+        with self._lock:
+            cur = self.conn.cursor()
+            threads = cur.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints, checkpoint_bytes = cur.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints"
+            ).fetchone()
+            writes, write_bytes = cur.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM writes"
+            ).fetchone()
+        disk = sum(
+            os.path.getsize(self.path + suffix)
+            for suffix in ("", "-wal", "-shm")
+            if os.path.exists(self.path + suffix)
+        )
+        return {
+            "backend": "sqlite",
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "writes": writes,
+            "payload_bytes": checkpoint_bytes + write_bytes,
+            "disk_bytes": disk,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    # --- Async API (sqlite3 เป็น blocking I/O จึงย้ายไปรันใน thread) ---
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def memory_footprint(saver: MemorySaver) -> Dict[str, Any]:
+    """ขนาด payload ที่ MemorySaver ถือไว้ใน RAM (ไม่รวม overhead ของ dict)"""
+    checkpoints = sum(len(ids) for nss in saver.storage.values() for ids in nss.values())
+    payload = sum(
+        len(checkpoint[1]) + len(metadata[1])
+        for nss in saver.storage.values()
+        for ids in nss.values()
+        for checkpoint, metadata, _ in ids.values()
+    )
+    payload += sum(len(value[1]) for value in saver.blobs.values())
+    payload += sum(len(w[2][1]) for writes in saver.writes.values() for w in writes.values())
+    return {
+        "backend": "memory",
+        "threads": len(saver.storage),
+        "checkpoints": checkpoints,
+        "writes": sum(len(w) for w in saver.writes.values()),
+        "payload_bytes": payload,
+        "disk_bytes": 0,
+    }
+
+
+def footprint(saver: BaseCheckpointSaver) -> Dict[str, Any]:
+    if isinstance(saver, SqliteSaver):
+        return saver.footprint()
+    if isinstance(saver, MemorySaver):
+        return memory_footprint(saver)
+    return {"backend": type(saver).__name__}
+
+
+def make_checkpointer(backend: str = None) -> BaseCheckpointSaver:
+    backend = (backend or settings.CHECKPOINTER).lower()
+    if backend == "memory":
+        return MemorySaver()
+    if backend == "sqlite":
+        return SqliteSaver(
+            settings.CHECKPOINT_DB,
+            ttl_seconds=settings.CHECKPOINT_TTL_SECONDS,
+            keep_last=settings.CHECKPOINT_KEEP_LAST,
+        )
+    raise ValueError(f"Unknown checkpointer backend: {backend}")
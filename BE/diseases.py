@@ -0,0 +1,57 @@
+# diseases.py
+"""
+คำศัพท์ประจำโรคที่ระบบรองรับ (ตรงกับชุด tools ใน tools.py: diabetes / bp / hyperlipidemia)
+ใช้ทั้งแปลงชื่อโรคใน user_context เป็น key มาตรฐาน และจับคำถามที่พูดถึงโรคของคนไข้เอง
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+
+DISEASES: Dict[str, Dict[str, List[str]]] = {
+    "diabetes": {
+        "aliases": ["เบาหวาน", "diabetes", "diabetic"],
+        "vocab": [
+            "น้ำตาลในเลือด", "น้ำตาลตก", "น้ำตาลสูง", "ระดับน้ำตาล", "เจาะน้ำตาล", "เช็กน้ำตาล",
+            "อินซูลิน", "insulin", "metformin", "เมทฟอร์มิน", "เมตฟอร์มิน", "glipizide", "hypoglycemia", "hba1c",
+        ],
+    },
+    "bp": {
+        "aliases": ["ความดันสูง", "ความดันโลหิตสูง", "ความดัน", "hypertension", "high blood pressure", "blood pressure"],
+        "vocab": [
+            "ยาลดความดัน", "วัดความดัน", "amlodipine", "แอมโลดิปีน", "enalapril", "hctz",
+            "ยาขับปัสสาวะ", "หน้ามืดเมื่อลุก",
+        ],
+    },
+    "hyperlipidemia": {
+        "aliases": ["ไขมันในเลือดสูง", "ไขมันในเลือด", "ไขมันสูง", "hyperlipidemia", "dyslipidemia", "high cholesterol"],
+        "vocab": [
+            "คอเลสเตอรอล", "cholesterol", "ไตรกลีเซอไรด์", "triglyceride", "สแตติน", "statin",
+            "simvastatin", "atorvastatin", "gemfibrozil", "ezetimibe", "ldl", "hdl",
+        ],
+    },
+}
+
+def compile_terms(terms: Iterable[str]) -> re.Pattern:
+    """Thai = substring (ไม่มีช่องว่างระหว่างคำ), Latin = ต้องเป็นคำเต็ม"""
+    parts = []
+    for term in sorted(set(terms), key=len, reverse=True):
+        escaped = re.escape(term.lower())
+        parts.append(rf"\b{escaped}\b" if term.isascii() else escaped)
+    return re.compile("|".join(parts))
+
+_ALIAS_PATTERNS = {key: compile_terms(d["aliases"]) for key, d in DISEASES.items()}
+_VOCAB_PATTERNS = {key: compile_terms(d["aliases"] + d["vocab"]) for key, d in DISEASES.items()}
+
+def canonical_disease(name: Optional[str]) -> Optional[str]:
+    """แปลงชื่อโรคจาก user_context (ไทย/อังกฤษ) เป็น key ใน DISEASES, ไม่รู้จักคืน None"""
+    if not name:
+        return None
+    text = str(name).strip().lower()
+    for key, pattern in _ALIAS_PATTERNS.items():
+        if pattern.search(text):
+            return key
+    return None
+
+def mentions_disease(text: str, key: str) -> bool:
+    """ข้อความพูดถึงโรค `key` (ชื่อโรค ยา หรือค่าตรวจเฉพาะโรค) หรือไม่"""
+    pattern = _VOCAB_PATTERNS.get(key)
+    return bool(pattern and pattern.search(text.lower()))
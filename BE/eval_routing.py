@@ -0,0 +1,116 @@
+# eval_routing.py
+"""
+Compare topic check and router accuracy / latency across model tiers and router
+output modes on the labelled sets in evals/ (topic_cases.jsonl, routing_cases.jsonl).
+
+    python eval_routing.py                          # tiers small, large and auto
+    python eval_routing.py --tiers small,auto --concurrency 8
+    python eval_routing.py --tiers auto --modes fast,reasoning
+
+Routing cases with "replies" are later supervisor hops: those agent answers are
+already in the history and "next" is the expected pick (another agent or FINISH).
+
+Tiers: "small" / "large" (or any model name) call only that model; "auto" is
+what the server runs: the tier from settings.LLM_NODE_MODELS with escalation to
+the large model on parse failures and low confidence. Needs OPENAI_API_KEY
+(LLM_PROVIDER=fake only checks that the script runs).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import metrics
+from metrics import percentile
+import settings
+from eval_topic import load_cases
+from supervise import router_chain, topic_chain
+from usage import tracker as usage_tracker
+
+ROUTING_FILE = os.path.join(os.path.dirname(__file__), "evals", "routing_cases.jsonl")
+
+
+async def timed_calls(chain, inputs: list, concurrency: int, callbacks: list = None) -> list:
+    """[(ผลลัพธ์หรือ exception, วินาที)] ตามลำดับ input"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(payload):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await chain.ainvoke(payload, config={"callbacks": callbacks or []})
+            except Exception as exc:
+                result = exc
+            return result, time.perf_counter() - start
+
+    return await asyncio.gather(*(call(p) for p in inputs))
+
+
+def routing_input(case: dict) -> dict:
+    replies = [AIMessage(content=text) for text in case.get("replies", [])]
+    return {"messages": [HumanMessage(content=case["text"])] + replies}
+
+
+def expected_next(case: dict) -> str:
+    return case.get("next") or case["agents"][0]
+
+
+def summarize(name: str, correct: list, latencies: list, failures: int) -> str:
+    return (
+        f"{name:<16} accuracy={sum(correct) / len(correct):6.1%}  "
+        f"p50={percentile(latencies, 50) * 1000:5.0f}ms  p95={percentile(latencies, 95) * 1000:5.0f}ms  "
+        f"mean={statistics.mean(latencies) * 1000:5.0f}ms  failures={failures}"
+    )
+
+
+async def evaluate_topic(tier: str, cases: list, concurrency: int):
+    inputs = [{"messages": [HumanMessage(content=c["text"])], "allowed_disease": c["disease"]} for c in cases]
+    results = await timed_calls(topic_chain(None if tier == "auto" else tier), inputs, concurrency)
+    correct = [not isinstance(r, Exception) and r.decision == c["label"] for (r, _), c in zip(results, cases)]
+    print(f"[{tier}]")
+    print("  " + summarize("topic", correct, [t for _, t in results], sum(isinstance(r, Exception) for r, _ in results)))
+
+
+async def evaluate_router(tier: str, mode: str, cases: list, concurrency: int):
+    escalations_before = metrics.total("llm_escalations")
+    output_before = metrics.total("llm_output_tokens")
+    chain = router_chain(None if tier == "auto" else tier, mode)
+    results = await timed_calls(chain, [routing_input(c) for c in cases], concurrency, callbacks=[usage_tracker])
+    next_correct, plan_correct = [], []
+    for (result, _), case in zip(results, cases):
+        ok = not isinstance(result, Exception)
+        next_correct.append(ok and result.next == expected_next(case))
+        plan_correct.append(ok and (result.next == "FINISH" or list(dict.fromkeys([result.next] + result.plan)) == case["agents"]))
+
+    print("  " + summarize(f"router/{mode}", next_correct, [t for _, t in results], sum(isinstance(r, Exception) for r, _ in results)))
+    print(f"  {'':<17}plan exact match={sum(plan_correct) / len(plan_correct):.1%}  "
+          f"output tokens/call={(metrics.total('llm_output_tokens') - output_before) / len(cases):.0f}  "
+          f"escalations={metrics.total('llm_escalations') - escalations_before:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Routing accuracy / latency per model tier")
+    parser.add_argument("--tiers", default="small,large,auto")
+    parser.add_argument("--modes", default=settings.ROUTER_MODE, help="router output modes, e.g. fast,reasoning")
+    parser.add_argument("--routing-cases", default=ROUTING_FILE)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    topic_cases = load_cases()
+    routing_cases = load_cases(args.routing_cases)
+    print(f"topic cases={len(topic_cases)}  routing cases={len(routing_cases)}")
+
+    async def run():
+        for tier in args.tiers.split(","):
+            await evaluate_topic(tier.strip(), topic_cases, args.concurrency)
+            for mode in args.modes.split(","):
+                await evaluate_router(tier.strip(), mode.strip(), routing_cases, args.concurrency)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
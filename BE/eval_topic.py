@@ -0,0 +1,75 @@
+# eval_topic.py
+"""
+Evaluate the topic fast-path (topic_filter.py) against the labelled set in
+evals/topic_cases.jsonl.
+
+    python eval_topic.py            # fast-path only, no API key needed
+    python eval_topic.py --llm      # also send the undecided cases to topic_check_chain
+
+Exits with status 1 when the fast-path accuracy on the cases it decided drops
+below --min-accuracy, so it can guard lexicon changes in CI.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from topic_filter import classify
+
+CASES_FILE = os.path.join(os.path.dirname(__file__), "evals", "topic_cases.jsonl")
+
+
+def load_cases(path: str = CASES_FILE) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def llm_decisions(cases: list) -> list:
+    from langchain_core.messages import HumanMessage
+    from supervise import topic_check_chain
+
+    inputs = [
+        {"messages": [HumanMessage(content=c["text"])], "allowed_disease": c["disease"]}
+        for c in cases
+    ]
+    results = await topic_check_chain.abatch(inputs, config={"max_concurrency": 8})
+    return [r.decision for r in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Topic fast-path accuracy / hit rate")
+    parser.add_argument("--cases", default=CASES_FILE)
+    parser.add_argument("--llm", action="store_true", help="run undecided cases through the LLM")
+    parser.add_argument("--min-accuracy", type=float, default=1.0)
+    args = parser.parse_args()
+
+    cases = load_cases(args.cases)
+    decided, undecided, errors = [], [], []
+    for case in cases:
+        decision = classify(case["text"], case["disease"])
+        if decision is None:
+            undecided.append(case)
+            continue
+        decided.append(case)
+        if decision != case["label"]:
+            errors.append((case, decision))
+
+    hit_rate = len(decided) / len(cases)
+    accuracy = 1 - len(errors) / len(decided) if decided else 1.0
+    print(f"cases={len(cases)}  fast-path hits={len(decided)} ({hit_rate:.0%})  accuracy on hits={accuracy:.1%}")
+    for case, decision in errors:
+        print(f"  ❌ [{case['disease']}] {case['text']!r}: expected {case['label']}, got {decision}")
+
+    if args.llm and undecided:
+        llm_labels = asyncio.run(llm_decisions(undecided))
+        llm_correct = sum(1 for c, d in zip(undecided, llm_labels) if d == c["label"])
+        overall = (len(decided) - len(errors) + llm_correct) / len(cases)
+        print(f"LLM on fall-through={llm_correct}/{len(undecided)}  overall accuracy={overall:.1%}")
+
+    if accuracy < args.min_accuracy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
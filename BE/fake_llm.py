@@ -0,0 +1,195 @@
+# fake_llm.py
+"""
+Deterministic offline chat model (LLM_PROVIDER=fake) for benchmarks, load tests
+and running the graph without an API key.
+
+- Structured output goes through the normal tool-calling path
+  (BaseChatModel.with_structured_output), so topic, router and fan-out router
+  calls (fast and reasoning schemas) hit callbacks and usage tracking like real calls:
+    TopicClassifier -> topic_filter.classify, anything undecided is on_topic
+    Router / FanOutRouter -> keyword routing in question order (ROUTES)
+- Agents with tools call the first bound tool once per turn, then answer.
+- Every call waits `latency` seconds; streamed answers add `chunk_delay` per chunk.
+- usage_metadata is filled in from tokens.py counts, with a simulated provider
+  prompt cache (prefixes of 1024+ tokens seen before count as cache reads).
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from tokens import content_text, count_text, count_tokens
+from topic_filter import classify
+
+# agent -> คำที่ใช้เลือก (เรียงตามตำแหน่งที่เจอในคำถาม)
+ROUTES = {
+    "AppointmentAgent": ["นัด", "appointment", "หมอ"],
+    "MedicationAgent": ["ยา", "อินซูลิน", "insulin", "medicine"],
+    "DietAgent": ["อาหาร", "กิน", "ทุเรียน", "ผลไม้", "diet", "eat"],
+    "ExerciseAgent": ["ออกกำลัง", "วิ่ง", "exercise", "เหนื่อย"],
+    "TransportAgent": ["เดินทาง", "เครื่องบิน", "ขับรถ", "travel", "flight"],
+}
+
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK = 128
+CHUNK_CHARS = 6
+
+_seen_prefixes = set()
+_seen_lock = threading.Lock()
+
+def route_keywords(text: str) -> List[str]:
+    text = text.lower()
+    found = []
+    for agent, words in ROUTES.items():
+        positions = [text.find(w) for w in words if w in text]
+        if positions:
+            found.append((min(positions), agent))
+    return [agent for _, agent in sorted(found)] or ["GeneralChatAgent"]
+
+def _last_human(messages: List[BaseMessage]) -> int:
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return i
+    return -1
+
+def _patient_disease(messages: List[BaseMessage]) -> Optional[str]:
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            match = re.search(r"Patient has: \*\*(.+?)\*\*", content_text(message.content))
+            if match:
+                return match.group(1)
+    return None
+
+def _default_args(parameters: Dict[str, Any], text: str) -> Dict[str, Any]:
+    args = {}
+    for name, prop in parameters.get("properties", {}).items():
+        if prop.get("type") == "array":
+            args[name] = []
+        elif "enum" in prop:
+            args[name] = prop["enum"][0]
+        else:
+            args[name] = text
+    return args
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.0
+    chunk_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"latency": self.latency}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], tool_choice=tool_choice, **kwargs)
+
+    # --- Response ---
+    def _structured_args(self, name: str, parameters: Dict, messages: List[BaseMessage]) -> Dict[str, Any]:
+        args = self._schema_args(name, parameters, messages)
+        # ตอบเฉพาะ field ที่ schema มี (fast router ไม่มี reasoning)
+        properties = parameters.get("properties")
+        return {k: v for k, v in args.items() if k in properties} if properties else args
+
+    def _schema_args(self, name: str, parameters: Dict, messages: List[BaseMessage]) -> Dict[str, Any]:
+        start = _last_human(messages)
+        question = content_text(messages[start].content) if start >= 0 else ""
+        if name == "TopicClassifier":
+            return {"decision": classify(question, _patient_disease(messages)) or "on_topic"}
+        if name.endswith("FanOutRouter"):
+            return {"reasoning": "keyword routing", "agents": route_keywords(question)}
+        if name.endswith("Router"):
+            plan = route_keywords(question)
+            answered = sum(1 for m in messages[start + 1:] if isinstance(m, AIMessage) and m.content and not m.tool_calls)
+            next_agent = plan[answered] if answered < len(plan) else "FINISH"
+            return {"reasoning": "keyword routing", "next": next_agent, "plan": plan}
+        return _default_args(parameters, question)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict]], tool_choice) -> AIMessage:
+        start = _last_human(messages)
+        question = content_text(messages[start].content) if start >= 0 else ""
+        tool_results = [m for m in messages[start + 1:] if isinstance(m, ToolMessage)]
+        if tools and (tool_choice or not tool_results):
+            function = tools[0]["function"]
+            args = (
+                self._structured_args(function["name"], function.get("parameters", {}), messages)
+                if tool_choice else _default_args(function.get("parameters", {}), question)
+            )
+            call = {"name": function["name"], "args": args, "id": f"call_{abs(hash((question, function['name']))) % 10**8}"}
+            return AIMessage(content="", tool_calls=[call])
+        text = f"รับทราบครับ เรื่อง \"{question[:40]}\""
+        if tool_results:
+            first_line = content_text(tool_results[-1].content).strip().splitlines()[0]
+            text += f" จากข้อมูล {first_line}"
+        return AIMessage(content=text + " มีอะไรสอบถามเพิ่มเติมไหมครับ?")
+
+    def _usage(self, messages: List[BaseMessage], tools: Optional[List[Dict]], reply: AIMessage) -> Dict[str, Any]:
+        tools_text = json.dumps(tools or [], ensure_ascii=False)
+        prefix = content_text(messages[0].content) + tools_text if messages else tools_text
+        prefix_tokens = count_text(prefix)
+        with _seen_lock:
+            hit = prefix in _seen_prefixes
+            _seen_prefixes.add(prefix)
+        cached = (prefix_tokens // CACHE_BLOCK) * CACHE_BLOCK if hit and prefix_tokens >= CACHE_MIN_TOKENS else 0
+        input_tokens = count_tokens(messages) + count_text(tools_text)
+        output_tokens = count_text(reply.content) + sum(count_text(json.dumps(c["args"], ensure_ascii=False)) for c in reply.tool_calls)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached},
+        }
+
+    def _reply(self, messages, tools, tool_choice) -> AIMessage:
+        reply = self._respond(messages, tools, tool_choice)
+        reply.usage_metadata = self._usage(messages, tools, reply)
+        return reply
+
+    # --- BaseChatModel ---
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, tool_choice=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, tools, tool_choice))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, tool_choice=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, tools, tool_choice))])
+
+    def _chunks(self, reply: AIMessage) -> List[AIMessageChunk]:
+        if reply.tool_calls:
+            call = reply.tool_calls[0]
+            return [AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False), "id": call["id"], "index": 0,
+            }])]
+        text = reply.content
+        return [AIMessageChunk(content=text[i:i + CHUNK_CHARS]) for i in range(0, len(text), CHUNK_CHARS)]
+
+    def _stream(self, messages, stop=None, run_manager=None, tools=None, tool_choice=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        reply = self._reply(messages, tools, tool_choice)
+        for chunk in self._chunks(reply):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=reply.usage_metadata))
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, tool_choice=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        reply = self._reply(messages, tools, tool_choice)
+        for chunk in self._chunks(reply):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=reply.usage_metadata))
@@ -1,14 +1,44 @@
 # graph.py
+import asyncio
+from contextlib import suppress
 from functools import partial
+from typing import Annotated, Dict, List, Optional
 from langgraph.graph import StateGraph, END, START
-from langchain_core.messages import HumanMessage, AIMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Send
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 
-from agent import AgentState, agent_runnables
-from supervise import topic_check_chain, supervisor_chain
+from agent import AgentState, agent_specs, get_agent
+from supervise import get_chain
+from topic_filter import prefilter_topic
+from checkpointer import make_checkpointer
+from history import fold_history, window_for
+import metrics
+import settings
+
+# --- State ---
+def merge_replies(left: Optional[Dict], right: Optional[Dict]) -> Dict:
+    """รวมคำตอบจาก agent ที่รันขนานกัน, ส่ง None เพื่อล้างค่าหลัง merge"""
+    if right is None:
+        return {}
+    return {**(left or {}), **right}
+
+def add_or_reset(left: Optional[List], right: Optional[List]) -> List:
+    """ต่อท้ายรายการ, ส่ง None เพื่อเริ่ม turn ใหม่"""
+    if right is None:
+        return []
+    return (left or []) + right
+
+class GraphState(AgentState):
+    # Completion tracking (รีเซ็ตทุก turn ที่ check_alert)
+    plan: List[str]                                    # agent ที่ router วางแผนไว้สำหรับ turn นี้
+    answered: Annotated[List[str], add_or_reset]       # agent ที่ตอบแล้วใน turn นี้
+    hops: int                                          # จำนวนครั้งที่ส่งงานให้ agent ใน turn นี้
+    fanout_replies: Annotated[Dict[str, List[BaseMessage]], merge_replies]
 
 # --- 1. Alert Check ---
-def check_alert_node(state: AgentState):
+def check_alert_node(state: GraphState):
+    turn_reset = {"plan": [], "answered": None, "hops": 0}
     ctx = state.get("user_context", {})
     alert_status = str(ctx.get("is_alert", "Negative")).strip().lower()
     
@@ -19,76 +49,211 @@ def check_alert_node(state: AgentState):
             "กรุณาไปพบแพทย์โดยด่วน สามารถตรวจสอบนัดหมายได้ที่ yyy.com"
         )
         return {
+            **turn_reset,
             "messages": [AIMessage(content=warning_msg)],
             "next": "END"
         }
     
-    return {"next": "topic"}
+    return {**turn_reset, "next": "topic"}
 
 # --- 2. Topic Check ---
-def topic_node(state: AgentState):
+def off_topic_reply(user_disease: str):
+    msg = f"ขออภัยครับ หมอขออนุญาตให้คำแนะนำเฉพาะเรื่อง **{user_disease}** เพื่อความปลอดภัยนะครับ"
+    return {
+        "messages": [AIMessage(content=msg)],
+        "next": "END"
+    }
+
+async def check_topic(last_message, user_disease: str, config: RunnableConfig) -> str:
+    res = await get_chain("topic_check_chain").ainvoke({
+        "messages": [last_message],
+        "allowed_disease": user_disease 
+    }, config)
+    return res.decision
+
+async def topic_node(state: GraphState, config: RunnableConfig, fanout: bool = False):
     ctx = state.get("user_context", {})
     user_disease = ctx.get("disease", "Unknown")
     last_message = state["messages"][-1]
     
-    res = topic_check_chain.invoke({
-        "messages": [last_message],
-        "allowed_disease": user_disease 
-    })
+    # Fast-path: กรณีชัดเจนตัดสินด้วย lexicon ไม่ต้องเรียก LLM
+    decision = prefilter_topic(last_message.content, user_disease) if settings.TOPIC_FASTPATH else None
+    if decision is None:
+        if settings.SPECULATIVE_ROUTING in ("router", "agent"):
+            return await speculative_topic(state, config, last_message, user_disease, fanout)
+        decision = await check_topic(last_message, user_disease, config)
     
-    if res.decision == "off_topic":
-        msg = f"ขออภัยครับ หมอขออนุญาตให้คำแนะนำเฉพาะเรื่อง **{user_disease}** เพื่อความปลอดภัยนะครับ"
-        return {
-            "messages": [AIMessage(content=msg)],
-            "next": "END"
-        }
+    if decision == "off_topic":
+        return off_topic_reply(user_disease)
     
     return {"next": "supervisor"}
 
+async def speculate(state: GraphState, config: RunnableConfig, mode: str, progress: dict, fanout: bool):
+    """Route (และตอบ ถ้า mode = agent) ล่วงหน้าระหว่างรอ topic check"""
+    if fanout:
+        # หลาย agent จะถูกส่งผ่าน Send ตามปกติ จึงเดาล่วงหน้าได้แค่ขั้น router
+        plan = await plan_agents(window_for(state, "supervisor"), config)
+        progress["router"] = True
+        return {"next": plan, "plan": plan, "hops": 1}
+    update = await route(window_for(state, "supervisor"), config)
+    progress["router"] = True
+    destination = update["next"]
+    if mode != "agent" or destination not in agent_specs:
+        return update
+    reply = await run_agent_node(state, config, destination)
+    progress["agent"] = True
+    # ให้ supervisor ตัดสินต่อหลัง agent ตอบ เหมือนเส้นทางปกติ
+    return {**update, **reply, "next": "supervisor"}
+
+async def speculative_topic(state: GraphState, config: RunnableConfig, last_message, user_disease: str, fanout: bool):
+    mode = settings.SPECULATIVE_ROUTING
+    progress = {"router": False, "agent": False}
+    task = asyncio.create_task(speculate(state, config, mode, progress, fanout))
+    metrics.inc("speculative_runs", mode=mode)
+
+    try:
+        decision = await check_topic(last_message, user_disease, config)
+    except BaseException:
+        task.cancel()
+        raise
+
+    stages = ["router", "agent"] if mode == "agent" and not fanout else ["router"]
+    if decision == "off_topic":
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        for stage in stages:
+            # งานที่เสร็จแล้วถูกทิ้ง = wasted, ยังไม่เสร็จถูก cancel (เสียแค่บางส่วน)
+            metrics.inc("speculative_wasted" if progress[stage] else "speculative_cancelled", stage=stage)
+        return off_topic_reply(user_disease)
+
+    result = await task
+    for stage in stages:
+        if progress[stage]:
+            metrics.inc("speculative_saved", stage=stage)
+    return result
+
 # --- 3. Supervisor ---
-def supervisor_node(state: AgentState):
-    if not state['messages'] or not isinstance(state['messages'][-1], HumanMessage):
+async def route(messages, config: RunnableConfig, plan: List[str] = None, hops: int = 0) -> Dict:
+    """เรียก router แล้วคืน state update: agent ถัดไป + แผนของ turn นี้ (รวมกับแผนเดิม)"""
+    res = await get_chain("supervisor_chain").ainvoke({"messages": messages}, config)
+    if res.next == "FINISH":
+        return {"next": "FINISH"}
+    planned = (plan or []) + [res.next] + [name for name in res.plan if name != "FINISH"]
+    return {"next": res.next, "plan": list(dict.fromkeys(planned)), "hops": hops + 1}
+
+async def plan_agents(messages, config: RunnableConfig) -> List[str]:
+    res = await get_chain("fanout_supervisor_chain").ainvoke({"messages": messages}, config)
+    # ตัดตัวซ้ำแต่คงลำดับคำถามไว้ เพื่อให้ merge ได้ลำดับคงที่
+    return list(dict.fromkeys(res.agents))
+
+async def supervisor_node(state: GraphState, config: RunnableConfig, fanout: bool = False):
+    messages = state["messages"]
+    if not messages:
         return {"next": "END"}
+
+    answered = state.get("answered") or []
+    hops = state.get("hops") or 0
+
+    # Completion tracker: หลัง agent ตอบ ตัดสินจบ turn เองถ้าทำครบแผนแล้ว (ไม่ต้องเรียก LLM)
+    if not isinstance(messages[-1], HumanMessage):
+        if hops >= settings.MAX_AGENT_HOPS:
+            metrics.inc("turn_hop_limit_reached")
+            return {"next": "END"}
+        pending = [name for name in state.get("plan") or [] if name not in answered]
+        if not pending:
+            metrics.inc("supervisor_calls_skipped", reason="complete")
+            return {"next": "END"}
+    
+    history = window_for(state, "supervisor")
+    if fanout:
+        plan = await plan_agents(history, config)
+        return {"next": plan, "plan": plan, "hops": hops + 1}
         
-    res = supervisor_chain.invoke({"messages": state["messages"]})
-    return {"next": res.next}
+    update = await route(history, config, state.get("plan"), hops)
+    if update["next"] in answered:
+        # router วนกลับไป agent ที่ตอบแล้วใน turn นี้ ถือว่าจบ
+        metrics.inc("supervisor_repeat_stopped")
+        return {"next": "END"}
+    return update
 
 # Helper to run agents
-def run_agent_node(state: AgentState, agent_name: str):
-    result = agent_runnables[agent_name].invoke(state)
-    return {"messages": result["messages"]}
+async def run_agent_node(state: AgentState, config: RunnableConfig, agent_name: str):
+    agent = get_agent(agent_name, state.get("user_context", {}).get("disease"))
+    result = await agent.ainvoke(state, config=config)
+    # subgraph คืน history ทั้งหมด ส่งกลับเฉพาะข้อความใหม่ (กัน history ซ้ำเมื่อ reducer ต่อท้าย)
+    return {"messages": result["messages"][len(state["messages"]):], "answered": [agent_name]}
 
-# --- Assembly ---
-graph = StateGraph(AgentState)
+async def run_fanout_agent_node(state: AgentState, config: RunnableConfig, agent_name: str):
+    reply = await run_agent_node(state, config, agent_name)
+    return {"fanout_replies": {agent_name: reply["messages"]}, "answered": [agent_name]}
 
-graph.add_node("check_alert", check_alert_node)
-graph.add_node("topic", topic_node)
-graph.add_node("supervisor", supervisor_node)
+# --- 4. Merge (fan-out) ---
+def merge_node(state: GraphState):
+    replies = state.get("fanout_replies") or {}
+    plan = state.get("plan") or list(replies)
+    messages = [msg for name in plan for msg in replies.get(name, [])]
+    return {"messages": messages, "fanout_replies": None}
 
-# Dynamic Agent Node Creation
-for name in agent_runnables:
-    graph.add_node(name, partial(run_agent_node, agent_name=name))
-    graph.add_edge(name, "supervisor")
-
-# Set Entry Point
-graph.add_edge(START, "check_alert")
+# --- 5. History Summary ---
+async def summarize_node(state: GraphState, config: RunnableConfig):
+    # ท้าย turn: พับ turn เก่าเข้า rolling summary (เรียก LLM เฉพาะเมื่อเกิน trigger)
+    return await fold_history(state, config)
 
 # Conditional Edges
 def route_after_alert(x):
     return END if x.get("next") == "END" else "topic"
 
-def route_after_topic(x):
-    return END if x.get("next") == "END" else "supervisor"
+def dispatch(x):
+    """ส่งไปหลาย agent พร้อมกัน (fan-out) หรือ agent เดียวแบบเดิม"""
+    destination = x.get("next")
+    if isinstance(destination, list):
+        sends = [Send(name, x) for name in destination if name in agent_specs]
+        return sends or "summarize"
+    if destination == "FINISH" or destination not in agent_specs:
+        return "summarize"
+    return destination
 
-def route_supervisor(x):
+def route_after_topic(x):
     destination = x.get("next")
-    if destination == "FINISH" or destination not in agent_runnables:
+    if destination == "END":
         return END
-    return destination
+    # Speculative mode อาจ route ไป agent (หรือกลับ supervisor หลัง agent ตอบ) ได้เลย
+    if destination == "supervisor":
+        return "supervisor"
+    return dispatch(x)
+
+# --- Assembly ---
+def build_graph(fanout: bool = None, checkpointer=None):
+    fanout = settings.ROUTER_FANOUT if fanout is None else fanout
+    graph = StateGraph(GraphState)
+
+    graph.add_node("check_alert", check_alert_node)
+    graph.add_node("topic", partial(topic_node, fanout=fanout))
+    graph.add_node("supervisor", partial(supervisor_node, fanout=fanout))
+    graph.add_node("summarize", summarize_node)
+    graph.add_edge("summarize", END)
+
+    # Dynamic Agent Node Creation
+    for name in agent_specs:
+        if fanout:
+            graph.add_node(name, partial(run_fanout_agent_node, agent_name=name))
+            graph.add_edge(name, "merge")
+        else:
+            graph.add_node(name, partial(run_agent_node, agent_name=name))
+            graph.add_edge(name, "supervisor")
+
+    if fanout:
+        graph.add_node("merge", merge_node)
+        graph.add_edge("merge", "summarize")
+
+    # Set Entry Point
+    graph.add_edge(START, "check_alert")
+
+    graph.add_conditional_edges("check_alert", route_after_alert)
+    graph.add_conditional_edges("topic", route_after_topic)
+    graph.add_conditional_edges("supervisor", dispatch)
 
-graph.add_conditional_edges("check_alert", route_after_alert)
-graph.add_conditional_edges("topic", route_after_topic)
-graph.add_conditional_edges("supervisor", route_supervisor)
+    return graph.compile(checkpointer=checkpointer if checkpointer is not None else make_checkpointer())
 
-memory = MemorySaver()
-app = graph.compile(checkpointer=memory)
\ No newline at end of file
+app = build_graph()
@@ -0,0 +1,127 @@
+# history.py
+"""
+Token-budgeted conversation history.
+
+Each node type gets a token budget for the history it sends to the LLM. The
+current turn is always sent in full; earlier turns are added newest-first while
+they fit, and anything older is represented by a rolling summary kept in graph
+state (`summary`, covering `messages[:summarized_upto]`). The summary is folded
+forward incrementally at the end of a turn, only when the unsummarized tail grows
+past HISTORY_SUMMARY_TRIGGER.
+
+Windows are cut on HumanMessage boundaries so an AI tool call is never separated
+from its ToolMessage results.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
+
+from llm_config import get_llm, retrying
+from tokens import content_text, count_message, count_tokens
+import metrics
+import settings
+
+SUMMARY_PREFIX = "สรุปบทสนทนาก่อนหน้า:\n"
+
+BUDGETS = {
+    "supervisor": settings.HISTORY_BUDGET_SUPERVISOR,
+    "agent": settings.HISTORY_BUDGET_AGENT,
+}
+
+# --- Windowing ---
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """แบ่งเป็น turn โดยเริ่ม turn ใหม่ที่ HumanMessage"""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=SUMMARY_PREFIX + summary)
+
+def window_start(messages: List[BaseMessage], budget: int, summary: Optional[str] = None) -> int:
+    """index แรกที่ส่งแบบ verbatim: turn ล่าสุดครบเสมอ + turn ก่อนหน้าเท่าที่พอ budget"""
+    remaining = budget - (count_message(summary_message(summary)) if summary else 0)
+    # ไล่จากท้ายทีละ turn ไม่ต้องนับ token ของ history ทั้งก้อน
+    start = len(messages)
+    while start > 0:
+        turn_start = start - 1
+        while turn_start > 0 and not isinstance(messages[turn_start], HumanMessage):
+            turn_start -= 1
+        cost = count_tokens(messages[turn_start:start])
+        if start < len(messages) and cost > remaining:
+            break
+        remaining -= cost
+        start = turn_start
+    return start
+
+def window_for(state: Dict, node: str) -> List[BaseMessage]:
+    messages = state["messages"]
+    summary = state.get("summary")
+    start = window_start(messages, BUDGETS[node], summary)
+    if start == 0:
+        return list(messages)
+    metrics.inc("history_messages_trimmed", start, node=node)
+    return ([summary_message(summary)] if summary else []) + list(messages[start:])
+
+# --- Rolling Summary ---
+summary_prompt = (
+    "You maintain a running summary of a follow-up chat between a patient and a care team.\n"
+    "Merge the NEW MESSAGES into the CURRENT SUMMARY and return only the updated summary, in Thai.\n"
+    "Keep facts that matter for later turns: symptoms, medications and doses, diet and exercise advice given, "
+    "appointment changes, travel plans, and open questions. Drop greetings and repetition.\n"
+    "Stay under {max_tokens} tokens.\n\n"
+    "CURRENT SUMMARY:\n{summary}\n\n"
+    "NEW MESSAGES:\n{transcript}"
+)
+
+@lru_cache(maxsize=1)
+def summary_chain():
+    # สร้างตอนพับ history ครั้งแรก (หรือใน warmup) ไม่ใช่ตอน import
+    return retrying(ChatPromptTemplate.from_template(summary_prompt) | get_llm("summary") | StrOutputParser())
+
+def render_transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        text = content_text(message.content).strip()
+        if isinstance(message, HumanMessage):
+            lines.append(f"คนไข้: {text}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"[{message.name or 'tool'}]: {text}")
+        elif text:
+            lines.append(f"หมอ: {text}")
+    return "\n".join(lines)
+
+async def fold_history(state: Dict, config: RunnableConfig) -> Dict:
+    """พับ turn เก่าที่ยังไม่ถูกสรุปเข้า summary เมื่อส่วนที่ค้างเกิน trigger (ไม่งั้นไม่เรียก LLM)"""
+    messages = state.get("messages") or []
+    upto = state.get("summarized_upto") or 0
+    pending = messages[upto:]
+    remaining = count_tokens(pending)
+    if remaining <= settings.HISTORY_SUMMARY_TRIGGER:
+        return {}
+
+    turns = split_turns(pending)
+    folded = []
+    # turn ล่าสุดไม่ถูกพับ เพื่อให้ node ถัดไปยังเห็นข้อความจริง
+    while len(turns) > 1 and remaining > settings.HISTORY_SUMMARY_KEEP:
+        turn = turns.pop(0)
+        folded += turn
+        remaining -= count_tokens(turn)
+    if not folded:
+        return {}
+
+    summary = await summary_chain().ainvoke({
+        "summary": state.get("summary") or "(ยังไม่มี)",
+        "transcript": render_transcript(folded),
+        "max_tokens": settings.HISTORY_SUMMARY_MAX_TOKENS,
+    }, config)
+    metrics.inc("history_summaries")
+    metrics.inc("history_tokens_folded", count_tokens(folded))
+    return {"summary": summary.strip(), "summarized_upto": upto + len(folded)}
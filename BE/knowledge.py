@@ -0,0 +1,197 @@
+# knowledge.py
+"""
+Disease knowledge store: markdown files in KNOWLEDGE_DIR loaded into an in-memory
+BM25 index keyed by disease, domain and section.
+
+One file per disease key from diseases.py (e.g. knowledge/diabetes.md):
+
+    # <disease label, used in tool descriptions>
+    ## <domain>                 medication | exercise | diet | transport
+    <domain title>
+    ### <section title>
+    <section text>
+
+Thai is written without spaces, so text is segmented with pythainlp when it is
+installed and falls back to character bigrams otherwise. The directory is re-scanned
+at most every KNOWLEDGE_RELOAD_SECONDS; when a file changes the index is rebuilt and
+swapped in without restarting the process.
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+import settings
+
+try:
+    from pythainlp.tokenize import word_tokenize
+except ImportError:  # optional: ใช้ character bigram แทน
+    word_tokenize = None
+
+logger = logging.getLogger(__name__)
+
+DOMAINS = {
+    "medication": "medication details",
+    "exercise": "exercise",
+    "diet": "diet",
+    "transport": "transport/travel",
+}
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# --- Tokenizer ---
+_THAI = re.compile(r"[฀-๿]+")
+_WORDS = re.compile(r"[฀-๿]+|[a-z0-9]+(?:[./-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for run in _WORDS.findall(text.lower()):
+        if not _THAI.fullmatch(run):
+            tokens.append(run)
+        elif word_tokenize is not None:
+            tokens += [w for w in word_tokenize(run, engine="newmm", keep_whitespace=False) if w.strip()]
+        else:
+            tokens += [run[i:i + 2] for i in range(max(len(run) - 1, 1))]
+    return tokens
+
+# --- Index ---
+@dataclass(frozen=True)
+class Section:
+    disease: str
+    domain: str
+    title: str
+    text: str
+
+    def render(self) -> str:
+        return f"- **{self.title}**: " + self.text.replace("\n", "\n  ")
+
+class KnowledgeIndex:
+    def __init__(self, sections: List[Section], labels: Dict[str, str], titles: Dict[Tuple[str, str], str], version: int = 0):
+        self.sections = sections
+        self.labels = labels      # disease -> ชื่อโรคสำหรับ tool description
+        self.titles = titles      # (disease, domain) -> หัวข้อของ domain
+        self.version = version
+        self._scopes: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lengths: List[int] = []
+        for doc, section in enumerate(sections):
+            self._scopes[(section.disease, section.domain)].append(doc)
+            terms = Counter(tokenize(f"{section.title} {section.text}"))
+            for term, tf in terms.items():
+                self._postings[term][doc] = tf
+            self._lengths.append(sum(terms.values()))
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    def scope(self, disease: str, domain: str) -> List[Section]:
+        return [self.sections[doc] for doc in self._scopes.get((disease, domain), [])]
+
+    def search(self, disease: str, domain: str, query: str, k: int) -> List[Section]:
+        """BM25 เฉพาะ section ของ (disease, domain), คืนตามลำดับในไฟล์"""
+        scope = set(self._scopes.get((disease, domain), []))
+        n_docs = len(self.sections)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings.items():
+                if doc not in scope:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc] / self._avg_length)
+                scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        top = sorted(scores, key=lambda doc: (-scores[doc], doc))[:k]
+        return [self.sections[doc] for doc in sorted(top)]
+
+# --- Loading ---
+def parse(disease: str, text: str) -> Tuple[str, Dict[Tuple[str, str], str], List[Section]]:
+    label, titles, sections = disease, {}, []
+    domain, title, body = None, None, []
+
+    def flush():
+        if domain and title:
+            sections.append(Section(disease, domain, title, "\n".join(body).strip()))
+
+    for line in text.splitlines():
+        if line.startswith("### "):
+            flush()
+            title, body = line[4:].strip(), []
+        elif line.startswith("## "):
+            flush()
+            domain, title, body = line[3:].strip(), None, []
+        elif line.startswith("# "):
+            label = line[2:].strip()
+        elif title:
+            body.append(line)
+        elif domain and line.strip() and (disease, domain) not in titles:
+            titles[(disease, domain)] = line.strip()
+    flush()
+    return label, titles, sections
+
+def load(directory: str, version: int = 0) -> KnowledgeIndex:
+    labels, titles, sections = {}, {}, []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".md"):
+            continue
+        disease = name[:-3]
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            label, file_titles, file_sections = parse(disease, f.read())
+        labels[disease] = label
+        titles.update(file_titles)
+        sections += file_sections
+    return KnowledgeIndex(sections, labels, titles, version)
+
+def _fingerprint(directory: str) -> Tuple:
+    return tuple(sorted(
+        (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+        for entry in os.scandir(directory) if entry.name.endswith(".md")
+    ))
+
+_lock = threading.Lock()
+_index: Optional[KnowledgeIndex] = None
+_fingerprint_seen: Tuple = ()
+_checked_at = 0.0
+
+def current() -> KnowledgeIndex:
+    """index ปัจจุบัน, ตรวจ mtime ของไฟล์ไม่บ่อยกว่า KNOWLEDGE_RELOAD_SECONDS แล้วโหลดใหม่ถ้ามีการแก้ไข"""
+    global _index, _fingerprint_seen, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < settings.KNOWLEDGE_RELOAD_SECONDS:
+        return _index
+    with _lock:
+        if _index is not None and now - _checked_at < settings.KNOWLEDGE_RELOAD_SECONDS:
+            return _index
+        _checked_at = now
+        fingerprint = _fingerprint(settings.KNOWLEDGE_DIR)
+        if _index is None or fingerprint != _fingerprint_seen:
+            version = _index.version + 1 if _index is not None else 1
+            try:
+                _index = load(settings.KNOWLEDGE_DIR, version)
+                metrics.inc("knowledge_reloads")
+            except Exception:
+                if _index is None:
+                    raise
+                # ไฟล์แก้ไม่เสร็จ/ผิดรูปแบบ ใช้ index เดิมต่อ แล้วลองใหม่รอบหน้า
+                logger.exception("knowledge reload failed, keeping version %s", _index.version)
+                return _index
+            _fingerprint_seen = fingerprint
+        return _index
+
+def retrieve(disease: str, domain: str, query: str = "", k: int = None) -> str:
+    """section ที่เกี่ยวกับ query (ไม่ระบุ query หรือไม่ตรงเลย คืนทั้ง domain)"""
+    index = current()
+    title = index.titles.get((disease, domain))
+    if title is None:
+        return f"ไม่พบข้อมูล {domain} ของโรคนี้"
+    sections = index.search(disease, domain, query, k or settings.KNOWLEDGE_TOP_K) if query.strip() else []
+    metrics.inc("knowledge_retrievals", domain=domain, result="sections" if sections else "full")
+    if not sections:
+        sections = index.scope(disease, domain)
+    return f"{title}:\n" + "\n".join(section.render() for section in sections)
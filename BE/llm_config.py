@@ -1,13 +1,232 @@
 # llm_config.py
+"""
+LLM provider, built on first use (`from llm_config import llm` or get_llm(node)).
+
+LLM_PROVIDER=openai (default) needs OPENAI_API_KEY; LLM_PROVIDER=fake uses the
+deterministic offline model in fake_llm.py, so the graph can be imported,
+visualized and benchmarked without network access.
+
+All OpenAI models share one keep-alive connection pool (http_clients()). Each node
+("topic", "supervisor", "summary", "agent" or a specific agent name) gets a model
+from settings.LLM_NODE_MODELS (small/large tier, temperature, max_tokens) with the
+timeout from settings.LLM_TIMEOUTS on top of that pool. structured() builds the
+routing chains; on the small tier a parse failure or low confidence is re-asked on
+the large model.
+
+The SDK's own retries are off; chains wrap their calls with retrying() (exponential
+backoff with jitter on connection errors, timeouts, 429 and 5xx; every attempt holds
+an admission.llm_gate slot) and the short routing calls can be hedged() (a second
+identical request after LLM_HEDGE_AFTER_SECONDS, first answer wins).
+
+With LLM_CASSETTE set, the pool's transport records or replays every request
+(cassette.py), for offline end-to-end runs with regress.py.
+"""
+import asyncio
 import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+import threading
+from typing import Dict, Optional
+
+import httpx
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+import cassette
+import metrics
+import settings
+
+_llms: Dict[tuple, object] = {}
+_clients: Optional[tuple] = None
+_lock = threading.RLock()  # get_llm -> create_llm -> http_clients ซ้อนกัน
+
+# --- Connection Pool ---
+def http_clients() -> tuple:
+    """(httpx.Client, httpx.AsyncClient) ที่ทุก model ใช้ร่วมกัน"""
+    global _clients
+    if _clients is None:
+        with _lock:
+            if _clients is None:
+                limits = httpx.Limits(
+                    max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY,
+                )
+                # LLM_CASSETTE: บันทึก/เล่นซ้ำ traffic ผ่าน transport ของ cassette.py (limits อยู่ที่ transport)
+                sync_transport, async_transport = cassette.transports(limits)
+                _clients = (
+                    httpx.Client(limits=limits, transport=sync_transport),
+                    httpx.AsyncClient(limits=limits, transport=async_transport),
+                )
+    return _clients
+
+async def aclose_http_clients() -> None:
+    global _clients
+    if _clients is not None:
+        sync_client, async_client = _clients
+        _clients = None
+        sync_client.close()
+        await async_client.aclose()
+
+# --- Models ---
+def create_llm(provider: str = None, timeout: float = None, model: str = None,
+               temperature: float = None, max_tokens: int = None):
+    provider = (provider or settings.LLM_PROVIDER).strip().lower()
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        # replay ไม่ได้ต่อ API จริง ไม่ต้องมี key
+        api_key = os.getenv("OPENAI_API_KEY") or ("cassette-replay" if cassette.replaying() else None)
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in .env file.")
+        sync_client, async_client = http_clients()
+        return ChatOpenAI(
+            api_key=api_key,
+            model=model or settings.LLM_MODEL,
+            temperature=settings.LLM_TEMPERATURE if temperature is None else temperature,
+            max_tokens=max_tokens,
+            base_url=settings.LLM_BASE_URL or None,
+            timeout=httpx.Timeout(timeout or settings.LLM_TIMEOUTS["agent"], connect=settings.LLM_CONNECT_TIMEOUT),
+            max_retries=0,  # retry ที่ retrying() แทน จะได้ไม่ซ้อนกับ retry ของ SDK
+            http_client=sync_client,
+            http_async_client=async_client,
+        )
+    if provider == "fake":
+        from fake_llm import FakeChatModel
+        return FakeChatModel(latency=settings.FAKE_LLM_LATENCY, chunk_delay=settings.FAKE_LLM_CHUNK_DELAY)
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider!r} (expected 'openai' or 'fake')")
+
+def node_config(node: str) -> Dict:
+    """ค่าของ node จาก LLM_NODE_MODELS, agent ที่ไม่ได้ระบุเองใช้ค่าของ "agent" """
+    base = settings.LLM_NODE_MODELS["agent"] if node.endswith("Agent") else {}
+    return {"model": "large", **base, **settings.LLM_NODE_MODELS.get(node, {})}
+
+def model_name(tier: str) -> str:
+    return {"small": settings.LLM_MODEL_SMALL, "large": settings.LLM_MODEL}.get(tier, tier)
+
+def get_llm(node: str = "agent", tier: str = None):
+    """model ของ node สร้างครั้งแรกที่ถูกเรียก, tier ("small"/"large"/ชื่อ model) override ค่าใน settings"""
+    config = node_config(node)
+    timeout = settings.LLM_TIMEOUTS.get(node) or settings.LLM_TIMEOUTS["agent" if node.endswith("Agent") else "supervisor"]
+    # node ที่ตั้งค่าเหมือนกันใช้ model object เดียวกัน
+    key = (model_name(tier or config["model"]), config.get("temperature"), config.get("max_tokens"), timeout)
+    if key not in _llms:
+        with _lock:
+            if key not in _llms:
+                _llms[key] = create_llm(timeout=timeout, model=key[0], temperature=key[1], max_tokens=key[2])
+    return _llms[key]
+
+def __getattr__(name: str):
+    # `from llm_config import llm` สร้าง model ตอนถูกใช้ครั้งแรก ไม่ใช่ตอน import module นี้
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Retries ---
+def is_retryable(error: BaseException) -> bool:
+    import openai
+    # APIConnectionError รวม APITimeoutError
+    retry = isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, httpx.TransportError))
+    if retry:
+        metrics.inc("llm_retries", error=str(getattr(error, "status_code", "") or type(error).__name__))
+    return retry
+
+def gated(runnable: Runnable) -> Runnable:
+    """ถือ slot ของ admission.llm_gate ระหว่างเรียก LLM (จำกัด call ที่รันพร้อมกัน, alert ได้ก่อน)"""
+    from admission import llm_gate
+
+    async def ainvoke(inputs, config: RunnableConfig):
+        async with llm_gate.slot():
+            return await runnable.ainvoke(inputs, config)
+
+    return RunnableLambda(lambda inputs, config: runnable.invoke(inputs, config), afunc=ainvoke, name="gated")
+
+def retrying(runnable: Runnable) -> Runnable:
+    """retry + llm_gate ต่อครั้งที่เรียก (ไม่ถือ slot ระหว่างรอ backoff)"""
+    runnable = gated(runnable)
+    if settings.LLM_MAX_RETRIES <= 0:
+        return runnable
+    return runnable.with_retry(
+        retry_if_exception_type=is_retryable,
+        wait_exponential_jitter=True,
+        exponential_jitter_params={"initial": settings.LLM_RETRY_INITIAL, "max": settings.LLM_RETRY_MAX},
+        stop_after_attempt=settings.LLM_MAX_RETRIES + 1,
+    )
+
+# --- Model Tiers ---
+def parse_errors() -> tuple:
+    import openai
+    from langchain_core.exceptions import OutputParserException
+    # ValueError รวม pydantic ValidationError, LengthFinishReasonError = ถูกตัดที่ max_tokens
+    return OutputParserException, ValueError, openai.LengthFinishReasonError
+
+def confident(result) -> bool:
+    return result is not None and getattr(result, "confidence", 1.0) >= settings.LLM_ESCALATE_BELOW
+
+def escalating(fast: Runnable, strong: Runnable, name: str) -> Runnable:
+    """ลอง `fast` ก่อน ถ้า parse ไม่ได้หรือ confidence ต่ำ ถามซ้ำที่ `strong`"""
+    errors = parse_errors()
+
+    def invoke(inputs, config: RunnableConfig):
+        try:
+            result = fast.invoke(inputs, config)
+            reason = None if confident(result) else "low_confidence"
+        except errors:
+            reason = "parse"
+        if reason is None:
+            return result
+        metrics.inc("llm_escalations", chain=name, reason=reason)
+        return strong.invoke(inputs, config)
+
+    async def ainvoke(inputs, config: RunnableConfig):
+        try:
+            result = await fast.ainvoke(inputs, config)
+            reason = None if confident(result) else "low_confidence"
+        except errors:
+            reason = "parse"
+        if reason is None:
+            return result
+        metrics.inc("llm_escalations", chain=name, reason=reason)
+        return await strong.ainvoke(inputs, config)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"escalating_{name}")
+
+def structured(prompt: Runnable, schema, node: str, tier: str = None) -> Runnable:
+    """
+    prompt | model ของ node แบบ structured output (retry ในตัว)
+    tier=None ใช้ model ตาม settings และ escalate ไป model ใหญ่ได้, ระบุ tier = ใช้ model นั้นอย่างเดียว (eval)
+    """
+    def chain(t: str) -> Runnable:
+        return retrying(prompt | get_llm(node, t).with_structured_output(schema))
+
+    if tier:
+        return chain(tier)
+    tier = node_config(node)["model"]
+    if not settings.LLM_ESCALATION or model_name(tier) == model_name("large"):
+        return chain(tier)
+    return escalating(chain(tier), chain("large"), node)
 
-load_dotenv()
+# --- Hedging ---
+def hedged(runnable: Runnable, name: str, after: float = None) -> Runnable:
+    """ส่ง request ซ้ำถ้ายังไม่ได้คำตอบภายใน `after` วินาที ใช้คำตอบที่มาก่อนแล้ว cancel อีกอัน"""
+    after = settings.LLM_HEDGE_AFTER_SECONDS if after is None else after
+    if after <= 0:
+        return runnable
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found in .env file.")
+    async def ainvoke(inputs, config: RunnableConfig):
+        primary = asyncio.create_task(runnable.ainvoke(inputs, config))
+        done, _ = await asyncio.wait({primary}, timeout=after)
+        if done:
+            return primary.result()
+        metrics.inc("llm_hedges_sent", chain=name)
+        backup = asyncio.create_task(runnable.ainvoke(inputs, config))
+        pending = {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # อันที่ error ไม่นับ รออีกอัน (ถ้าพังทั้งคู่ ส่ง error ของอันสุดท้ายออกไป)
+                    if task.exception() is None or not pending:
+                        metrics.inc("llm_hedges_won", chain=name, winner="backup" if task is backup else "primary")
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0.1)
-# llm = ChatOpenAI(model="gpt-5.2")
\ No newline at end of file
+    return RunnableLambda(lambda inputs, config: runnable.invoke(inputs, config), afunc=ainvoke, name=f"hedged_{name}")
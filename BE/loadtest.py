@@ -0,0 +1,169 @@
+# loadtest.py
+"""
+Load test for /chat with N concurrent simulated patients.
+
+    LLM_PROVIDER=fake uvicorn main:app --workers 1
+    python loadtest.py --url http://127.0.0.1:8000 --patients 50 --turns 3
+
+or without a separate server (main.app on uvicorn inside this process, on a free
+local port, with the fake model):
+
+    python loadtest.py --inprocess --patients 50 --turns 3
+
+In-process mode still streams over a real socket, so time to first SSE event is
+measured the same way. The client shares the event loop and CPU with the server.
+
+Each patient has its own thread_id and context (diseases and risk flags rotate)
+and sends --turns questions one after another. Reports p50/p95/p99 turn latency,
+time to first SSE event, LLM calls per turn (from the server's /stats/llm) and
+throughput.
+
+The answer cache is off during the test: every question gets a unique "(#n)" tag,
+so a repeated question never skips the graph, and --inprocess also sets
+ANSWER_CACHE=0. Pass --cache to send the plain questions and measure with cache hits.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+
+from metrics import percentile
+
+DISEASES = ["เบาหวาน", "ความดันสูง", "ไขมันในเลือดสูง"]
+
+QUESTIONS = [
+    "กินทุเรียนได้ไหมครับ",
+    "ยาเบาหวานกินก่อนหรือหลังอาหาร",
+    "ออกกำลังกายตอนเช้าได้ไหม",
+    "จะนั่งเครื่องบินไปเชียงใหม่ต้องเตรียมตัวยังไง",
+    "ขอเลื่อนนัดเป็นวันจันทร์หน้า แล้วกินข้าวเหนียวได้ไหม",
+    "สวัสดีครับคุณหมอ",
+]
+
+def patient_context(i: int) -> dict:
+    return {
+        "user_name": f"คนไข้ {i}",
+        "disease": DISEASES[i % len(DISEASES)],
+        "current_schedule": "2025-01-20",
+        "is_alert": "Negative",
+        "is_cardio": "Positive" if i % 5 == 0 else "Negative",
+        "is_gi_liver": "Negative",
+        "is_infectious": "Negative",
+    }
+
+async def llm_calls(client: httpx.AsyncClient) -> float:
+    stats = (await client.get("/stats/llm")).json()
+    return sum(v for row in stats.values() for k, v in row.items() if k.startswith("calls_"))
+
+async def run_turn(client: httpx.AsyncClient, payload: dict) -> dict:
+    start = time.perf_counter()
+    first_event = None
+    async with client.stream("POST", "/chat", json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if first_event is None and line.startswith("data: "):
+                first_event = time.perf_counter() - start
+    latency = time.perf_counter() - start
+    return {"latency": latency, "first_event": first_event if first_event is not None else latency}
+
+async def run_patient(client: httpx.AsyncClient, i: int, turns: int, tokens: bool, think: float, cache: bool,
+                      results: list, errors: list):
+    thread_id = f"load-{uuid.uuid4()}"
+    ctx = patient_context(i)
+    for turn in range(turns):
+        query = QUESTIONS[(i + turn) % len(QUESTIONS)]
+        payload = {
+            # tag ไม่ซ้ำกันทุกคำถาม ให้ answer cache ไม่มีทางตอบแทน graph
+            "query": query if cache else f"{query} (#{uuid.uuid4().int % 10**12})",
+            "user_context": ctx,
+            "thread_id": thread_id,
+            "stream_tokens": tokens,
+        }
+        try:
+            results.append(await run_turn(client, payload))
+        except httpx.HTTPError as exc:
+            errors.append(repr(exc))
+        if think:
+            await asyncio.sleep(think)
+
+@asynccontextmanager
+async def inprocess_url(args) -> AsyncIterator[str]:
+    """
+    main.app บน uvicorn ใน event loop เดียวกับ load test (port ที่ OS เลือกให้)
+    ไม่ใช้ httpx.ASGITransport เพราะมันรอ response ครบก่อนคืน ทำให้เวลาถึง event แรก = เวลาทั้ง turn
+    """
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ["ANSWER_CACHE"] = "1" if args.cache else "0"
+    import uvicorn
+    from main import app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+@asynccontextmanager
+async def make_client(args) -> AsyncIterator[httpx.AsyncClient]:
+    limits = httpx.Limits(max_connections=args.patients, max_keepalive_connections=args.patients)
+    async with AsyncExitStack() as stack:
+        url = await stack.enter_async_context(inprocess_url(args)) if args.inprocess else args.url
+        client = await stack.enter_async_context(httpx.AsyncClient(base_url=url, timeout=None, limits=limits))
+        # ไม่นับเวลา warmup ของ server ที่เพิ่งเปิด (/readyz 503 จนสร้าง chain/agent เสร็จ)
+        while args.inprocess and (await client.get("/readyz")).status_code != 200:
+            await asyncio.sleep(0.1)
+        yield client
+
+async def main():
+    parser = argparse.ArgumentParser(description="/chat load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--inprocess", action="store_true", help="serve main.app from this process (LLM_PROVIDER=fake)")
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--think", type=float, default=0.0, help="seconds between a patient's turns")
+    parser.add_argument("--tokens", action="store_true", help="use token streaming (stream_tokens=true)")
+    parser.add_argument("--cache", action="store_true", help="let the answer cache answer repeated questions")
+    args = parser.parse_args()
+
+    results, errors = [], []
+    async with make_client(args) as client:
+        calls_before = await llm_calls(client)
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_patient(client, i, args.turns, args.tokens, args.think, args.cache, results, errors)
+            for i in range(args.patients)
+        ))
+        wall = time.perf_counter() - start
+        calls = await llm_calls(client) - calls_before
+
+    latencies = [r["latency"] for r in results]
+    first_events = [r["first_event"] for r in results]
+    print(f"patients={args.patients} turns={len(results)} errors={len(errors)} wall={wall:.1f}s")
+    if not results:
+        return
+    print(
+        f"latency     p50={percentile(latencies, 50):.2f}s  p95={percentile(latencies, 95):.2f}s  "
+        f"p99={percentile(latencies, 99):.2f}s  mean={statistics.mean(latencies):.2f}s"
+    )
+    print(
+        f"first event p50={percentile(first_events, 50):.2f}s  p95={percentile(first_events, 95):.2f}s  "
+        f"p99={percentile(first_events, 99):.2f}s"
+    )
+    print(f"LLM calls/turn={calls / len(results):.2f}  throughput={len(results) / wall:.1f} turns/s")
+    for error in errors[:5]:
+        print(f"  error: {error}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,37 @@
 # main.py
+import asyncio
 import json
+import time
+import anyio
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
-from pydantic import BaseModel
-from typing import Dict, Any
-from langchain_core.messages import HumanMessage
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 from graph import app as graph_app
+from agent import agent_specs
+from llm_config import aclose_http_clients
+from usage import tracker as usage_tracker, report as usage_report
+from tracing import TurnTrace
+from answer_cache import cache as answer_cache, cache_key, cacheable, depersonalize, personalize, hit_rate
+from batch import BatchRunner
+from sessions import Session, registry as session_registry
+import admission
+import warmup
+import metrics
+import settings
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    yield 
+    # warmup รันหลังเปิด port แล้ว (request แรกไม่ต้องรอ, ส่วนที่ยังไม่เสร็จจะถูกสร้างตอนใช้จริง)
+    warming = asyncio.create_task(warmup.warm()) if settings.WARMUP else None
+    yield
+    if warming:
+        warming.cancel()
+    await aclose_http_clients()
 
 app = FastAPI(title="Medical Chatbot API", lifespan=lifespan)
 
@@ -29,29 +48,353 @@ app.add_middleware(
 # --- Request Model ---
 class ChatRequest(BaseModel):
     query: str
-    user_context: Dict[str, Any]
+    user_context: Optional[Dict[str, Any]] = None  # ไม่ส่ง = ใช้ context ที่ลงทะเบียนไว้กับ thread_id (sessions.py)
     thread_id: str
+    stream_tokens: bool = False
+
+class SessionRequest(BaseModel):
+    thread_id: str
+    user_context: Dict[str, Any]
+
+class BatchRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., max_length=settings.BATCH_MAX_ITEMS)
+    concurrency: Optional[int] = None
+    resume: bool = True
+
+UNKNOWN_SESSION = "Unknown thread_id: register user_context first (POST /session or send it with the request)."
+
+# --- SSE Helpers ---
+def sse(data: Any, event: str = None) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+def ai_contents(messages: List[Any]) -> List[str]:
+    """ข้อความตอบกลับของ AI (ข้าม message ที่เป็นการเรียก tool)"""
+    return [
+        msg.content for msg in messages or []
+        if getattr(msg, "type", None) == "ai" and msg.content and not getattr(msg, "tool_calls", None)
+    ]
+
+class SegmentSequencer:
+    """เรียง token ของ agent ที่รันขนานกัน (fan-out) ให้ออกทีละ segment ตามลำดับ plan"""
+
+    def __init__(self):
+        self.order: List[str] = []  # agent ที่ segment ยังไม่ปิด เรียงตาม plan
+        self.planned: set = set()
+        self.buffers: Dict[str, List[str]] = {}
+        self.finished: Dict[str, List[str]] = {}
+
+    def plan(self, agents: List[str]):
+        """ต่อท้ายเฉพาะ agent ใหม่ ไม่ reset ลำดับ/buffer ของ agent ที่กำลังตอบอยู่"""
+        for agent in agents:
+            if agent not in self.planned:
+                self.planned.add(agent)
+                self.order.append(agent)
+
+    def delta(self, agent: str, text: str) -> List[Tuple[str, str]]:
+        if not self.order or agent == self.order[0]:
+            return [("delta", text)]
+        self.buffers.setdefault(agent, []).append(text)
+        return []
+
+    def finish(self, agent: str, contents: List[str]) -> List[Tuple[str, str]]:
+        if agent not in self.order:
+            return [("message", c) for c in contents]
+        self.finished[agent] = contents
+        frames = []
+        while self.order and self.order[0] in self.finished:
+            done = self.order.pop(0)
+            frames += [("message", c) for c in self.finished.pop(done)]
+            if self.order:
+                frames += [("delta", t) for t in self.buffers.pop(self.order[0], [])]
+        return frames
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """ท้าย turn: คำตอบที่จบแล้วแต่ยังรอ agent ก่อนหน้าใน plan (ที่ไม่ได้รัน) ส่งออกตามลำดับ"""
+        frames = [("message", c) for agent in self.order for c in self.finished.pop(agent, [])]
+        self.order = []
+        return frames
+
+def agent_of_token(namespace: tuple, metadata: Dict[str, Any]):
+    """ชื่อ agent ถ้า token มาจาก LLM ของ specialist agent (ไม่ใช่ topic/supervisor)"""
+    if not namespace or metadata.get("langgraph_node") != "agent":
+        return None
+    root = namespace[0].split(":")[0]
+    return root if root in agent_specs else None
+
+async def cancel_on_disconnect(request: Request, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    ส่ง frame ของ `stream` ต่อให้ client, ถ้า client ตัดการเชื่อมต่อ (ปิดแท็บ/ส่งข้อความใหม่)
+    cancel การรัน graph ทันที รวม LLM call ที่กำลังรออยู่ แทนที่จะรันต่อจนจบโดยไม่มีใครรับ
+    checkpoint จะค้างอยู่ที่ node สุดท้ายที่รันเสร็จ
+    """
+    frames: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for frame in stream:
+                frames.put_nowait(frame)
+        finally:
+            frames.put_nowait(None)
+
+    async def watch():
+        # server ที่ใช้ ASGI spec 2.4 ไม่แจ้ง disconnect จนกว่าจะส่ง frame ถัดไป (ซึ่งอาจห่างกันหลายวินาที)
+        while not await request.is_disconnected():
+            await asyncio.sleep(settings.DISCONNECT_POLL_SECONDS)
+        producer.cancel()
+
+    producer = asyncio.create_task(pump())
+    watcher = asyncio.create_task(watch()) if settings.DISCONNECT_POLL_SECONDS > 0 else None
+    try:
+        while (frame := await frames.get()) is not None:
+            yield frame
+        if not producer.cancelled():
+            producer.result()
+    finally:
+        if watcher:
+            watcher.cancel()
+        if not producer.done() or producer.cancelled():
+            metrics.inc("turns_cancelled", reason="disconnect")
+            producer.cancel()
+            # รอให้ graph หยุดจริง (ปล่อย lock ของ thread) ก่อนคืน connection
+            with anyio.CancelScope(shield=True):
+                await asyncio.wait({producer})
+
+# --- Chat Turn ---
+def open_session(thread_id: str, user_context: Optional[Dict[str, Any]]) -> Optional[Session]:
+    """ลงทะเบียน/อัปเดต context ถ้าส่งมา ไม่งั้นใช้ session เดิมของ thread (None = ยังไม่เคยลงทะเบียน)"""
+    if user_context is not None:
+        return session_registry.register(thread_id, user_context)
+    return session_registry.get(thread_id)
+
+async def run_turn(session: Session, query: str, stream_tokens: bool = False) -> AsyncIterator[Tuple[Optional[str], str]]:
+    """
+    คำตอบของหนึ่ง turn เป็น (event, ข้อความ): event None = ข้อความทั้งก้อน,
+    ถ้า stream_tokens "delta" = token ย่อยจาก agent, "message" = ข้อความสมบูรณ์ (ปิดท้ายแต่ละข้อความ)
+    """
+    thread_id, ctx = session.thread_id, session.user_context
+    config = {
+        "configurable": {"thread_id": thread_id, "patient_prompt": session.patient_prompt},
+        "callbacks": [usage_tracker, TurnTrace(thread_id)],
+    }
+    inputs = {"messages": [HumanMessage(content=query)]}
+    if not session.context_written:
+        # เขียน context ลง state เฉพาะ turn แรกของ session หรือเมื่อ context เปลี่ยน
+        inputs["user_context"] = ctx
 
-# --- Chat Endpoint ---
-@app.post("/chat")
-async def chat_endpoint(req: ChatRequest):
     async def event_stream():
-        config = {"configurable": {"thread_id": req.thread_id}}
-        inputs = {
-            "messages": [HumanMessage(content=req.query)],
-            "user_context": req.user_context 
-        }
-        
         async for event in graph_app.astream(inputs, config=config, stream_mode="updates"):
             for node, output in event.items():
-                if output and "messages" in output:
-                    last_msg = output["messages"][-1]
-                    if hasattr(last_msg, "content") and last_msg.content:
-                        if last_msg.type == "ai":
-                            cleaned_content = json.dumps(last_msg.content, ensure_ascii=False)
-                            yield f"data: {cleaned_content}\n\n"
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+                for content in ai_contents((output or {}).get("messages")):
+                    yield None, content
+
+    async def token_stream():
+        sequencer = SegmentSequencer()
+        async for namespace, mode, chunk in graph_app.astream(
+            inputs, config=config, stream_mode=["updates", "messages"], subgraphs=True
+        ):
+            if mode == "messages":
+                msg, metadata = chunk
+                if isinstance(msg, AIMessageChunk) and isinstance(msg.content, str) and msg.content:
+                    agent = agent_of_token(namespace, metadata)
+                    if agent:
+                        for frame in sequencer.delta(agent, msg.content):
+                            yield frame
+            elif not namespace:
+                for node, output in chunk.items():
+                    output = output or {}
+                    # แบบลำดับรันทีละ agent token ส่งต่อได้เลย เรียงเฉพาะ fan-out ที่หลาย agent ตอบพร้อมกัน
+                    if settings.ROUTER_FANOUT and isinstance(output.get("plan"), list):
+                        sequencer.plan(output["plan"])
+                    if node in agent_specs:
+                        replies = (output.get("fanout_replies") or {}).get(node, output.get("messages"))
+                        for frame in sequencer.finish(node, ai_contents(replies)):
+                            yield frame
+                    elif node != "merge":
+                        # merge แค่เรียงคำตอบที่ส่งไปแล้วตอนแต่ละ agent จบ
+                        for content in ai_contents(output.get("messages")):
+                            yield "message", content
+        for frame in sequencer.flush():
+            yield frame
+
+    async def remember_answer(stream, key: Optional[str]):
+        async for frame in stream:
+            yield frame
+        session.context_written = True
+        if not key:
+            return
+        values = (await graph_app.aget_state(config)).values
+        answers = ai_contents(values.get("messages", [])[1:])
+        if answers and cacheable(values.get("answered") or []):
+            await answer_cache.aput(key, depersonalize(answers, ctx))
+
+    # turn ของ thread เดียวกันรันทีละ turn (กดส่งซ้ำจะรอ turn ก่อนหน้า ไม่แย่ง checkpoint กัน)
+    async with admission.turn(thread_id, ctx):
+        # --- Answer Cache ---
+        # ใช้/เก็บ cache เฉพาะคำถามแรกของ thread: คำถามกลางบทสนทนา (เช่น "กินได้ไหม") ขึ้นกับ history
+        key = cache_key(query, ctx)
+        if key and (await graph_app.aget_state(config)).values.get("messages"):
+            key = None
+        if key:
+            cached = await answer_cache.aget(key)
+            if cached:
+                answers = personalize(cached, ctx)
+                # บันทึก turn ลง thread เหมือนตอบจาก graph เพื่อให้ history ของคนไข้ต่อเนื่อง
+                await graph_app.aupdate_state(
+                    config,
+                    {**inputs, "messages": inputs["messages"] + [AIMessage(content=a) for a in answers]},
+                    as_node="summarize",
+                )
+                session.context_written = True
+                for a in answers:
+                    yield ("message" if stream_tokens else None), a
+                return
+
+        stream = token_stream() if stream_tokens else event_stream()
+        async for frame in remember_answer(stream, key):
+            yield frame
+
+def busy_response(retry_after: int) -> JSONResponse:
+    return JSONResponse({"detail": "Server busy, please retry."}, status_code=429, headers={"Retry-After": str(retry_after)})
+
+# --- Chat Endpoint ---
+@app.post("/chat")
+async def chat_endpoint(req: ChatRequest, request: Request):
+    session = open_session(req.thread_id, req.user_context)
+    if session is None:
+        return JSONResponse({"detail": UNKNOWN_SESSION}, status_code=409)
+    retry_after = admission.shed(session.user_context)
+    if retry_after:
+        # คิว LLM ยาวเกิน: ปฏิเสธทันทีดีกว่าให้ทุก turn รอจน timeout (คนไข้ alert ไม่โดน)
+        return busy_response(retry_after)
+    frames = (sse(data, event) async for event, data in run_turn(session, req.query, req.stream_tokens))
+    return StreamingResponse(cancel_on_disconnect(request, frames), media_type="text/event-stream")
+
+# --- Sessions ---
+@app.post("/session")
+async def register_session(req: SessionRequest):
+    open_session(req.thread_id, req.user_context)
+    return {"thread_id": req.thread_id, "sessions": len(session_registry)}
+
+@app.websocket("/ws/chat")
+async def chat_socket(ws: WebSocket):
+    """
+    หนึ่ง connection ต่อคนไข้ ส่ง user_context ครั้งเดียวแล้วคุยต่อได้เรื่อยๆ (frame เป็น JSON)
+    client -> server:  {"type": "register", "thread_id", "user_context"}   ครั้งแรก/เมื่อ context เปลี่ยน
+                       {"type": "message", "query", "stream_tokens": false}
+    server -> client:  {"type": "registered", "thread_id"}
+                       {"type": "message" | "delta", "content"}   แบบเดียวกับ event ของ SSE ใน /chat
+                       {"type": "done", "ms"}                      จบ turn
+                       {"type": "error", "detail", "status", "retry_after"?}
+    """
+    await ws.accept()
+    session: Optional[Session] = None
+    turns: set = set()
+
+    async def error(detail: str, status: int, **extra):
+        await ws.send_json({"type": "error", "detail": detail, "status": status, **extra})
+
+    async def answer(current: Session, query: str, stream_tokens: bool):
+        start = time.perf_counter()
+        retry_after = admission.shed(current.user_context)
+        if retry_after:
+            await error("Server busy, please retry.", 429, retry_after=retry_after)
+            return
+        try:
+            async for event, data in run_turn(current, query, stream_tokens):
+                await ws.send_json({"type": event or "message", "content": data})
+        except Exception as exc:
+            await error(f"{type(exc).__name__}: {exc}", 500)
+            return
+        await ws.send_json({"type": "done", "ms": round((time.perf_counter() - start) * 1000, 1)})
+
+    try:
+        while True:
+            try:
+                frame = await ws.receive_json()
+            except ValueError:
+                await error("Frames must be JSON objects.", 400)
+                continue
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "register":
+                try:
+                    req = SessionRequest.model_validate(frame)
+                except ValidationError as exc:
+                    await error(str(exc), 422)
+                    continue
+                session = open_session(req.thread_id, req.user_context)
+                await ws.send_json({"type": "registered", "thread_id": session.thread_id})
+            elif kind == "message":
+                if session is None:
+                    await error(UNKNOWN_SESSION, 409)
+                elif not isinstance(frame.get("query"), str) or not frame["query"].strip():
+                    await error("query must be a non-empty string.", 422)
+                else:
+                    task = asyncio.create_task(answer(session, frame["query"], bool(frame.get("stream_tokens"))))
+                    turns.add(task)
+                    task.add_done_callback(turns.discard)
+            else:
+                await error(f"Unknown frame type: {kind!r}", 400)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # client ปิด connection -> หยุด turn ที่ยังรันอยู่ (เหมือน /chat ตอน client หลุด)
+        for task in list(turns):
+            metrics.inc("turns_cancelled", reason="disconnect")
+            task.cancel()
+        if turns:
+            await asyncio.wait(turns)
+
+# --- Batch Endpoint ---
+@app.post("/chat/batch")
+async def chat_batch_endpoint(req: BatchRequest):
+    # ผลทีละบรรทัด (NDJSON) ตามลำดับที่เสร็จ, "index" ชี้กลับไปที่ items
+    runner = BatchRunner(graph_app, req.concurrency, req.resume)
+    items = [item.model_dump() for item in req.items]
+    for item in items:
+        if item["user_context"] is None:
+            session = session_registry.get(item["thread_id"])
+            if session is None:
+                return JSONResponse({"detail": UNKNOWN_SESSION, "thread_id": item["thread_id"]}, status_code=409)
+            item["user_context"] = session.user_context
+
+    async def ndjson():
+        async for row in runner.run(items):
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+# --- Probes ---
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# --- Stats ---
+@app.get("/stats/llm")
+async def llm_stats():
+    # token ที่ provider อ่านจาก prompt cache ต่อ node และ latency เมื่อ hit/miss
+    return usage_report()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    # node_seconds, turn_*, llm_* และ counter อื่นทั้งหมดของ process นี้ (Prometheus text format)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/admission")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/stats/cache")
+async def cache_stats():
+    counters = {k: v for k, v in metrics.snapshot().items() if k.startswith("answer_cache")}
+    return {"hit_rate": hit_rate(), **counters}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,113 @@
+# metrics.py
+"""In-process counters and histograms (per worker process), exported as Prometheus text."""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+_histograms: Dict[Tuple[str, Tuple], list] = {}  # key -> [bucket counts, sum, count]
+_buckets: Dict[str, Tuple[float, ...]] = {}
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels) -> None:
+    """บันทึกค่าลง histogram (bucket ของแต่ละชื่อกำหนดตอน observe ครั้งแรก)"""
+    key = _key(name, labels)
+    with _lock:
+        bounds = _buckets.setdefault(name, tuple(buckets))
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [[0] * len(bounds), 0.0, 0]
+        index = bisect_left(bounds, value)
+        if index < len(bounds):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+def total(name: str, **labels) -> float:
+    """ผลรวมของทุก series ชื่อ `name` ที่มี label ตรงกับที่ระบุ"""
+    wanted = set(_key(name, labels)[1])
+    with _lock:
+        return sum(v for (n, lbl), v in _counters.items() if n == name and wanted <= set(lbl))
+
+def mean(name: str) -> float:
+    """ค่าเฉลี่ยของ histogram `name` (ทุก series รวมกัน), 0 ถ้ายังไม่มีค่า"""
+    with _lock:
+        entries = [(entry[1], entry[2]) for (n, _), entry in _histograms.items() if n == name]
+    count = sum(c for _, c in entries)
+    return sum(s for s, _ in entries) / count if count else 0.0
+
+def percentile(values, p: float) -> float:
+    """percentile แบบ nearest-rank (p = 0-100) ของค่าที่วัดเอง (bench/eval/loadtest), 0 ถ้าไม่มีค่า"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+def series(name: str) -> List[Tuple[Dict[str, str], float]]:
+    """ทุก series ของ `name` พร้อม label (ใช้รวมผลตาม label เอง)"""
+    with _lock:
+        return [(dict(lbl), v) for (n, lbl), v in _counters.items() if n == name]
+
+def snapshot() -> Dict[str, float]:
+    with _lock:
+        items = list(_counters.items())
+    out = {}
+    for (name, labels), value in items:
+        suffix = ",".join(f'{k}="{v}"' for k, v in labels)
+        out[f"{name}{{{suffix}}}" if suffix else name] = value
+    return out
+
+# --- Prometheus ---
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def render() -> str:
+    """text exposition format 0.0.4 สำหรับ GET /metrics"""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, (list(v[0]), v[1], v[2])) for k, v in _histograms.items())
+        buckets = dict(_buckets)
+    lines, typed = [], set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    for (name, labels), (counts, value_sum, count) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket in zip(buckets[name], counts):
+            cumulative += bucket
+            lines.append(f"{name}_bucket{_labels(labels, (('le', _number(bound)),))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(value_sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _buckets.clear()
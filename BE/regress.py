@@ -0,0 +1,252 @@
+# regress.py
+"""
+Offline end-to-end performance regression run on recorded LLM traffic.
+
+    python regress.py record                                   # real OpenAI (OPENAI_API_KEY)
+    python regress.py record --base-url http://127.0.0.1:9000/v1   # or stub_openai.py
+    python regress.py                      # replay, compare with evals/regression_thresholds.json
+    python regress.py --update             # rewrite the thresholds from this run (x --headroom)
+    python regress.py --timing             # replay with the recorded LLM latency (report only)
+
+Each conversation in evals/conversations.jsonl is sent turn by turn to POST /chat
+of main.app, in this process through httpx.ASGITransport. That is the same
+session, admission, graph_app and SSE path that serves patients. LLM calls go
+through cassette.py:
+- `record` sends them to the API and writes evals/cassettes/regression.jsonl.
+- The default run replays them with no network, so the numbers only move when
+  our own code changes.
+
+Metrics:
+    overhead_ms_p50/p95        turn wall time minus replayed LLM time (zero unless --timing),
+                               after one untimed pass (cold start is bench_startup.py's job);
+                               fastest of --repeat timed passes, so scheduler noise does not trip it
+    checkpoint_kib_per_thread  checkpointer payload after the run / threads
+    alloc_peak_kib_p95         tracemalloc peak per turn (separate pass, tracing slows turns)
+    retained_kib_per_turn      memory still allocated after a turn (checkpoints, sessions, caches)
+
+Exits with status 1 on a cassette miss, on a turn that is not HTTP 200, on a turn
+where the client got fewer answers than the checkpoint holds (e.g. a multi-agent
+turn in token mode), or when a metric is above its threshold. Turns run one at a time with ANSWER_CACHE and
+hedging off, so record and replay send identical requests. Thresholds hold
+wall-clock numbers: regenerate them with --update on the machine that runs the
+check.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from metrics import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONVERSATIONS_FILE = os.path.join(HERE, "evals", "conversations.jsonl")
+CASSETTE_FILE = os.path.join(HERE, "evals", "cassettes", "regression.jsonl")
+THRESHOLDS_FILE = os.path.join(HERE, "evals", "regression_thresholds.json")
+
+
+def load_conversations(path: str = CONVERSATIONS_FILE) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def configure(args) -> None:
+    """ต้องตั้ง env ก่อน import settings (ค่าถูกอ่านตอน import)"""
+    os.environ.update({
+        "LLM_PROVIDER": "openai",
+        "LLM_CASSETTE": args.cassette,
+        "LLM_CASSETTE_MODE": "record" if args.command == "record" else "replay",
+        "LLM_CASSETTE_TIMING": "1" if args.timing else "0",
+        "ANSWER_CACHE": "0",
+        "LLM_HEDGE_AFTER_SECONDS": "0",
+        "WARMUP": "0",
+    })
+    if args.base_url:
+        os.environ["LLM_BASE_URL"] = args.base_url
+
+
+async def run_turn(client, thread_id: str, query: str, user_context: dict, stream_tokens: bool) -> tuple:
+    """(HTTP status, จำนวนคำตอบที่ client ได้รับ) นับทุก SSE frame ยกเว้น token ย่อย ("delta")"""
+    payload = {"query": query, "thread_id": thread_id, "stream_tokens": stream_tokens}
+    if user_context is not None:
+        payload["user_context"] = user_context
+    try:
+        async with client.stream("POST", "/chat", json=payload) as r:
+            body = (await r.aread()).decode("utf-8")
+    except Exception as exc:
+        # error ระหว่าง stream (เช่น cassette miss) ASGITransport ส่งต่อมาเป็น exception
+        print(f"  {thread_id}: {type(exc).__name__}: {exc}", file=sys.stderr)
+        return 500, 0
+    frames = [frame for frame in body.split("\n\n") if "data:" in frame]
+    return r.status_code, sum(1 for frame in frames if not frame.startswith("event: delta"))
+
+
+async def turn_answers(thread_id: str) -> int:
+    """จำนวนคำตอบของ turn ล่าสุดใน checkpoint (ข้อความ AI หลังคำถามสุดท้าย)"""
+    from main import ai_contents, graph_app
+    state = await graph_app.aget_state({"configurable": {"thread_id": thread_id}})
+    messages = state.values.get("messages", [])
+    last_question = max((i for i, m in enumerate(messages) if m.type == "human"), default=-1)
+    return len(ai_contents(messages[last_question + 1:]))
+
+
+async def run_pass(client, conversations: list, suffix: str, on_turn) -> list:
+    """
+    รันทุกบทสนทนาทีละ turn, on_turn(turn) วัดแต่ละ turn
+    คืน (status, client ได้คำตอบครบทุก agent ที่ตอบหรือไม่, ค่าที่วัด)
+    """
+    results = []
+    for conv in conversations:
+        thread_id = f"regress-{conv['id']}{suffix}"
+        for i, query in enumerate(conv["turns"]):
+            # ส่ง user_context เฉพาะ turn แรก turn ถัดไปใช้ session ที่ลงทะเบียนไว้
+            context = conv["user_context"] if i == 0 else None
+            turn = run_turn(client, thread_id, query, context, conv.get("stream_tokens", False))
+            (status, sent), value = await on_turn(turn)
+            expected = await turn_answers(thread_id)
+            if status == 200 and sent != expected:
+                print(f"  {thread_id} turn {i}: client got {sent} of {expected} answers", file=sys.stderr)
+            results.append((status, sent == expected, value))
+    return results
+
+
+async def measure(conversations: list, record: bool, repeat: int = 1) -> dict:
+    import httpx
+
+    import cassette
+    import checkpointer
+    import metrics
+    import warmup
+    from main import app, graph_app
+
+    tape = cassette.active()
+    # สร้าง chain/agent ก่อนจับเวลา (production ทำใน lifespan ก่อน /readyz)
+    warmup.build()
+
+    async def untimed(turn):
+        return await turn, None
+
+    async def timed(turn):
+        slept = tape.slept
+        start = time.perf_counter()
+        outcome = await turn
+        return outcome, (time.perf_counter() - start - (tape.slept - slept)) * 1000
+
+    async def traced(turn):
+        gc.collect()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        outcome = await turn
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        return outcome, ((peak - before) / 1024, (current - before) / 1024)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://regress", timeout=None) as client:
+        if not record:
+            # รอบแรกไม่จับเวลา: import/สร้าง object ครั้งแรกของแต่ละ path (เช่น token streaming) ไม่นับเป็น overhead ต่อ turn
+            await run_pass(client, conversations, "-warm", untimed)
+        # จับเวลาหลายรอบ (thread ใหม่ทุกรอบ) ใช้รอบที่เร็วสุดของแต่ละ turn ตัด noise ของเครื่อง
+        passes = []
+        for r in range(1 if record else repeat):
+            tape.rewind()
+            passes.append(await run_pass(client, conversations, f"-{r}", timed))
+        footprint = checkpointer.footprint(graph_app.checkpointer)
+        allocations = []
+        if not record:
+            tape.rewind()
+            tracemalloc.start()
+            try:
+                allocations = await run_pass(client, conversations, "-alloc", traced)
+            finally:
+                tracemalloc.stop()
+
+    overhead = [min(ms for _, _, ms in runs) for runs in zip(*passes)]
+    turns = [turn for timings in passes for turn in timings] + allocations
+    result = {
+        "turns": len(overhead),
+        "failed_turns": sum(1 for status, _, _ in turns if status != 200),
+        "missing_answers": sum(1 for status, complete, _ in turns if status == 200 and not complete),
+        "cassette_misses": int(metrics.total("cassette_misses")),
+        "llm_calls": int(metrics.total("cassette_recorded" if record else "cassette_hits")),
+        "overhead_ms_p50": round(statistics.median(overhead), 2),
+        "overhead_ms_p95": round(percentile(overhead, 95), 2),
+        "checkpoint_kib_per_thread": round(footprint.get("payload_bytes", 0) / 1024 / max(1, footprint.get("threads", 0)), 2),
+    }
+    if allocations:
+        result["alloc_peak_kib_p95"] = round(percentile([peak for _, _, (peak, _) in allocations], 95), 1)
+        result["retained_kib_per_turn"] = round(statistics.mean(kept for _, _, (_, kept) in allocations), 1)
+    return result
+
+
+def check(result: dict, thresholds: dict) -> list:
+    failures = []
+    if result["failed_turns"]:
+        failures.append(f"{result['failed_turns']} turn(s) did not return HTTP 200")
+    if result["missing_answers"]:
+        failures.append(f"{result['missing_answers']} turn(s) sent fewer answers than the agents gave (see stderr)")
+    if result["cassette_misses"]:
+        failures.append(f"{result['cassette_misses']} LLM request(s) not in the cassette (re-record with `python regress.py record`)")
+    for name, limit in thresholds.items():
+        if name in result and result[name] > limit:
+            failures.append(f"{name}={result[name]} > {limit}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end performance regression run")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "record"])
+    parser.add_argument("--conversations", default=CONVERSATIONS_FILE)
+    parser.add_argument("--cassette", default=CASSETTE_FILE)
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    parser.add_argument("--base-url", default="", help="record: API base URL (default api.openai.com)")
+    parser.add_argument("--timing", action="store_true", help="replay with recorded LLM latency (thresholds not checked)")
+    parser.add_argument("--update", action="store_true", help="write thresholds from this run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes; each turn's fastest one counts")
+    parser.add_argument("--headroom", type=float, default=1.5, help="--update: threshold = value x headroom")
+    args = parser.parse_args()
+
+    record = args.command == "record"
+    if record:
+        # บันทึกใหม่ทั้งไฟล์ ไม่ต่อท้ายของเดิม
+        os.makedirs(os.path.dirname(os.path.abspath(args.cassette)), exist_ok=True)
+        open(args.cassette, "w").close()
+    elif not os.path.exists(args.cassette):
+        sys.exit(f"no cassette at {args.cassette}; run `python regress.py record` first")
+    configure(args)
+
+    conversations = load_conversations(args.conversations)
+    result = asyncio.run(measure(conversations, record, args.repeat))
+    for name, value in result.items():
+        print(f"  {name:<26} {value}")
+    if record:
+        print(f"recorded {result['llm_calls']} LLM calls to {args.cassette}")
+        sys.exit(1 if result["failed_turns"] or result["missing_answers"] else 0)
+
+    if args.update:
+        thresholds = {
+            name: round(result[name] * args.headroom, 2)
+            for name in ("overhead_ms_p50", "overhead_ms_p95", "checkpoint_kib_per_thread", "alloc_peak_kib_p95", "retained_kib_per_turn")
+        }
+        with open(args.thresholds, "w", encoding="utf-8") as f:
+            json.dump(thresholds, f, indent=2)
+            f.write("\n")
+        print(f"wrote {args.thresholds}")
+    if args.timing:
+        sys.exit(0)
+
+    with open(args.thresholds, encoding="utf-8") as f:
+        thresholds = json.load(f)
+    failures = check(result, thresholds)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} regression(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# sessions.py
+"""
+Server-side chat sessions: user_context is registered once per thread_id.
+
+A client registers the context once: with the WebSocket "register" frame, with
+POST /session, or with any /chat request that carries user_context. After that,
+turns only carry the question.
+- The context is written into graph state only on the first turn of a session, or
+  after the context has changed.
+- The patient system prompt (agent.patient_template) is rendered once per session.
+  It reaches the agents as config["configurable"]["patient_prompt"].
+
+The registry lives in each worker process (LRU plus an idle TTL). A turn for a
+thread_id that is not registered here gets an error that asks the client to
+register again. That happens after eviction, after a restart, or on another
+worker.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import SystemMessage
+
+from agent import create_system_prompt, patient_template
+import metrics
+import settings
+
+class Session:
+    def __init__(self, thread_id: str, user_context: Dict[str, Any]):
+        self.thread_id = thread_id
+        self.user_context = dict(user_context)
+        self.patient_prompt = SystemMessage(content=create_system_prompt(patient_template, self.user_context))
+        self.context_written = False  # user_context อยู่ใน graph state ของ thread แล้วหรือยัง
+        self.last_seen = time.time()
+
+class SessionRegistry:
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, thread_id: str) -> Optional[Session]:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session and now - session.last_seen > self.ttl_seconds:
+                del self._sessions[thread_id]
+                metrics.inc("sessions_expired")
+                session = None
+            if session:
+                session.last_seen = now
+                self._sessions.move_to_end(thread_id)
+            return session
+
+    def register(self, thread_id: str, user_context: Dict[str, Any]) -> Session:
+        """session เดิมถ้า context ไม่เปลี่ยน (prompt ไม่ต้อง render ใหม่), ไม่งั้นสร้างใหม่"""
+        session = self.get(thread_id)
+        if session and session.user_context == user_context:
+            return session
+        session = Session(thread_id, user_context)
+        with self._lock:
+            self._sessions[thread_id] = session
+            self._sessions.move_to_end(thread_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        metrics.inc("sessions_registered")
+        return session
+
+    def drop(self, thread_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(thread_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+registry = SessionRegistry(settings.SESSION_MAX, settings.SESSION_TTL_SECONDS)
@@ -0,0 +1,156 @@
+# settings.py
+import json
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# --- LLM Provider ---
+# "openai" = ChatOpenAI (ต้องมี OPENAI_API_KEY), "fake" = model จำลองใน fake_llm.py (ใช้ offline/load test)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").strip().lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
+
+# --- Model Tiers ---
+# LLM_MODEL = model ใหญ่ (ตอบคนไข้), LLM_MODEL_SMALL = model เล็กสำหรับงานสั้นๆ (topic/router/summary)
+LLM_MODEL_SMALL = os.getenv("LLM_MODEL_SMALL", "gpt-4o-mini")
+# node -> model ("small"/"large"/ชื่อ model), temperature, max_tokens
+# agent แต่ละตัว (เช่น "DietAgent") override ค่าของ "agent" ได้, แก้ผ่าน env เช่น LLM_NODE_MODELS='{"topic": {"model": "large"}}'
+LLM_NODE_MODELS = {
+    "topic": {"model": "small", "temperature": 0.0, "max_tokens": 64},
+    "supervisor": {"model": "small", "temperature": 0.0, "max_tokens": 400},
+    "summary": {"model": "small", "temperature": 0.0, "max_tokens": 600},
+    "agent": {"model": "large", "temperature": LLM_TEMPERATURE, "max_tokens": 1024},
+}
+for _node, _override in json.loads(os.getenv("LLM_NODE_MODELS", "{}")).items():
+    LLM_NODE_MODELS.setdefault(_node, {}).update(_override)
+# topic/router บน model เล็ก: parse ไม่ได้ หรือ confidence ต่ำกว่านี้ -> ถามซ้ำที่ model ใหญ่
+LLM_ESCALATION = env_flag("LLM_ESCALATION", True)
+LLM_ESCALATE_BELOW = float(os.getenv("LLM_ESCALATE_BELOW", "0.6"))
+# เวลาตอบต่อ call และต่อ chunk ตอน stream ของ fake model (วินาที)
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.3"))
+FAKE_LLM_CHUNK_DELAY = float(os.getenv("FAKE_LLM_CHUNK_DELAY", "0.01"))
+
+# --- LLM Connection Pool / Timeouts / Retries ---
+# LLM_BASE_URL ว่าง = api.openai.com (ตั้งเป็น stub_openai.py เพื่อทดสอบ latency/error)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "")
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "50"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# timeout (วินาที) ต่อ node: routing สั้น ตัดเร็วแล้ว retry, agent/summary ตอบยาวกว่า
+LLM_TIMEOUTS = {
+    "topic": float(os.getenv("LLM_TIMEOUT_TOPIC", "10")),
+    "supervisor": float(os.getenv("LLM_TIMEOUT_SUPERVISOR", "15")),
+    "agent": float(os.getenv("LLM_TIMEOUT_AGENT", "60")),
+    "summary": float(os.getenv("LLM_TIMEOUT_SUMMARY", "30")),
+}
+# retry แบบ exponential backoff + jitter: initial * 2^n (สูงสุด LLM_RETRY_MAX) + สุ่ม
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_INITIAL = float(os.getenv("LLM_RETRY_INITIAL", "0.5"))
+LLM_RETRY_MAX = float(os.getenv("LLM_RETRY_MAX", "8"))
+# hedging ของ topic/supervisor: ส่งซ้ำถ้ายังไม่ตอบภายในเวลานี้ (0 = ปิด), ควรตั้งราว p95 ของ routing call
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))
+
+# --- LLM Cassettes ---
+# ไฟล์ .jsonl ที่บันทึก/เล่นซ้ำ request-response ของ LLM (cassette.py, regress.py), ว่าง = ปิด
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "")
+# "record" = ส่งไป API จริงแล้วบันทึก, "replay" = ตอบจาก cassette ไม่ต่อ network
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "replay").strip().lower()
+# replay: หน่วงตามเวลาที่บันทึกไว้ (ปิด = ตอบทันที วัดเฉพาะ overhead ของเรา)
+LLM_CASSETTE_TIMING = env_flag("LLM_CASSETTE_TIMING", False)
+
+# --- Topic Check ---
+# ตัดสิน greeting/คำถามที่ระบุโรคชัดเจนด้วย lexicon ก่อนเรียก LLM
+TOPIC_FASTPATH = env_flag("TOPIC_FASTPATH", True)
+
+# --- Speculative Routing ---
+# "off"    = topic -> supervisor ทีละขั้น
+# "router" = เรียก supervisor_chain พร้อม topic_check_chain แล้วทิ้งผลถ้า off_topic
+# "agent"  = เหมือน router แต่เริ่ม agent ที่ถูกเลือกต่อทันที (ไม่ stream token ระหว่าง topic check)
+SPECULATIVE_ROUTING = os.getenv("SPECULATIVE_ROUTING", "off").strip().lower()
+
+# --- Fan-out ---
+# ให้ supervisor เลือกหลาย agent ในครั้งเดียวแล้วรันขนานกัน (แทนการวนทีละ agent)
+ROUTER_FANOUT = env_flag("ROUTER_FANOUT", False)
+
+# --- Router Output ---
+# "fast" = ตอบแค่ next/plan (label), "reasoning" = เขียนเหตุผลก่อนเลือก (ช้ากว่า ใช้ debug การ route)
+ROUTER_MODE = os.getenv("ROUTER_MODE", "fast").strip().lower()
+
+# --- Completion Tracking ---
+# จำนวน agent สูงสุดต่อหนึ่ง turn กัน router วนไปมา
+MAX_AGENT_HOPS = int(os.getenv("MAX_AGENT_HOPS", "4"))
+
+# --- Checkpointer ---
+# "memory" = MemorySaver ใน process, "sqlite" = ไฟล์ SQLite ใช้ร่วมกันได้หลาย worker
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory").strip().lower()
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "10"))
+
+# --- History ---
+# งบ token ของประวัติสนทนาที่ส่งให้แต่ละ node (ไม่รวม system prompt), turn ปัจจุบันส่งครบเสมอ
+HISTORY_BUDGET_SUPERVISOR = int(os.getenv("HISTORY_BUDGET_SUPERVISOR", "1500"))
+HISTORY_BUDGET_AGENT = int(os.getenv("HISTORY_BUDGET_AGENT", "3000"))
+# เมื่อส่วนที่ยังไม่ถูกสรุปเกิน trigger จะพับ turn เก่าเข้า summary จนเหลือไม่เกิน keep
+# (trigger ไม่ควรเกิน budget ที่เล็กที่สุด ไม่งั้นบาง turn จะหลุดทั้งจาก window และ summary)
+HISTORY_SUMMARY_TRIGGER = int(os.getenv("HISTORY_SUMMARY_TRIGGER", "1200"))
+HISTORY_SUMMARY_KEEP = int(os.getenv("HISTORY_SUMMARY_KEEP", "600"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+
+# --- Warmup ---
+# สร้าง chains/agents และเปิด connection ไป LLM ใน background ตอน start (ไม่ให้ patient คนแรกรอ), /readyz = 503 จนกว่าจะเสร็จ
+WARMUP = env_flag("WARMUP", True)
+
+# --- Agent Registry ---
+# จำนวน agent variant (agent type x โรค) ที่ compile เก็บไว้ใน LRU cache
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "32"))
+
+# --- Knowledge Prefetch ---
+# โรคที่รู้จัก: ใส่ข้อมูลจาก disease tools ใน prompt ของ agent เลย (ตอบใน LLM call เดียว ไม่ต้องวน tool)
+KNOWLEDGE_PREFETCH = env_flag("KNOWLEDGE_PREFETCH", True)
+
+# --- Knowledge Store ---
+# ไฟล์ markdown ต่อโรค (ดู knowledge.py), แก้ไฟล์แล้วโหลดใหม่เองภายใน KNOWLEDGE_RELOAD_SECONDS
+KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge"))
+KNOWLEDGE_RELOAD_SECONDS = float(os.getenv("KNOWLEDGE_RELOAD_SECONDS", "5"))
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+
+# --- Answer Cache ---
+# คำถามซ้ำ (โรค + risk flags เดียวกัน) ตอบจาก cache ไม่ต้องรัน graph, ANSWER_CACHE_DB = "" ใช้แค่ memory
+ANSWER_CACHE = env_flag("ANSWER_CACHE", True)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "")
+
+# --- Tracing ---
+# log หนึ่งบรรทัด (JSON) ต่อ turn: เวลาแต่ละ node, LLM calls, token, supervisor hops (logger "trace")
+TRACE_LOG = env_flag("TRACE_LOG", False)
+
+# --- Sessions ---
+# user_context ลงทะเบียนครั้งเดียวต่อ thread_id (WebSocket /ws/chat, POST /session), เก็บต่อ process
+# TTL ต้องสั้นกว่า CHECKPOINT_TTL_SECONDS (session ที่ยังอยู่ถือว่า state ของ thread มี user_context แล้ว)
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+
+# --- Client Disconnect ---
+# ตรวจทุกกี่วินาทีว่า client ของ /chat ยังเชื่อมต่ออยู่ไหม ถ้าหลุดจะ cancel graph ที่ยังรันอยู่ (0 = ไม่ตรวจเอง รอ server แจ้ง)
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
+# --- Admission Control ---
+# LLM call ที่รันพร้อมกันได้ต่อ process (0 = ไม่จำกัด), คิวเกิน ADMISSION_MAX_QUEUE -> 429 (ยกเว้นคนไข้ alert)
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+ADMISSION_MAX_RETRY_AFTER = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "30"))
+
+# --- Batch ---
+# /chat/batch และ batch.py: จำนวน graph ที่รันพร้อมกัน และจำนวน item สูงสุดต่อ request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
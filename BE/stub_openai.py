@@ -0,0 +1,137 @@
+# stub_openai.py
+"""
+Local stand-in for the OpenAI Chat Completions API, with injected latency and errors.
+
+    python stub_openai.py --port 9000 --latency 0.3 --jitter 0.2 --slow-rate 0.05 --slow-latency 4 \
+        --error-rate 0.05 --rate-limit-rate 0.02
+    LLM_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=stub uvicorn main:app --port 8000
+    python loadtest.py --url http://127.0.0.1:8000 --patients 50
+
+Answers come from fake_llm.FakeChatModel (tool calls, json_schema structured
+output and streaming included), so the whole graph runs against it. GET /stats
+shows requests, injected failures and how many TCP connections clients opened,
+which is how connection reuse from the shared pool can be checked.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.messages import convert_to_messages
+
+from fake_llm import FakeChatModel
+
+app = FastAPI(title="OpenAI stub")
+model = FakeChatModel()
+options = argparse.Namespace(latency=0.3, jitter=0.0, slow_rate=0.0, slow_latency=5.0, error_rate=0.0, rate_limit_rate=0.0)
+stats = Counter()
+connections = set()
+
+def reply_for(body: dict):
+    messages = convert_to_messages(body["messages"])
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]
+        args = model._structured_args(schema["name"], schema.get("schema", {}), messages)
+        reply = model._respond(messages, None, None)
+        reply.content, reply.tool_calls = json.dumps(args, ensure_ascii=False), []
+    else:
+        reply = model._respond(messages, body.get("tools"), body.get("tool_choice"))
+    usage = model._usage(messages, body.get("tools"), reply)
+    return reply, {
+        "prompt_tokens": usage["input_tokens"],
+        "completion_tokens": usage["output_tokens"],
+        "total_tokens": usage["total_tokens"],
+        "prompt_tokens_details": {"cached_tokens": usage["input_token_details"]["cache_read"]},
+    }
+
+def openai_tool_calls(reply) -> list:
+    return [
+        {"index": i, "id": call["id"], "type": "function",
+         "function": {"name": call["name"], "arguments": json.dumps(call["args"], ensure_ascii=False)}}
+        for i, call in enumerate(reply.tool_calls)
+    ]
+
+def completion(body: dict, reply, usage: dict) -> dict:
+    message = {"role": "assistant", "content": reply.content or None}
+    if reply.tool_calls:
+        message["tool_calls"] = [{k: v for k, v in c.items() if k != "index"} for c in openai_tool_calls(reply)]
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if reply.tool_calls else "stop"}],
+        "usage": usage,
+    }
+
+async def stream_chunks(body: dict, reply, usage: dict):
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "stub")}
+
+    def frame(delta: dict, finish=None, **extra) -> str:
+        return "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}, ensure_ascii=False) + "\n\n"
+
+    yield frame({"role": "assistant", "content": ""})
+    if reply.tool_calls:
+        yield frame({"tool_calls": openai_tool_calls(reply)})
+    else:
+        for chunk in model._chunks(reply):
+            await asyncio.sleep(model.chunk_delay)
+            yield frame({"content": chunk.content})
+    yield frame({}, "tool_calls" if reply.tool_calls else "stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield "data: " + json.dumps({**base, "choices": [], "usage": usage}) + "\n\n"
+    yield "data: [DONE]\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    stats["requests"] += 1
+    connections.add((request.client.host, request.client.port) if request.client else None)
+    delay = options.latency + random.uniform(0, options.jitter)
+    if random.random() < options.slow_rate:
+        stats["slow"] += 1
+        delay += options.slow_latency
+    await asyncio.sleep(delay)
+
+    roll = random.random()
+    if roll < options.error_rate:
+        stats["errors_500"] += 1
+        return JSONResponse({"error": {"message": "injected server error", "type": "server_error"}}, status_code=500)
+    if roll < options.error_rate + options.rate_limit_rate:
+        stats["errors_429"] += 1
+        return JSONResponse({"error": {"message": "injected rate limit", "type": "rate_limit"}}, status_code=429, headers={"retry-after": "0.2"})
+
+    body = await request.json()
+    reply, usage = reply_for(body)
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(body, reply, usage), media_type="text/event-stream")
+    return completion(body, reply, usage)
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "connections": len(connections)}
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI Chat Completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random delay (seconds)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests that are slow (tail)")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="extra seconds for slow requests")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with HTTP 429")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="seconds between streamed chunks")
+    args = parser.parse_args()
+    vars(options).update({k: v for k, v in vars(args).items() if k in vars(options)})
+    model.chunk_delay = args.chunk_delay
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
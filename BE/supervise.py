@@ -1,51 +1,100 @@
 # supervise.py
-from typing import Literal
+import threading
+from typing import Dict, List, Literal
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from llm_config import llm
+from langchain_core.runnables import Runnable
+from llm_config import hedged, structured
+import settings
 
 # --- Models ---
 
+AgentName = Literal[
+    "MedicationAgent", 
+    "ExerciseAgent", 
+    "DietAgent", 
+    "TransportAgent", 
+    "AppointmentAgent", 
+    "GeneralChatAgent"
+]
+
+# ต่ำกว่า settings.LLM_ESCALATE_BELOW -> ถามซ้ำที่ model ใหญ่ (llm_config.structured)
+CONFIDENCE_HINT = "How sure you are, from 0 to 1. Use below 0.6 when the message is ambiguous."
+
 class TopicClassifier(BaseModel):
     decision: Literal["on_topic", "off_topic"] = Field(
         ...,
         description="Return 'on_topic' if relevant to the disease OR if it is a greeting/general chat. Return 'off_topic' only for totally unrelated diseases (e.g. Cancer, HIV when user has Diabetes)."
     )
+    confidence: float = Field(1.0, description=CONFIDENCE_HINT)
 
 class Router(BaseModel):
     reasoning: str = Field(
         ...,
         description="Analyze the conversation history. What has been answered? What is still pending? explain why you choose the next agent."
     )
-    next: Literal[
-        "MedicationAgent", 
-        "ExerciseAgent", 
-        "DietAgent", 
-        "TransportAgent", 
-        "AppointmentAgent", 
-        "GeneralChatAgent", 
-        "FINISH"
-    ]
+    next: Literal[AgentName, Literal["FINISH"]]
+    plan: List[AgentName] = Field(
+        default_factory=list,
+        description="ALL agents needed to fully answer the user's latest message, in order, including the ones already answered and `next`."
+    )
+    confidence: float = Field(1.0, description=CONFIDENCE_HINT)
+
+class FanOutRouter(BaseModel):
+    reasoning: str = Field(
+        ...,
+        description="List every distinct question in the user's latest message and which agent answers each."
+    )
+    agents: List[AgentName] = Field(
+        ...,
+        description="All agents needed to answer the latest message, in the order the questions were asked. Empty if nothing needs answering."
+    )
+    confidence: float = Field(1.0, description=CONFIDENCE_HINT)
+
+# Fast mode: ตอบแค่ label (ไม่มี reasoning/confidence) output สั้นกว่ามาก, escalate เฉพาะตอน parse ไม่ได้
+class FastRouter(BaseModel):
+    next: Literal[AgentName, Literal["FINISH"]]
+    plan: List[AgentName] = Field(
+        ...,
+        description="ALL agents the user's latest message needs, in order, including answered ones and `next`."
+    )
+
+class FastFanOutRouter(BaseModel):
+    agents: List[AgentName] = Field(
+        ...,
+        description="All agents needed for the latest message, in question order. Empty if nothing needs answering."
+    )
+
+# ROUTER_MODE -> (schema ของ supervisor, schema ของ fan-out supervisor)
+ROUTER_SCHEMAS = {
+    "fast": (FastRouter, FastFanOutRouter),
+    "reasoning": (Router, FanOutRouter),
+}
 
 # --- Chains ---
 
 # 1. Topic Check
+# ส่วนคงที่อยู่ก่อน, โรคของคนไข้อยู่ท้าย prompt (ให้ prefix เหมือนกันทุกคนไข้และ cache ได้)
 topic_prompt = (
-    "You are a medical context guardian. Patient has: **{allowed_disease}**.\n\n"
+    "You are a medical context guardian. The patient's disease is given at the end of this prompt.\n\n"
     "RULES:\n"
     "1. **Allow** Greetings, Small talk, Thank you -> 'on_topic'.\n"
-    "2. **Allow** Questions about Medication, Diet, Exercise, Travel related to **{allowed_disease}** -> 'on_topic'.\n"
+    "2. **Allow** Questions about Medication, Diet, Exercise, Travel related to the patient's disease -> 'on_topic'.\n"
     "3. **Allow** Questions about context, for example, current diseases, current appointment date -> 'on_topic'.\n"
     "4. **REJECT** Questions about OTHER diseases (e.g. Cancer, HIV) -> 'off_topic'.\n"
 )
 
-topic_check_chain = (
-    ChatPromptTemplate.from_messages([
-        ("system", topic_prompt),
-        MessagesPlaceholder("messages")
-    ])
-    | llm.with_structured_output(TopicClassifier)
-)
+topic_patient_prompt = "Patient has: **{allowed_disease}**."
+
+topic_check_template = ChatPromptTemplate.from_messages([
+    ("system", topic_prompt),
+    ("system", topic_patient_prompt),
+    MessagesPlaceholder("messages")
+])
+
+def topic_chain(tier: str = None):
+    return structured(topic_check_template, TopicClassifier, "topic", tier)
+
 
 # 2. Supervisor (Router)
 supervisor_prompt = (
@@ -64,21 +113,76 @@ supervisor_prompt = (
     "- **STEP 1**: Pick the first relevant agent.\n"
     "- **STEP 2**: Wait for that agent to respond (look at the history).\n"
     "- **STEP 3**: If there are still unanswered parts of the question, pick the NEXT relevant agent.\n"
-    "- **FINISH**: Select 'FINISH' ONLY when ALL parts of the user's input have been addressed.\n\n"
+    "- **FINISH**: Select 'FINISH' ONLY when ALL parts of the user's input have been addressed.\n"
+    "- **PLAN**: Always fill `plan` with EVERY agent the latest message needs (answered or not). "
+    "The turn ends automatically once all of them have answered.\n\n"
 
     "EXAMPLE:\n"
     "User: 'Change appointment to Monday and is it okay to eat Durian?'\n"
-    "Turn 1: Select 'AppointmentAgent' (Reasoning: I need to handle the appointment change first.)\n"
+    "Turn 1: Select 'AppointmentAgent', plan ['AppointmentAgent', 'DietAgent'] (Reasoning: I need to handle the appointment change first.)\n"
     "...AppointmentAgent responds...\n"
     "Turn 2: Select 'DietAgent' (Reasoning: Appointment is done, but the user also asked about eating Durian.)\n"
     "...DietAgent responds...\n"
-    "Turn 3: Select 'FINISH' (Reasoning: Both appointment and diet questions have been answered.)\n"
+    "Turn 3: Not needed - both planned agents have answered, so the turn ends without asking you again.\n"
 )
 
-supervisor_chain = (
-    ChatPromptTemplate.from_messages([
-        ("system", supervisor_prompt), 
-        MessagesPlaceholder("messages")
-    ])
-    | llm.with_structured_output(Router)
-)
\ No newline at end of file
+supervisor_template = ChatPromptTemplate.from_messages([
+    ("system", supervisor_prompt), 
+    MessagesPlaceholder("messages")
+])
+
+def router_chain(tier: str = None, mode: str = None):
+    return structured(supervisor_template, ROUTER_SCHEMAS[mode or settings.ROUTER_MODE][0], "supervisor", tier)
+
+# 3. Fan-out Supervisor (เลือกหลาย agent พร้อมกันในรอบเดียว)
+fanout_supervisor_prompt = (
+    "You are a router. Pick EVERY agent needed to fully answer the user's LATEST message.\n"
+    "Current Agents:\n"
+    "1. **MedicationAgent**: Drugs, dosage, side effects.\n"
+    "2. **ExerciseAgent**: Workout, physical activity, tiredness.\n"
+    "3. **DietAgent**: Food, hunger, menu, eating.\n"
+    "4. **TransportAgent**: Travel, driving, flying, carrying items.\n"
+    "5. **AppointmentAgent**: Scheduling, seeing doctor, postpone, change date.\n"
+    "6. **GeneralChatAgent**: Greetings, emotions, small talk.\n\n"
+
+    "ROUTING LOGIC (IMPORTANT):\n"
+    "- The selected agents run IN PARALLEL and each answers only its own part.\n"
+    "- Use the conversation history only to understand the latest message.\n"
+    "- Select each agent at most once, in the order the questions were asked.\n"
+    "- Return an empty list only if the latest message needs no answer.\n\n"
+
+    "EXAMPLE:\n"
+    "User: 'Change appointment to Monday and is it okay to eat Durian?'\n"
+    "agents: ['AppointmentAgent', 'DietAgent']\n"
+)
+
+fanout_supervisor_template = ChatPromptTemplate.from_messages([
+    ("system", fanout_supervisor_prompt), 
+    MessagesPlaceholder("messages")
+])
+
+def fanout_router_chain(tier: str = None, mode: str = None):
+    return structured(fanout_supervisor_template, ROUTER_SCHEMAS[mode or settings.ROUTER_MODE][1], "supervisor", tier)
+
+# --- Lazy Chains ---
+# สร้างตอนถูกใช้ครั้งแรก (import module นี้ไม่สร้าง LLM client/ไม่ import openai), warmup.py สร้างล่วงหน้าได้
+CHAINS = {
+    "topic_check_chain": lambda: hedged(topic_chain(), "topic_check"),
+    "supervisor_chain": lambda: hedged(router_chain(), "supervisor"),
+    "fanout_supervisor_chain": lambda: hedged(fanout_router_chain(), "fanout_supervisor"),
+}
+_chains: Dict[str, Runnable] = {}
+_lock = threading.Lock()
+
+def get_chain(name: str) -> Runnable:
+    if name not in _chains:
+        with _lock:
+            if name not in _chains:
+                _chains[name] = CHAINS[name]()
+    return _chains[name]
+
+def __getattr__(name: str):
+    # `from supervise import supervisor_chain` / supervise.supervisor_chain ยังใช้ได้เหมือนเดิม
+    if name in CHAINS:
+        return get_chain(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
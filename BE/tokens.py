@@ -0,0 +1,56 @@
+# tokens.py
+"""
+Token counting with the gpt-4o tokenizer (tiktoken o200k_base), which is accurate
+for Thai. Falls back to a conservative per-character estimate when the BPE file
+is not cached and cannot be downloaded.
+"""
+import json
+import logging
+import math
+from functools import lru_cache
+from typing import List
+
+from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+ENCODING = "o200k_base"  # tokenizer ของ gpt-4o
+MESSAGE_OVERHEAD = 4     # role + ตัวคั่นต่อข้อความ (ตาม chat format ของ OpenAI)
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING)
+    except Exception as exc:
+        # ไม่มีไฟล์ BPE ใน cache และโหลดจากเน็ตไม่ได้ -> ใช้ค่าประมาณแทน
+        logger.warning("tiktoken %s unavailable (%s), using estimated token counts", ENCODING, exc)
+        return None
+
+def _estimate(text: str) -> int:
+    """ประมาณแบบเผื่อไว้: อักษรไทย/non-ASCII ~2 ตัวต่อ token, ASCII ~4 ตัวต่อ token"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil(non_ascii / 2 + (len(text) - non_ascii) / 4)
+
+def count_text(text: str) -> int:
+    if not text:
+        return 0
+    enc = _encoding()
+    if enc is None:
+        return _estimate(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+def content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    # multimodal content: นับเฉพาะส่วนที่เป็นข้อความ
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+def count_message(message: BaseMessage) -> int:
+    tokens = MESSAGE_OVERHEAD + count_text(content_text(message.content))
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += count_text(call["name"]) + count_text(json.dumps(call["args"], ensure_ascii=False))
+    return tokens
+
+def count_tokens(messages: List[BaseMessage]) -> int:
+    return sum(count_message(m) for m in messages)
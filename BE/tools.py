@@ -1,188 +1,23 @@
 # tools.py
 from langchain_core.tools import tool
 
-# --- Medication Tools ---
-@tool
-def get_diabetes_medication(query: str) -> str:
-    """Use ONLY for Diabetes (เบาหวาน) medication details."""
-    return """
-    ข้อมูลยาเบาหวาน (Diabetes Meds):
-    1. **ยาเม็ดสีขาว (Metformin)**: ทานหลังอาหารทันที (เช้า-เย็น) ช่วยลดน้ำตาล
-    2. **ยาเม็ดเล็กสีขาว/เหลือง (Glipizide)**: *สำคัญ* ทานก่อนอาหาร 30 นาที (เช้า) กระตุ้นอินซูลิน
-    3. **อินซูลิน**: ยาฉีดตามเวลาแพทย์สั่ง
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับอาหาร (Diet)**: สำหรับยา Glipizide และอินซูลิน **"ห้ามงดมื้ออาหารเด็ดขาด"** ต้องกินตามเวลาใน Diet Tools ข้อ 4 มิฉะนั้นจะเกิดภาวะน้ำตาลตก (Hypoglycemia)
-    - **กับการออกกำลังกาย (Exercise)**: หากทานยา Glipizide หรือฉีดอินซูลิน ควรเช็กน้ำตาลก่อนออกกำลังกายเสมอ เพราะยามีฤทธิ์ทำให้น้ำตาลต่ำได้ง่ายกว่าปกติ
-    - **กับการเดินทาง (Transport)**: อินซูลินต้องระวังอุณหภูมิ (ห้ามโหลดใต้เครื่อง) ตาม Transport Tools
-    """
-
-@tool
-def get_bp_medication(query: str) -> str:
-    """Use ONLY for High Blood Pressure (ความดันสูง) medication details."""
-    return """
-    ข้อมูลยาความดัน (Hypertension Meds):
-    1. **ยาเม็ดสีขาว/เหลือง (Amlodipine)**: ยาขยายหลอดเลือด ระวังอาการวูบ/หน้ามืดเมื่อลุกเร็ว (Postural Hypotension)
-    2. **ยาเม็ดสีชมพู (Enalapril)**: ยาลดความดัน อาจมีอาการไอแห้งๆ ในบางราย
-    3. **ยาเม็ดเล็กสีส้ม (HCTZ)**: ยาขับปัสสาวะ ควรทานช่วงเช้า เพื่อไม่ให้ปวดปัสสาวะรบกวนการนอนตอนกลางคืน
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับอาหาร (Diet)**: ยาจะคุมความดันไม่อยู่หากยังทานเค็ม (Sodium) สูง เพราะเกลือต้านฤทธิ์ยา
-    - **กับการออกกำลังกาย (Exercise)**: ยาบางตัวทำให้หัวใจเต้นช้าลง (Beta-blocker) เวลาออกกำลังกายอาจเหนื่อยง่ายกว่าปกติ
-    - **กับการเดินทาง (Transport)**: ควรพกยาติดตัวตลอดเวลา หากขาดยาความดันอาจดีดสูงกะทันหัน (Rebound Hypertension)
-    """
-
-@tool
-def get_hyperlipidemia_medication(query: str) -> str:
-    """Use ONLY for Hyperlipidemia (ไขมันในเลือดสูง) medication details."""
-    return """
-    ข้อมูลยาไขมัน (Hyperlipidemia Meds):
-    1. **กลุ่มสแตติน (Statins)**: (เช่น Simvastatin, Atorvastatin) มักทานก่อนนอน เพราะตับสร้างคอเลสเตอรอลสูงสุดตอนกลางคืน อาจมีผลข้างเคียงคือปวดเมื่อยกล้ามเนื้อ
-    2. **กลุ่มไฟเบรต (Fibrates)**: (เช่น Gemfibrozil) ช่วยลดไตรกลีเซอไรด์
-    3. **กลุ่มยับยั้งการดูดซึม (Ezetimibe)**: มักใช้เสริมเมื่อยาหลักเอาไม่อยู่
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับอาหาร (Diet)**: ยาช่วยลดไขมันได้แค่ส่วนหนึ่ง หากยังกินของทอด/กะทิหนักๆ ยาอาจเอาไม่อยู่ (ไขมันสู้ยา)
-    - **กับการออกกำลังกาย (Exercise)**: หากทานยากลุ่ม Statins แล้วมีอาการปวดกล้ามเนื้อผิดปกติ ให้แยกให้ออกว่าปวดจากการออกกำลังกายหรือแพ้ยา หากพักแล้วไม่หายควรปรึกษาแพทย์
-    - **กับตับ**: ยาบางตัวมีผลต่อตับ ควรเลี่ยงแอลกอฮอล์เพื่อไม่ให้ตับทำงานหนักซ้ำซ้อน
-    """
+from diseases import DISEASES
+from knowledge import DOMAINS, current, retrieve
 
-# --- Exercise Tools ---
-@tool
-def get_diabetes_exercise(query: str) -> str:
-    """Use ONLY for Diabetes (เบาหวาน) exercise."""
-    return """
-    การออกกำลังกายเบาหวาน (Diabetes Exercise):
-    1. **ประเภท**: แอโรบิก 30 นาที/วัน + เวทเทรนนิ่งเบาๆ
-    2. **ข้อควรระวังพิเศษ**:
-       - ห้ามเดินเท้าเปล่า (ระวังแผล)
-       - เช็กน้ำตาล: ถ้าต่ำกว่า 100 mg/dL ให้งด หรือหาอะไรทานก่อน
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับยา (Meds)**: หากใช้ยาที่กระตุ้นอินซูลิน (Glipizide/Insulin) การออกกำลังกายหนักอาจทำให้น้ำตาลตกวูบได้ ต้องพกน้ำหวานติดตัวเสมอ
-    - **กับอาหาร (Diet)**: หากวางแผนจะออกกำลังกายหนัก ควรทานคาร์โบไฮเดรตเชิงซ้อน (ข้าวไม่ขัดสี) ในมื้อก่อนหน้าให้อิ่มพอดี เพื่อเป็นพลังงานสะสม
-    - **กับเท้า**: สัมพันธ์กับการเดินทาง (Transport) คือต้องเลือกรองเท้าที่เหมาะสมทั้งตอนออกกำลังกายและตอนนั่งรถนานๆ
-    """
+# --- Knowledge Tools ---
+# หนึ่ง tool ต่อ (โรค, domain) เช่น get_diabetes_medication ข้อมูลอยู่ใน knowledge/<disease>.md
+def knowledge_tool(disease: str, domain: str):
+    label = current().labels.get(disease, disease)
 
-@tool
-def get_bp_exercise(query: str) -> str:
-    """Use ONLY for High Blood Pressure (ความดันสูง) exercise."""
-    return """
-    การออกกำลังกายความดัน (Hypertension Exercise):
-    1. **ประเภท**: เน้น Cardio เบาๆ (เดินเร็ว, ว่ายน้ำ, ปั่นจักรยาน) เพื่อขยายหลอดเลือด
-    2. **ข้อห้าม**: ห้ามกลั้นหายใจขณะออกแรง (Valsalva maneuver) และเลี่ยงการยกน้ำหนักหนักๆ เพราะจะทำให้ความดันพุ่งสูงทันที
-    3. **Cool down**: สำคัญมาก ต้องค่อยๆ หยุด เพื่อป้องกันเลือดตกค้างที่ขาจนหน้ามืด
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับยา (Meds)**: หากทานยาขยายหลอดเลือด หลังออกกำลังกายเสร็จใหนั่งพักสักครู่ อย่าเพิ่งรีบยืนหรือเดิน
-    - **กับอาหาร (Diet)**: ดื่มน้ำเปล่าให้เพียงพอ การขาดน้ำทำให้เลือดข้นและความดันแปรปรวนได้
-    - **กับอาการ**: หากเวียนหัวหรือหน้ามืด ให้หยุดทันที
-    """
+    @tool(f"get_{disease}_{domain}", description=f"Use ONLY for {label} {DOMAINS[domain]}.")
+    def lookup(query: str) -> str:
+        """คืนเฉพาะหัวข้อที่เกี่ยวกับ query"""
+        return retrieve(disease, domain, query)
 
-@tool
-def get_hyperlipidemia_exercise(query: str) -> str:
-    """Use ONLY for Hyperlipidemia (ไขมันในเลือดสูง) exercise."""
-    return """
-    การออกกำลังกายไขมัน (Hyperlipidemia Exercise):
-    1. **เป้าหมาย**: เพิ่มไขมันดี (HDL) และลดไตรกลีเซอไรด์
-    2. **ประเภท**: เน้น Aerobic ต่อเนื่องนานๆ (30-45 นาทีขึ้นไป) เช่น วิ่งเหยาะ, ว่ายน้ำ, ปั่นจักรยาน เพื่อดึงไขมันมาเผาผลาญ
-    3. **ความถี่**: อย่างน้อย 3-5 วัน/สัปดาห์
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับอาหาร (Diet)**: การออกกำลังกายอย่างเดียวลด LDL (ไขมันเลว) ได้น้อยมาก ต้องคุมอาหารควบคู่ถึงจะเห็นผล
-    - **กับยา (Meds)**: สังเกตอาการปวดกล้ามเนื้อ หากทานยาไขมันอยู่และปวดจนยกแขนขาไม่ขึ้น ให้หยุดพักและเช็กกับแพทย์
-    - **กับน้ำหนักตัว**: การลดน้ำหนัก 5-10% ช่วยให้ค่าไขมันดีขึ้นอย่างชัดเจน
-    """
-
-# --- Diet Tools ---
-@tool
-def get_diabetes_diet(query: str) -> str:
-    """Use ONLY for Diabetes (เบาหวาน) diet."""
-    return """
-    อาหารเบาหวาน (Diabetes Diet):
-    1. **สูตร 2:1:1**: ผัก 2 : ข้าว 1 : เนื้อ 1
-    2. **ผลไม้**: เลี่ยงผลไม้หวานจัด (ทุเรียน, ลำไย) ทานฝรั่ง/แก้วมังกรได้
-    3. **การกิน**: กินให้ตรงเวลา ห้ามอดมื้อกินมื้อ
+    return lookup
 
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับยา (Meds)**: อาหารคือตัวกันกระแทกของยาเบาหวาน หากกินข้าวน้อยกว่าปกติแต่กินยาเท่าเดิม เสี่ยงช็อกน้ำตาลต่ำ
-    - **กับการออกกำลังกาย (Exercise)**: หากวันไหนออกกำลังกายเยอะ อนุญาตให้เพิ่มผลไม้รสไม่หวาน 1 ส่วนหลังออกกำลังกายได้เพื่อชดเชยพลังงาน
-    - **กับการเดินทาง (Transport)**: อาหารว่าง/ลูกอม เป็นสิ่งที่ต้องพกติดกระเป๋าเดินทางเสมอ ไว้แก้ทางยาเมื่อรถติดหรือผิดเวลาอาหาร
-    """
-
-@tool
-def get_bp_diet(query: str) -> str:
-    """Use ONLY for High Blood Pressure (ความดันสูง) diet."""
-    return """
-    อาหารความดัน (Hypertension Diet - DASH Diet):
-    1. **ลดเค็ม (Low Sodium)**: จำกัดเกลือไม่เกิน 1 ช้อนชา/วัน (ระวังซอสปรุงรส, อาหารแปรรูป, บะหมี่กึ่งสำเร็จรูป)
-    2. **เพิ่มโปแทสเซียม**: ทานผักผลไม้ กล้วย ส้ม ช่วยขับโซเดียม
-    3. **ลดไขมัน**: เลี่ยงของทอด กะทิ เพื่อลดความเสี่ยงหลอดเลือดตีบซ้ำซ้อน
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับยา (Meds)**: อาหารเค็มคือศัตรูอันดับ 1 ของยาความดัน หากคุมอาหารดี อาจลดขนาดยาลงได้ตามแพทย์สั่ง
-    - **กับการเดินทาง (Transport)**: อาหารระหว่างเดินทาง/บนเครื่องบินมักมีโซเดียมสูง ให้เลือกเมนูคลีนหรือพกผลไม้ไปเอง
-    - **กับเครื่องดื่ม**: ลดคาเฟอีนและแอลกอฮอล์ เพราะทำให้ความดันสูงขึ้น
-    """
-
-@tool
-def get_hyperlipidemia_diet(query: str) -> str:
-    """Use ONLY for Hyperlipidemia (ไขมันในเลือดสูง) diet."""
-    return """
-    อาหารไขมัน (Hyperlipidemia Diet):
-    1. **ลดไขมันอิ่มตัว**: หนังไก่, หมูสามชั้น, กะทิ, เนย
-    2. **เลี่ยงไขมันทรานส์ (เด็ดขาด)**: ครีมเทียม, เบเกอรี่, ของทอดซ้ำ, มาการีน
-    3. **เพิ่มกากใย (Fiber)**: ข้าวกล้อง, ผัก, ผลไม้เปลือกหนา ช่วยดักจับไขมันในลำไส้ขับออกทางอุจจาระ
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับยา (Meds)**: ยาบางตัว (เช่น Statins บางชนิด) อาจตีกับน้ำเกรปฟรุต (Grapefruit) แต่สำหรับผลไม้ไทยทานได้ปกติ
-    - **กับการเดินทาง (Transport)**: อาหารตามปั๊มหรือบนรถมักเป็นของทอด/ขนมขบเคี้ยว ควรเตรียมถั่วอบจืดหรือผลไม้ไปทานเล่นแทน
-    - **กับเครื่องดื่ม**: เลี่ยงเครื่องดื่มที่มีครีมเทียม/วิปครีม เพราะคือไขมันทรานส์ตัวร้าย
-    """
-
-# --- Transport Tools ---
-@tool
-def get_diabetes_transport(query: str) -> str:
-    """Use ONLY for Diabetes (เบาหวาน) transport/travel."""
-    return """
-    การเดินทางเบาหวาน (Diabetes Travel):
-    1. **การพกยา**: อินซูลินห้ามโหลดใต้เครื่อง (จะแข็ง/ยาเสื่อม)
-    2. **เอกสาร**: พกใบรับรองแพทย์ (Medical ID)
-    3. **ระหว่างเดินทาง**: พกน้ำหวาน/ลูกอม ติดตัวเสมอ
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับยา (Meds)**: การเดินทางข้าม Time Zone อาจต้องปรึกษาแพทย์เพื่อปรับเวลาการฉีดอินซูลิน/กินยาใหม่
-    - **กับอาหาร (Diet)**: หากเดินทางแล้วหาอาหารสุขภาพ (2:1:1) ยาก ให้เน้น "ลดข้าว-งดน้ำหวาน" ไว้ก่อนเพื่อความปลอดภัย
-    - **กับการออกกำลังกาย (Exercise)**: หากนั่งเครื่องบิน/รถนานเกิน 2 ชม. ให้ขยับขาบริหารเท้า (เหมือนท่ากายบริหารเบาๆ) เพื่อเลือดไหลเวียน ลดความเสี่ยงแผลที่เท้า
-    """
-
-@tool
-def get_bp_transport(query: str) -> str:
-    """Use ONLY for High Blood Pressure (ความดันสูง) transport/travel."""
-    return """
-    การเดินทางความดัน (Hypertension Travel):
-    1. **เตรียมตัว**: พกเครื่องวัดความดันไปด้วยหากเดินทางไกลหลายวัน
-    2. **การนั่ง**: อย่านั่งไขว่ห้างนาน เลี่ยงเสื้อผ้าที่รัดแน่นเกินไป
-    3. **ความเครียด**: เผื่อเวลาเดินทาง ป้องกันความเครียดที่ทำให้ความดันพุ่ง
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับยา (Meds)**: ตั้งนาฬิกาปลุกเตือนกินยาตามเวลาไทย หรือปรับตามคำแนะนำแพทย์หากข้าม Time Zone
-    - **กับการออกกำลังกาย (Exercise)**: ระหว่างนั่งรถ/เครื่องบินนานๆ ให้ขยับข้อเท้า (Ankle Pump) ป้องกันลิ่มเลือดอุดตัน (DVT)
-    - **กับอาหาร (Diet)**: พกน้ำเปล่าจิบตลอดทาง เลี่ยงขนมขบเคี้ยวที่มีเกลือสูง
-    """
-    
-@tool
-def get_hyperlipidemia_transport(query: str) -> str:
-    """Use ONLY for Hyperlipidemia (ไขมันในเลือดสูง) transport/travel."""
-    return """
-    การเดินทางไขมัน (Hyperlipidemia Travel):
-    1. **ความเสี่ยง**: ผู้มีไขมันสูงมีความเสี่ยงเรื่องหลอดเลือดตีบ/ลิ่มเลือดอุดตันง่ายกว่าคนปกติหากนั่งนิ่งๆ นานเกินไป
-    2. **การปฏิบัติตัว**: ขยับขาบ่อยๆ ดื่มน้ำให้เพียงพอเพื่อให้เลือดไม่ข้นหนืด
-
-    **ความเชื่อมโยงกับเรื่องอื่น (Cross-References)**:
-    - **กับอาหาร (Diet)**: ระหว่างเดินทาง เลือกหาร้านอาหารตามสั่ง (สั่งไม่ใส่น้ำมัน/ต้ม/นึ่ง) ดีกว่ากินฟาสต์ฟู้ดหรือของทอดข้างทาง
-    - **กับยา (Meds)**: อย่าลืมพกยา ยาไขมันขาด 1-2 วันอาจไม่ส่งผลฉับพลันเหมือนยาความดัน/เบาหวาน แต่ควรทานให้ต่อเนื่องเพื่อระดับยาที่คงที่
-    """
+def domain_tools(domain: str):
+    return [knowledge_tool(disease, domain) for disease in DISEASES]
 
 # --- Appointment Tools ---
 @tool
@@ -203,8 +38,8 @@ def reschedule_appointment(new_date: str) -> str:
     """
 
 # --- Bundles ---
-med_tools = [get_diabetes_medication, get_bp_medication, get_hyperlipidemia_medication]
-exercise_tools = [get_diabetes_exercise, get_bp_exercise, get_hyperlipidemia_exercise]
-diet_tools = [get_diabetes_diet, get_bp_diet, get_hyperlipidemia_diet]
-transport_tools = [get_diabetes_transport, get_bp_transport, get_hyperlipidemia_transport]
+med_tools = domain_tools("medication")
+exercise_tools = domain_tools("exercise")
+diet_tools = domain_tools("diet")
+transport_tools = domain_tools("transport")
 appointment_tools = [reschedule_appointment]
\ No newline at end of file
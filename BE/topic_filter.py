@@ -0,0 +1,79 @@
+# topic_filter.py
+"""
+Fast-path ก่อน topic_check_chain: ตัดสินเฉพาะกรณีที่มั่นใจด้วย lexicon (ไม่เรียก LLM)
+- ทักทาย / ขอบคุณ / รับทราบ ล้วนๆ                      -> on_topic
+- พูดถึงโรคของคนไข้เอง และไม่มีโรคอื่นที่ห้ามปน            -> on_topic
+- พูดถึงโรคที่ห้ามอย่างชัดเจน และไม่เกี่ยวกับโรคของคนไข้     -> off_topic
+กรณีอื่นคืน None ให้ LLM ตัดสินตามเดิม
+"""
+import re
+from typing import Optional
+
+import metrics
+from diseases import DISEASES, canonical_disease, mentions_disease, compile_terms
+
+SMALL_TALK = [
+    # ทักทาย
+    "สวัสดี", "หวัดดี", "ดีจ้า", "ดี", "hello", "hi", "hey", "good morning", "good afternoon", "good evening",
+    # ขอบคุณ
+    "ขอบคุณ", "ขอบใจ", "thank you", "thanks", "thank", "thx",
+    # รับทราบ
+    "โอเค", "ok", "okay", "ได้เลย", "รับทราบ", "เข้าใจแล้ว", "เรียบร้อย",
+    # คำลงท้าย/คำเรียก
+    "ครับผม", "ครับ", "คับ", "ค่ะ", "คะ", "ค่า", "จ้า", "จ้ะ", "นะ", "คุณหมอ", "หมอ", "มากๆ", "มาก", "เลย",
+]
+
+# โรคอื่นที่อยู่นอกขอบเขตแน่นอน (ไม่รวมตับ/การติดเชื้อ ซึ่งเป็น flag ความเสี่ยงของคนไข้ได้)
+OFF_TOPIC_DISEASES = [
+    "มะเร็ง", "cancer", "เนื้องอก", "tumor", "hiv", "เอชไอวี", "เอดส์", "aids",
+    "วัณโรค", "tuberculosis", "อัลไซเมอร์", "alzheimer", "พาร์กินสัน", "parkinson",
+    "สะเก็ดเงิน", "psoriasis", "ลมชัก", "epilepsy",
+]
+
+_SMALL_TALK = compile_terms(SMALL_TALK)
+_OFF_TOPIC = compile_terms(OFF_TOPIC_DISEASES)
+_NOISE = re.compile(r"[\s\W\d_]+")
+
+def _is_small_talk(text: str) -> bool:
+    if not _SMALL_TALK.search(text):
+        return False
+    rest = _SMALL_TALK.sub("", text)
+    rest = _NOISE.sub("", rest)
+    return rest == ""
+
+def _mentions_any_managed_disease(text: str) -> bool:
+    return any(mentions_disease(text, key) for key in DISEASES)
+
+def classify(text: str, disease: Optional[str]) -> Optional[str]:
+    """คืน 'on_topic' / 'off_topic' เมื่อมั่นใจ, None เมื่อต้องให้ LLM ตัดสิน"""
+    text = str(text).strip().lower()
+    if not text:
+        return None
+
+    if _is_small_talk(text):
+        return "on_topic"
+
+    off_topic = bool(_OFF_TOPIC.search(text))
+    key = canonical_disease(disease)
+
+    if key and mentions_disease(text, key):
+        return None if off_topic else "on_topic"
+
+    if off_topic and not _mentions_any_managed_disease(text):
+        return "off_topic"
+
+    return None
+
+def prefilter_topic(text: str, disease: Optional[str]) -> Optional[str]:
+    """classify() พร้อมนับ hit/miss สำหรับวัด hit rate"""
+    decision = classify(text, disease)
+    if decision is None:
+        metrics.inc("topic_fastpath_misses")
+    else:
+        metrics.inc("topic_fastpath_hits", decision=decision)
+    return decision
+
+def hit_rate() -> float:
+    hits = metrics.total("topic_fastpath_hits")
+    total = hits + metrics.total("topic_fastpath_misses")
+    return hits / total if total else 0.0
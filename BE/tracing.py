@@ -0,0 +1,147 @@
+# tracing.py
+"""
+Per-turn timing of graph nodes, LLM calls and supervisor hops.
+
+main.py attaches a new TurnTrace to every /chat run (next to usage.tracker). It
+records, as histograms in metrics.py (exported by GET /metrics):
+    node_seconds{node, graph}   every node of the main graph (graph="main") and of
+                                each agent subgraph (graph=<agent name>)
+    turn_seconds{outcome}       whole graph run (outcome="cancelled" when the client left)
+    turn_llm_calls / turn_supervisor_hops / turn_tokens{kind}   finished turns only
+    llm_calls_cancelled / llm_calls_saved   cancelled turns: LLM calls aborted in flight,
+                                and those plus the calls an average turn still had left
+
+With TRACE_LOG on, each turn is also logged as one JSON line (logger "trace")
+with thread_id, agents, totals and the node spans in start order. thread_id is
+only in the log, not a metric label, to keep the number of series bounded.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from agent import agent_specs
+from usage import node_label, usage_of
+import metrics
+import settings
+
+logger = logging.getLogger("trace")
+if settings.TRACE_LOG and not logger.handlers:
+    # uvicorn ตั้งค่าแค่ logger ของตัวเอง
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+def graph_of(metadata: Dict[str, Any]) -> str:
+    """"main" สำหรับ node ของ graph หลัก, ชื่อ agent สำหรับ node ใน agent subgraph"""
+    namespace = metadata.get("langgraph_checkpoint_ns") or ""
+    return namespace.split("|")[0].split(":")[0] if "|" in namespace else "main"
+
+def is_node_run(name: Optional[str], metadata: Dict[str, Any], tags: Optional[List[str]]) -> bool:
+    # run ของ node เองมีชื่อเดียวกับ langgraph_node และ tag graph:step:N (runnable ข้างในไม่มี)
+    return bool(name) and name == metadata.get("langgraph_node") and any(t.startswith("graph:step:") for t in tags or [])
+
+class TurnTrace(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.root: Optional[UUID] = None
+        self.started = time.perf_counter()
+        self.nodes: Dict[UUID, dict] = {}
+        self.spans: List[dict] = []
+        self.llm_calls = 0
+        self.llm_nodes: Dict[str, int] = {}
+        self.llm_running: set = set()
+        self.tokens = {"input": 0, "cached": 0, "output": 0}
+        self.hops = 0
+        self.agents: List[str] = []
+
+    # --- Graph / node runs ---
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: UUID = None,
+                       tags=None, metadata=None, name=None, **kwargs):
+        metadata = metadata or {}
+        if parent_run_id is None and self.root is None:
+            self.root, self.started = run_id, time.perf_counter()
+        elif is_node_run(name, metadata, tags):
+            now = time.perf_counter()
+            self.nodes[run_id] = {"node": name, "graph": graph_of(metadata), "start": now, "start_ms": now - self.started}
+
+    def _end_node(self, run_id: UUID, status: str):
+        span = self.nodes.pop(run_id, None)
+        if span is None:
+            return
+        seconds = time.perf_counter() - span.pop("start")
+        metrics.observe("node_seconds", seconds, node=span["node"], graph=span["graph"])
+        if status != "ok":
+            metrics.inc("node_errors", node=span["node"], graph=span["graph"])
+        if span["graph"] == "main":
+            if span["node"] == "supervisor":
+                self.hops += 1
+            elif span["node"] in agent_specs and span["node"] not in self.agents:
+                self.agents.append(span["node"])
+        span["start_ms"] = round(span["start_ms"] * 1000, 1)
+        self.spans.append({**span, "ms": round(seconds * 1000, 1), "status": status})
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        if run_id == self.root:
+            self.finish("ok")
+        else:
+            self._end_node(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs):
+        # client ตัดการเชื่อมต่อ/ถูก cancel ระหว่าง stream ก็มาทางนี้
+        if run_id == self.root:
+            self.finish("cancelled" if isinstance(error, asyncio.CancelledError) else type(error).__name__)
+        else:
+            self._end_node(run_id, "error")
+
+    # --- LLM calls ---
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs):
+        node = node_label(metadata or {})
+        self.llm_nodes[node] = self.llm_nodes.get(node, 0) + 1
+        self.llm_running.add(run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        usage = usage_of(response)
+        self.llm_running.discard(run_id)
+        self.llm_calls += 1
+        if usage:
+            self.tokens["input"] += usage.get("input_tokens", 0)
+            self.tokens["cached"] += (usage.get("input_token_details") or {}).get("cache_read") or 0
+            self.tokens["output"] += usage.get("output_tokens", 0)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self.llm_running.discard(run_id)
+
+    # --- Turn ---
+    def finish(self, outcome: str):
+        seconds = time.perf_counter() - self.started
+        metrics.observe("turn_seconds", seconds, outcome=outcome)
+        if outcome == "cancelled":
+            # call ที่ยังไม่ตอบตอนถูก cancel + call ที่ turn เฉลี่ยยังเหลือต้องเรียก (ประมาณ)
+            started = sum(self.llm_nodes.values())
+            remaining = max(0.0, metrics.mean("turn_llm_calls") - started)
+            metrics.inc("llm_calls_cancelled", len(self.llm_running))
+            metrics.inc("llm_calls_saved", len(self.llm_running) + remaining)
+        else:
+            metrics.observe("turn_llm_calls", self.llm_calls, buckets=metrics.COUNT_BUCKETS)
+            metrics.observe("turn_supervisor_hops", self.hops, buckets=metrics.COUNT_BUCKETS)
+            for kind, value in self.tokens.items():
+                metrics.observe("turn_tokens", value, buckets=metrics.TOKEN_BUCKETS, kind=kind)
+        if settings.TRACE_LOG:
+            logger.info(json.dumps({
+                "thread_id": self.thread_id,
+                "outcome": outcome,
+                "ms": round(seconds * 1000, 1),
+                "llm_calls": self.llm_calls,
+                "llm_calls_by_node": self.llm_nodes,
+                "tokens": self.tokens,
+                "supervisor_hops": self.hops,
+                "agents": self.agents,
+                "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+            }, ensure_ascii=False))
@@ -0,0 +1,76 @@
+# usage.py
+"""
+LLM token usage per graph node, including provider prompt-cache reads.
+
+Attach `tracker` as a run callback. For every chat model call it records input,
+cached (input_token_details.cache_read) and output tokens, plus latency split by
+whether the call hit the prompt-prefix cache, all as counters in metrics.py.
+"""
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+import metrics
+
+def node_label(metadata: Dict[str, Any]) -> str:
+    """ชื่อ node ใน graph หลัก, call ที่อยู่ใน agent subgraph ใช้ชื่อ agent แทน "agent" """
+    node = metadata.get("langgraph_node", "unknown")
+    namespace = metadata.get("langgraph_checkpoint_ns") or ""
+    if node == "agent" and "|" in namespace:
+        return namespace.split("|")[0].split(":")[0]
+    return node
+
+def usage_of(response: LLMResult) -> Optional[Dict[str, Any]]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage
+    return None
+
+class UsageTracker(BaseCallbackHandler):
+    run_inline = True  # แค่บวก counter ไม่ต้องส่งไป thread pool
+
+    def __init__(self):
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs):
+        self._runs[run_id] = (node_label(metadata or {}), time.perf_counter())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        node, start = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        usage = usage_of(response)
+        if not usage:
+            return
+        cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+        cache = "hit" if cached else "miss"
+        metrics.inc("llm_calls", node=node, cache=cache)
+        seconds = time.perf_counter() - start
+        metrics.inc("llm_seconds", seconds, node=node, cache=cache)
+        metrics.observe("llm_call_seconds", seconds, node=node)
+        metrics.inc("llm_input_tokens", usage.get("input_tokens", 0), node=node)
+        metrics.inc("llm_cached_tokens", cached, node=node)
+        metrics.inc("llm_output_tokens", usage.get("output_tokens", 0), node=node)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._runs.pop(run_id, None)
+
+tracker = UsageTracker()
+
+def report() -> Dict[str, Dict[str, float]]:
+    """สรุปต่อ node: สัดส่วน token ที่อ่านจาก cache และ latency เฉลี่ยเมื่อ hit/miss"""
+    nodes: Dict[str, Dict[str, float]] = {}
+    for name in ("llm_input_tokens", "llm_cached_tokens", "llm_output_tokens"):
+        for labels, value in metrics.series(name):
+            nodes.setdefault(labels["node"], {})[name[len("llm_"):]] = value
+    for labels, calls in metrics.series("llm_calls"):
+        row = nodes.setdefault(labels["node"], {})
+        seconds = metrics.total("llm_seconds", **labels)
+        row[f"calls_{labels['cache']}"] = calls
+        row[f"latency_{labels['cache']}"] = seconds / calls if calls else 0.0
+    for row in nodes.values():
+        row["cache_hit_rate"] = row.get("cached_tokens", 0) / row["input_tokens"] if row.get("input_tokens") else 0.0
+    return nodes
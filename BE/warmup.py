@@ -0,0 +1,88 @@
+# warmup.py
+"""
+Cold-start work, moved off the first patient request.
+
+Importing main only imports modules. The LLM clients, the routing and summary
+chains and the compiled agent variants are all built on first use. With WARMUP
+on, main.lifespan starts warm() in the background as soon as the server accepts
+connections. It runs these steps:
+    tokenizer   tiktoken BPE for history budgets (may need a download)
+    chains      topic/supervisor/summary chains (LLM clients, langchain_openai import)
+    agents      compiled variant of every agent for every known disease
+    pool        one request per LLM origin, so the shared pool already holds
+                TCP/TLS connections
+
+GET /readyz answers 503 until warm() is done. GET /healthz only reports that the
+process is up. A failed step is logged and recorded in status(), but the server
+still becomes ready: the same work is retried lazily on the first request.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+_status: Dict[str, Any] = {"ready": not settings.WARMUP, "steps": {}, "errors": {}}
+
+def _step(name: str, fn) -> None:
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception as exc:
+        _status["errors"][name] = f"{type(exc).__name__}: {exc}"
+        logger.warning("warmup step %s failed: %s", name, exc)
+    _status["steps"][name] = round(time.perf_counter() - start, 3)
+
+def _tokenizer():
+    from tokens import count_text
+    count_text("warmup")
+
+def _chains():
+    import history
+    import supervise
+    supervise.get_chain("topic_check_chain")
+    supervise.get_chain("fanout_supervisor_chain" if settings.ROUTER_FANOUT else "supervisor_chain")
+    history.summary_chain()
+
+def _agents():
+    from agent import agent_specs, get_agent
+    from diseases import DISEASES
+    for name in agent_specs:
+        for disease in [*DISEASES, None]:
+            get_agent(name, disease)
+
+def build() -> None:
+    """ส่วนที่เป็น CPU/IO แบบ sync (รันใน thread ไม่ให้บล็อก event loop)"""
+    _step("tokenizer", _tokenizer)
+    _step("chains", _chains)
+    _step("agents", _agents)
+
+async def open_pool() -> None:
+    """ส่ง request เบาๆ หนึ่งครั้งไปที่ LLM endpoint ให้ pool มี connection (TCP/TLS) พร้อมใช้"""
+    if settings.LLM_PROVIDER != "openai" or settings.LLM_CASSETTE:
+        return
+    from llm_config import http_clients
+    base_url = (settings.LLM_BASE_URL or "https://api.openai.com/v1").rstrip("/")
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"}
+    # สถานะของคำตอบไม่สำคัญ (401/404 ก็ได้ connection แล้ว)
+    await http_clients()[1].get(f"{base_url}/models", headers=headers, timeout=settings.LLM_CONNECT_TIMEOUT)
+
+async def warm() -> None:
+    start = time.perf_counter()
+    await asyncio.to_thread(build)
+    pool_start = time.perf_counter()
+    try:
+        await open_pool()
+    except Exception as exc:
+        _status["errors"]["pool"] = f"{type(exc).__name__}: {exc}"
+        logger.warning("warmup step pool failed: %s", exc)
+    _status["steps"]["pool"] = round(time.perf_counter() - pool_start, 3)
+    _status["seconds"] = round(time.perf_counter() - start, 3)
+    _status["ready"] = True
+
+def status() -> Dict[str, Any]:
+    return dict(_status)
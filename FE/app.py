@@ -1,13 +1,26 @@
 import streamlit as st
 import requests
+import time
 import uuid
 import json
 import os
+from requests.adapters import HTTPAdapter
 
 st.set_page_config(page_title="Medical AI", page_icon="🏥")
 
 # --- Configuration ---
-BACKEND_URL = os.getenv("API_URL", "http://127.0.0.1:8000") 
+BACKEND_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
+# แสดงเวลาได้ byte แรก / เวลารวมของแต่ละคำตอบใต้ข้อความ (ไว้ดู latency ตอนทดสอบ)
+SHOW_TIMING = os.getenv("SHOW_TIMING", "").strip().lower() in ("1", "true", "yes", "on")
+
+@st.cache_resource
+def http_session() -> requests.Session:
+    # ใช้ connection ซ้ำทุกข้อความและทุกผู้ใช้ของ process นี้ (ไม่ต้อง TCP/TLS handshake ใหม่ทุกครั้ง)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
@@ -16,13 +29,67 @@ params = st.query_params
 user_context = {
     "user_name": params.get("user_name", "คนไข้"),
     "disease": params.get("disease", "ไม่ทราบโรคที่เป็น"),
-    "current_schedule": params.get("current_schedule", "ยังไม่ได้นัดหมาย"), 
-    "is_alert": params.get("is_alert", "Negative"), 
+    "current_schedule": params.get("current_schedule", "ยังไม่ได้นัดหมาย"),
+    "is_alert": params.get("is_alert", "Negative"),
     "is_cardio": params.get("is_cardio", "Negative"),
     "is_gi_liver": params.get("is_gi_liver", "Negative"),
     "is_infectious": params.get("is_infectious", "Negative")
 }
 
+# --- SSE ---
+def iter_sse(response):
+    """
+    (event, data) ทีละ event ของ SSE
+    รองรับ frame ที่ถูกตัดกลาง chunk (รวมถึงตัวอักษรไทยที่ byte ถูกแบ่ง), data หลายบรรทัด, \\r\\n และ comment
+    """
+    buffer = b""
+    event, data = None, []
+    for chunk in response.iter_content(chunk_size=None):
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            line = raw.rstrip(b"\r").decode("utf-8")
+            if not line:
+                # บรรทัดว่าง = จบหนึ่ง event
+                if data:
+                    yield event or "message", "\n".join(data)
+                event, data = None, []
+                continue
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+
+def post_chat(prompt: str) -> requests.Response:
+    payload = {
+        "query": prompt,
+        "thread_id": st.session_state.session_id,
+        "stream_tokens": True
+    }
+    # ส่ง user_context แค่ครั้งแรก (หรือเมื่อเปลี่ยน) server จำไว้กับ thread_id
+    if st.session_state.get("registered_context") != user_context:
+        payload["user_context"] = user_context
+
+    api_endpoint = f"{BACKEND_URL}/chat"
+    r = http_session().post(api_endpoint, json=payload, stream=True, timeout=(5, 300))
+    if r.status_code == 409 and "user_context" not in payload:
+        # server ไม่มี session ของเรา (restart/คนละ worker) ส่ง context ไปใหม่
+        r.close()
+        payload["user_context"] = user_context
+        r = http_session().post(api_endpoint, json=payload, stream=True, timeout=(5, 300))
+    r.raise_for_status()
+    st.session_state.registered_context = user_context
+    return r
+
+def show_timing(timing: dict):
+    if SHOW_TIMING and timing and "ttfb" in timing:
+        st.caption(f"⏱️ first byte {timing['ttfb']:.2f}s · total {timing['total']:.2f}s")
+
 # Welcome Message
 if "messages" not in st.session_state:
     welcome = (
@@ -36,6 +103,7 @@ if "messages" not in st.session_state:
 for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
+        show_timing(msg.get("timing"))
 
 if prompt := st.chat_input("พิมพ์ข้อความ..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
@@ -43,33 +111,52 @@ if prompt := st.chat_input("พิมพ์ข้อความ..."):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        placeholder = st.empty()
-        full_res = ""
-        
+        # หนึ่ง turn อาจมีหลายคำตอบ (หลาย agent) แต่ละคำตอบมี placeholder ของตัวเอง
+        # คำตอบที่จบแล้วไม่ถูกวาดใหม่ ต่อท้ายเฉพาะ segment ที่กำลังพิมพ์
+        segments, placeholders = [], []
+        typing = False  # segment สุดท้ายยังรับ token อยู่
+        timing = {}
+        start = time.perf_counter()
+
         try:
-            payload = {
-                "query": prompt,
-                "user_context": user_context,
-                "thread_id": st.session_state.session_id
-            }
-
-            api_endpoint = f"{BACKEND_URL}/chat"
-            
-            with requests.post(api_endpoint, json=payload, stream=True) as r:
-                r.raise_for_status()
-                for line in r.iter_lines():
-                    if line:
-                        decoded = line.decode('utf-8')
-                        if decoded.startswith("data: "):
-                            json_str = decoded[6:]
-                            try:
-                                content = json.loads(json_str)
-                                full_res = content
-                                placeholder.markdown(full_res)
-                            except json.JSONDecodeError:
-                                pass
-            
-            st.session_state.messages.append({"role": "assistant", "content": full_res})
+            with post_chat(prompt) as r:
+                for event, data in iter_sse(r):
+                    # header ของ SSE มาทันที จึงนับ byte แรกที่ event แรกแทน
+                    timing.setdefault("ttfb", time.perf_counter() - start)
+                    try:
+                        content = json.loads(data)
+                    except json.JSONDecodeError:
+                        continue
+                    if not typing:
+                        segments.append("")
+                        placeholders.append(st.empty())
+                    if event == "delta":
+                        # Token ย่อย: ต่อท้าย segment ที่กำลังพิมพ์
+                        segments[-1] += content
+                        typing = True
+                        placeholders[-1].markdown(segments[-1] + "▌")
+                    else:
+                        # ข้อความสมบูรณ์: ปิด segment นี้ด้วยเนื้อหาฉบับเต็ม
+                        segments[-1] = content
+                        typing = False
+                        placeholders[-1].markdown(content)
+            timing["total"] = time.perf_counter() - start
+            show_timing(timing)
 
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                wait = e.response.headers.get("Retry-After")
+                st.warning(f"ขณะนี้มีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง{f'ใน {wait} วินาที' if wait else ''}ครับ")
+            else:
+                st.error(f"Error: {e}")
         except Exception as e:
-            st.error(f"Error: {e}")
\ No newline at end of file
+            st.error(f"Error: {e}")
+
+        if segments:
+            if typing:
+                placeholders[-1].markdown(segments[-1])
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": "\n\n".join(s for s in segments if s),
+                "timing": timing if "total" in timing else None,
+            })